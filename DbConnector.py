@@ -1,4 +1,94 @@
-from pymongo import MongoClient, version
+import threading
+
+from pymongo import MongoClient, monitoring, version
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # pymongo < 4.9 has no asyncio client
+    AsyncMongoClient = None
+
+# Client settings used unless overridden in DbConnector(...)
+DEFAULT_CLIENT_OPTIONS = {
+    "maxPoolSize": 50,
+    "minPoolSize": 0,
+    "compressors": "zlib",
+    "readPreference": "primary",
+    "serverSelectionTimeoutMS": 10000,
+    "connectTimeoutMS": 10000,
+    "socketTimeoutMS": None,
+    "w": None,
+}
+
+# One MongoClient per (uri, options) for the whole process, shared by every DbConnector
+_shared_clients = {}
+_shared_lock = threading.Lock()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events of a client (registered when the client is created).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = 0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, delta in changes.items():
+                setattr(self, name, getattr(self, name) + delta)
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_created(self, event):
+        self._count(created=1)
+
+    def connection_closed(self, event):
+        self._count(closed=1)
+
+    def connection_check_out_succeeded(self, event):
+        self._count(checked_out=1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._count(checked_in=1, in_use=-1)
+
+    def connection_check_out_failed(self, event):
+        self._count(checkout_failed=1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "created": self.created,
+                "closed": self.closed,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "checked_out": self.checked_out,
+                "checkout_failed": self.checkout_failed,
+            }
 
 
 class DbConnector:
@@ -10,28 +100,88 @@ class DbConnector:
     HOST = "tdt4225-00.idi.ntnu.no" // Your server IP address/domain name
     USER = "testuser" // This is the user you created and added privileges for
     PASSWORD = "test123" // The password you set for said user
+
+    A full URI can be given instead, e.g. URI = "mongodb://localhost:27017" for a local mongod
+
+    All connectors with the same URI and client options share one MongoClient (and its
+    connection pool). The client is created on first use of .client/.db and does not
+    connect until the first operation. Client options such as maxPoolSize, compressors,
+    readPreference, timeouts and w (write concern) can be passed as keyword arguments,
+    see DEFAULT_CLIENT_OPTIONS. shared=False gives the connector a client of its own.
     """
 
     def __init__(self,
                  DATABASE='movie_db',
                  HOST="tdt4225-66.idi.ntnu.no",
                  USER="test_user",
-                 PASSWORD="password"):
-        uri = "mongodb://%s:%s@%s/%s" % (USER, PASSWORD, HOST, DATABASE)
-        # Connect to the databases
-        try:
-            self.client = MongoClient(uri)
-            self.db = self.client[DATABASE]
-        except Exception as e:
-            print("ERROR: Failed to connect to db:", e)
-
-        # get database information
-        print("You are connected to the database:", self.db.name)
-        print("-----------------------------------------------\n")
+                 PASSWORD="password",
+                 URI=None,
+                 shared=True,
+                 **client_options):
+        self.uri = URI or "mongodb://%s:%s@%s/%s" % (USER, PASSWORD, HOST, DATABASE)
+        self.database = DATABASE
+        self.shared = shared
+        self.options = {**DEFAULT_CLIENT_OPTIONS, **client_options}
+        self._key = (self.uri, tuple(sorted(self.options.items(), key=lambda kv: kv[0])))
+        self._entry = None
+
+    def _acquire(self):
+        if self._entry is not None:
+            return self._entry
+
+        with _shared_lock:
+            entry = _shared_clients.get(self._key) if self.shared else None
+            if entry is None:
+                stats = PoolStats()
+                options = {k: v for k, v in self.options.items() if v is not None}
+                # connect=False: no connection until the first operation
+                client = MongoClient(self.uri, connect=False, event_listeners=[stats], **options)
+                entry = {"client": client, "stats": stats, "users": 0}
+                if self.shared:
+                    _shared_clients[self._key] = entry
+                print("You are connected to the database:", self.database)
+                print("-----------------------------------------------\n")
+            entry["users"] += 1
+            self._entry = entry
+        return entry
+
+    @property
+    def client(self):
+        return self._acquire()["client"]
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    def async_client(self, **client_options):
+        """
+        A new AsyncMongoClient (pymongo >= 4.9) with the URI and options of this connector.
+        It is bound to the event loop it is used on, so it is not shared, close it with
+        await client.close().
+        """
+        if AsyncMongoClient is None:
+            raise RuntimeError("pymongo %s has no AsyncMongoClient, it needs pymongo >= 4.9" % version)
+        options = {k: v for k, v in {**self.options, **client_options}.items() if v is not None}
+        return AsyncMongoClient(self.uri, connect=False, **options)
+
+    def pool_stats(self):
+        """Connection pool usage of the (shared) client"""
+        if self._entry is None:
+            return None
+        return self._entry["stats"].as_dict()
 
     def close_connection(self):
-        # close the cursor
-        # close the DB connection
-        self.client.close()
-        print("\n-----------------------------------------------")
-        print("Connection to %s-db is closed" % self.db.name)
+        # close the DB connection, a shared client is closed when its last connector closes
+        if self._entry is None:
+            return
+        with _shared_lock:
+            self._entry["users"] -= 1
+            last = self._entry["users"] <= 0
+            if last:
+                self._entry["client"].close()
+                if self.shared:
+                    _shared_clients.pop(self._key, None)
+        self._entry = None
+        if last:
+            print("\n-----------------------------------------------")
+            print("Connection to %s-db is closed" % self.database)
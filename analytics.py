@@ -0,0 +1,467 @@
+import math
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from clean import MoviePipeline, genre_names
+from coappearance import CoAppearanceCounter
+from frame_cache import FrameCache
+from ingest_state import source_fingerprints
+from queries import AMERICA
+
+# Answers the query tasks 1-10 from the cleaned DataFrames, without MongoDB.
+#
+# Cast/crew are exploded once into flat columns (one row per member with the tmdbId of
+# the movie), joins on tmdbId are pandas hash joins and the group-bys are pandas/numpy.
+# Results have the same shape as the Mongo versions in queries.py and query2.py.
+
+# Task -> print order of the fields (queries.py style), None prints whole documents (query2.py style)
+TASKS = {
+    "query1": ["director", "movie_count", "avg_vote", "median_revenue"],
+    "query3": ["actor", "genre_count", "movie_count", "examples_genre"],
+    "query5": ["decade", "primary_genre", "median_runtime", "movie_count"],
+    "query7": ["title", "year", "vote_average", "vote_count"],
+    "query9": ["original_language", "count", "example_title"],
+    "T2": None,
+    "T4": None,
+    "T6": None,
+    "T8": None,
+    "T10A": None,
+    "T10B": None,
+}
+
+# Fields that depend on the order documents are read in Mongo, not compared by check()
+ORDER_DEPENDENT_FIELDS = {"query9": {"example_title"}}
+
+# $text search for "noir": case-insensitive whole word, English stemming keeps "noirs" as "noir"
+NOIR = re.compile(r"\bnoirs?\b", re.IGNORECASE)
+
+
+def explode_members(df_credits, column, fields):
+    """
+    One row per cast/crew member with the tmdbId of the movie and the given fields,
+    as flat columns (the member lists are walked once, the tmdbIds are repeated with numpy).
+    """
+    lists = [v if isinstance(v, list) else [] for v in df_credits[column].tolist()]
+    lengths = np.fromiter((len(v) for v in lists), dtype=np.int64, count=len(lists))
+    members = [m for v in lists for m in v]
+    columns = {"tmdbId": np.repeat(df_credits["tmdbId"].to_numpy(dtype=np.int64), lengths)}
+    for f in fields:
+        columns[f] = [m.get(f) for m in members]
+    return pd.DataFrame(columns)
+
+
+def group_medians(codes, values, n_groups, method="discrete"):
+    """
+    Median of values per group code (0..n_groups-1), NaN values ignored (NaN for empty groups).
+    "discrete" returns the value at rank ceil(n/2) like clean.discrete_median,
+    "continuous" averages the two middle values for even n.
+    """
+    keep = ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    result = np.full(n_groups, np.nan)
+    if not len(codes):
+        return result
+
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    present = sizes > 0
+    starts, sizes = starts[present], sizes[present]
+    if method == "discrete":
+        medians = values[starts + (sizes + 1) // 2 - 1]
+    else:
+        medians = (values[starts + (sizes - 1) // 2] + values[starts + sizes // 2]) / 2
+    result[np.flatnonzero(present)] = medians
+    return result
+
+
+def _value(v):
+    # numpy/pandas scalars to plain Python values, like documents read from Mongo
+    if v is None or v is pd.NaT or v is pd.NA:
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+
+def records(df):
+    return [{k: _value(v) for k, v in row.items()} for row in df.to_dict("records")]
+
+
+def same_value(a, b, rel_tol=1e-9):
+    if isinstance(a, float) and math.isnan(a):
+        a = None
+    if isinstance(b, float) and math.isnan(b):
+        b = None
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return math.isclose(a, b, rel_tol=rel_tol, abs_tol=1e-9)
+    if isinstance(a, datetime) and isinstance(b, datetime):
+        return a.replace(tzinfo=None) == b.replace(tzinfo=None)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_value(x, y, rel_tol) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_value(a[k], b[k], rel_tol) for k in a)
+    return a == b
+
+
+def compare_results(expected, actual, ignore=(), rel_tol=1e-9):
+    """
+    Row by row differences between two task results, as (row, field, expected, actual).
+    Rows that tie on the sort key may come back in another order from Mongo.
+    """
+    diffs = []
+    if len(expected) != len(actual):
+        diffs.append((None, "rows", len(expected), len(actual)))
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if isinstance(e, dict) and isinstance(a, dict):
+            for k in e.keys() | a.keys():
+                if k not in ignore and not same_value(e.get(k), a.get(k), rel_tol):
+                    diffs.append((i, k, e.get(k), a.get(k)))
+        elif not same_value(e, a, rel_tol):
+            diffs.append((i, None, e, a))
+    return diffs
+
+
+class FrameAnalytics:
+    """
+    Runs the query tasks on the cleaned frames of MoviePipeline.
+
+    df_movies:  clean_movies merged with links (and keywords for query7)
+    df_credits: clean_credits
+    df_users:   build_user_stats (only needed for T10A/T10B)
+
+    Example:
+    fa = FrameAnalytics(df_movies, df_credits, df_users)
+    fa.run("T4")
+    """
+
+    def __init__(self, df_movies, df_credits, df_users=None):
+        self.df_movies = df_movies.reset_index(drop=True)
+        self.df_credits = df_credits.reset_index(drop=True)
+        self.df_users = df_users
+
+        # Movie columns used by the joins (every Movie row, like the People collection)
+        movies = pd.DataFrame({
+            "tmdbId": self.df_movies["tmdbId"].to_numpy(dtype=np.int64),
+            "revenue": self.df_movies["revenue"].to_numpy(dtype=np.float64),
+            "vote_average": pd.to_numeric(self.df_movies["vote_average"], errors="coerce").to_numpy(dtype=np.float64),
+            "vote_count": pd.to_numeric(self.df_movies["vote_count"], errors="coerce").to_numpy(dtype=np.float64),
+        })
+        movies["year"] = pd.to_datetime(self.df_movies["release_date"]).dt.year.to_numpy(dtype=np.float64)
+        self.movies = movies
+        # The movie summary embedded in Credits uses the first row per tmdbId
+        self.summary = movies.drop_duplicates(subset="tmdbId", keep="first")
+
+        # (tmdbId, genre code) pairs, codes in alphabetical order of the names
+        names = self.df_movies["genres"].map(genre_names)
+        lengths = names.map(len).to_numpy()
+        flat = [g for movie_names in names for g in movie_names]
+        codes, self.genre_list = pd.factorize(pd.Series(flat, dtype=object), sort=True)
+        self.movie_genres = pd.DataFrame({
+            "tmdbId": np.repeat(movies["tmdbId"].to_numpy(), lengths),
+            "genre": codes,
+        })
+        self.movie_genres = self.movie_genres[self.movie_genres["genre"] >= 0]
+
+        # One row per cast/crew member
+        self.cast = explode_members(self.df_credits, "cast", ["id", "name", "gender", "order"])
+        self.crew = explode_members(self.df_credits, "crew", ["id", "name", "job"])
+        for df in (self.cast, self.crew):
+            df.rename(columns={"id": "person_id"}, inplace=True)
+            df["person_id"] = pd.to_numeric(df["person_id"], errors="coerce")
+        self.cast_known = self.cast.dropna(subset=["person_id"]).astype({"person_id": "int64"})
+        self.crew_known = self.crew.dropna(subset=["person_id"]).astype({"person_id": "int64"})
+
+        # Person name: the first crew row, then the first cast row (like People)
+        self.person_names = (
+            pd.concat([self.crew_known[["person_id", "name"]], self.cast_known[["person_id", "name"]]])
+            .drop_duplicates(subset="person_id", keep="first")
+            .set_index("person_id")["name"]
+        )
+
+    def run(self, name):
+        return getattr(self, name.lower())()
+
+    def query1(self):
+        """Top 10 directors with greater than 5 movies by median revenue"""
+        directors = self.crew_known[self.crew_known["job"] == "Director"][["tmdbId", "person_id"]]
+        directors = directors.merge(self.movies, on="tmdbId", how="inner")
+        codes, people = pd.factorize(directors["person_id"])
+        stats = pd.DataFrame({
+            "person_id": people,
+            "movie_count": np.bincount(codes, minlength=len(people)),
+            "avg_vote": directors.groupby(codes)["vote_average"].mean().reindex(range(len(people))).to_numpy(),
+            "median_revenue": group_medians(codes, directors["revenue"].to_numpy(), len(people), "discrete"),
+        })
+        stats = stats[stats["movie_count"] > 5]
+        stats = stats.sort_values("median_revenue", ascending=False, kind="stable").head(10)
+        stats["director"] = self.person_names.reindex(stats["person_id"]).to_numpy()
+        stats["median_revenue"] = stats["median_revenue"].astype("int64")
+        return records(stats[["director", "movie_count", "avg_vote", "median_revenue"]])
+
+    def query3(self):
+        """Top 10 actors with more than 10 movies with widest genre batch"""
+        acted = self.cast_known[["person_id", "tmdbId"]].drop_duplicates()
+        # only movies that exist in Movie and have genres
+        with_genres = self.movie_genres["tmdbId"].unique()
+        acted = acted[acted["tmdbId"].isin(with_genres)]
+        movie_count = acted.groupby("person_id").size()
+
+        person_genres = acted.merge(self.movie_genres, on="tmdbId").drop_duplicates(subset=["person_id", "genre"])
+        person_genres = person_genres.sort_values(["person_id", "genre"], kind="stable")
+        genre_count = person_genres.groupby("person_id").size()
+
+        stats = pd.DataFrame({"movie_count": movie_count, "genre_count": genre_count}).reset_index()
+        stats = stats[stats["movie_count"] > 10]
+        stats = stats.sort_values(["genre_count", "movie_count"], ascending=False, kind="stable").head(10)
+
+        examples = person_genres[person_genres["person_id"].isin(stats["person_id"])].groupby("person_id")["genre"]
+        examples = examples.apply(lambda g: [self.genre_list[c] for c in g.to_numpy()[:5]])
+        stats["actor"] = self.person_names.reindex(stats["person_id"]).to_numpy()
+        stats["examples_genre"] = examples.reindex(stats["person_id"]).to_numpy()
+        return records(stats[["actor", "genre_count", "movie_count", "examples_genre"]])
+
+    def query5(self):
+        """By decade and primary genre (first element in genres), find median runtime and movie count"""
+        df = self.df_movies
+        dates = pd.to_datetime(df["release_date"])
+        genres = df["genres"].map(genre_names)
+        keep = df["runtime"].notna().to_numpy() & dates.notna().to_numpy() & (genres.map(len) > 0).to_numpy()
+
+        frame = pd.DataFrame({
+            "decade": (dates[keep].dt.year // 10 * 10).astype("int64").to_numpy(),
+            "primary_genre": genres[keep].map(lambda g: g[0]).to_numpy(),
+            "runtime": df["runtime"][keep].to_numpy(dtype=np.float64),
+        })
+        groups = frame.groupby(["decade", "primary_genre"], sort=False)
+        codes = groups.ngroup().to_numpy()
+        stats = groups.size().rename("movie_count").reset_index()
+        stats["median_runtime"] = group_medians(codes, frame["runtime"].to_numpy(), len(stats), "discrete")
+        stats = stats.sort_values(["decade", "median_runtime"], ascending=[True, False], kind="stable")
+        return records(stats[["decade", "primary_genre", "median_runtime", "movie_count"]])
+
+    def query7(self):
+        """Top 20 neo-noir or noir movies by vote_average (have to have more than 50 votes)"""
+        df = self.df_movies
+
+        def text(v):
+            if isinstance(v, list):
+                return " ".join(str(x) for x in v)
+            return v if isinstance(v, str) else ""
+
+        keywords = df["keywords"] if "keywords" in df else pd.Series([""] * len(df))
+        matches = np.fromiter(
+            (bool(NOIR.search(text(o)) or NOIR.search(text(t)) or NOIR.search(text(k)))
+             for o, t, k in zip(df["overview"], df["tagline"], keywords)),
+            dtype=bool, count=len(df),
+        )
+        hits = df[matches & (pd.to_numeric(df["vote_count"], errors="coerce") >= 50).to_numpy()]
+        hits = hits.sort_values(["vote_average", "vote_count"], ascending=False, kind="stable").head(20)
+        return records(pd.DataFrame({
+            "title": hits["title"].to_numpy(),
+            "year": pd.to_datetime(hits["release_date"]).dt.year.astype("Int64").to_numpy(),
+            "vote_average": hits["vote_average"].to_numpy(),
+            "vote_count": hits["vote_count"].to_numpy(),
+        }))
+
+    def query9(self):
+        """Top 10 original languages of non-English movies produced by an american company or in america"""
+        df = self.df_movies
+        america = set(AMERICA)
+        keep = np.fromiter(
+            (bool(america.intersection(codes)) for codes in df["countryCodes"]),
+            dtype=bool, count=len(df),
+        ) & (df["original_language"] != "en").to_numpy()
+        stats = (
+            df[keep].groupby("original_language", dropna=False, sort=False)
+            .agg(count=("title", "size"), example_title=("title", "first"))
+            .reset_index()
+        )
+        stats = stats.sort_values("count", ascending=False, kind="stable").head(10)
+        return records(stats[["original_language", "count", "example_title"]])
+
+    def t2(self, mode="two-pass"):
+        """Top 10 actor-pairs with most co-appearances"""
+        votes = dict(zip(self.summary["tmdbId"].tolist(), self.summary["vote_average"].tolist()))
+        docs = (
+            {"cast": [{"id": c.get("id"), "name": c.get("name")} for c in cast],
+             "vote": None if np.isnan(votes[tmdb_id]) else votes[tmdb_id]}
+            for tmdb_id, cast in zip(self.df_credits["tmdbId"].tolist(), self.df_credits["cast"])
+            if tmdb_id in votes and isinstance(cast, list) and len(cast) >= 2
+        )
+        return CoAppearanceCounter().add_cursor(docs).top_pairs(minimum=3, limit=10, mode=mode)
+
+    def t4(self):
+        """Top 10 collections with largest total revenue"""
+        df = self.df_movies
+        collections = df["belongs_to_collection"]
+        keep = collections.map(lambda d: isinstance(d, dict) and d.get("name") is not None).to_numpy()
+        frame = pd.DataFrame({
+            "collection_id": collections[keep].map(lambda d: d.get("id")).to_numpy(),
+            "collection_name": collections[keep].map(lambda d: d.get("name")).to_numpy(),
+            "revenue": df["revenue"][keep].fillna(0).to_numpy(),
+            "vote": pd.to_numeric(df["vote_average"][keep], errors="coerce").to_numpy(dtype=np.float64),
+            "date": pd.to_datetime(df["release_date"][keep]).to_numpy(),
+        })
+        groups = frame.groupby(["collection_id", "collection_name"], sort=False)
+        codes = groups.ngroup().to_numpy()
+        stats = groups.agg(
+            movie_count=("revenue", "size"),
+            total_revenue=("revenue", "sum"),
+            earliest_release_date=("date", "min"),
+            latest_release_date=("date", "max"),
+        ).reset_index()
+        stats["median_vote_average"] = group_medians(codes, frame["vote"].to_numpy(), len(stats), "continuous")
+        stats = stats[stats["movie_count"] >= 3]
+        stats = stats.sort_values("total_revenue", ascending=False, kind="stable").head(10)
+        return records(stats[["collection_id", "collection_name", "movie_count", "total_revenue",
+                              "median_vote_average", "earliest_release_date", "latest_release_date"]])
+
+    def t6(self):
+        """Decades ranked by largest proportion of female cast"""
+        cast = self.cast
+        order = pd.to_numeric(cast["order"], errors="coerce").fillna(999).to_numpy()
+        gender = pd.to_numeric(cast["gender"], errors="coerce").to_numpy()
+        top = order < 5
+        known = top & ((gender == 1) | (gender == 2))
+        per_movie = pd.DataFrame({
+            "tmdbId": cast["tmdbId"].to_numpy(),
+            "known": known.astype(np.int64),
+            "female": (known & (gender == 1)).astype(np.int64),
+        }).groupby("tmdbId", sort=False).sum()
+        per_movie = per_movie[per_movie["known"] > 0]
+        per_movie = per_movie.join(self.summary.set_index("tmdbId")["year"], how="inner").dropna(subset=["year"])
+
+        per_movie["femaleProp"] = per_movie["female"] / per_movie["known"]
+        per_movie["decade"] = (per_movie["year"] - per_movie["year"] % 10).astype("int64")
+        stats = per_movie.groupby("decade").agg(
+            avg_female_prop=("femaleProp", "mean"), movie_count=("femaleProp", "size")).reset_index()
+        # $round rounds half to even, like numpy
+        stats["avg_female_prop"] = np.round(stats["avg_female_prop"].to_numpy(), 2)
+        stats = stats.sort_values(["avg_female_prop", "decade"], ascending=[False, True], kind="stable")
+        return records(stats[["decade", "avg_female_prop", "movie_count"]])
+
+    def t8(self):
+        """Top 20 director-actor pairs with highest mean average votes"""
+        popular = self.movies[self.movies["vote_count"] >= 100][["tmdbId", "vote_average", "revenue"]]
+        directors = self.crew_known[self.crew_known["job"] == "Director"][["tmdbId", "person_id", "name"]]
+        actors = self.cast_known[["tmdbId", "person_id", "name"]]
+        pairs = (
+            directors.rename(columns={"person_id": "directorId", "name": "director"})
+            .merge(popular, on="tmdbId", how="inner")
+            .merge(actors.rename(columns={"person_id": "actorId", "name": "actor"}), on="tmdbId", how="inner")
+            .drop_duplicates(subset=["directorId", "director", "actorId", "actor", "tmdbId"])
+        )
+        stats = (
+            pairs.groupby(["directorId", "director", "actorId", "actor"], dropna=False, sort=False)
+            .agg(filmCount=("tmdbId", "size"), meanVote=("vote_average", "mean"), meanRevenue=("revenue", "mean"))
+            .reset_index()
+        )
+        stats = stats[stats["filmCount"] >= 3]
+        stats = stats.sort_values("meanVote", ascending=False, kind="stable").head(20)
+        stats["meanVote"] = np.round(stats["meanVote"].to_numpy(), 2)
+        stats["meanRevenue"] = np.round(stats["meanRevenue"].to_numpy(), 0)
+        return records(stats[["directorId", "director", "actorId", "actor", "filmCount", "meanVote", "meanRevenue"]])
+
+    def _top_users(self, by):
+        if self.df_users is None:
+            raise ValueError("df_users is needed for T10A/T10B")
+        users = self.df_users[self.df_users["ratingCount"] >= 20]
+        users = users.sort_values([by, "ratingCount", "userId"], ascending=[False, False, True], kind="stable")
+        return records(users.head(10)[["userId", "ratingCount", "ratingMean", "ratingVariance", "distinctGenres"]])
+
+    def t10a(self):
+        """Top 10 most genre-diverse users"""
+        return self._top_users("distinctGenres")
+
+    def t10b(self):
+        """Top 10 highest-variance users"""
+        return self._top_users("ratingVariance")
+
+
+def load_frames(program, fingerprints, need_users=True):
+    """The cleaned frames FrameAnalytics needs, read through the frame cache of program"""
+    df_movies = program.merge_movies_and_links(program.cleaned("movies", fingerprints),
+                                               program.cleaned("links", fingerprints))
+    df_credits = program.cleaned("credits", fingerprints)
+    df_users = None
+    if need_users:
+        df_users = program.build_user_stats(df_movies, program.cleaned("ratings", fingerprints))
+    df_movies = program.merge_keywords(df_movies, program.cleaned("keywords", fingerprints))
+    return df_movies, df_credits, df_users
+
+
+def mongo_results(names):
+    """The same tasks from MongoDB (queries.py and query2.py), used by check"""
+    from queries import QueryTasks
+    from query2 import QueryPipeline
+
+    q = QueryTasks()
+    qp = QueryPipeline(connection=q.connection)
+    results = {}
+    try:
+        for name in names:
+            if name.startswith("query"):
+                results[name] = getattr(q, name)()
+                continue
+            pipeline, collection_name = qp.task_pipeline(name)
+            cursor = qp.run_pipeline(pipeline, collection_name)
+            results[name] = qp.calculate_t2(cursor) if name == "T2" else list(cursor)
+    finally:
+        q.connection.close_connection()
+    return results
+
+
+def main(tasks=None, check=False, cache_dir=".frame_cache"):
+    """
+    Run the query tasks on the cleaned frames and print them like queries.py/query2.py.
+    check=True also runs them on MongoDB and prints any differences.
+    """
+    from queries import print_results
+
+    names = tasks or list(TASKS)
+    program = MoviePipeline(cache=FrameCache(cache_dir))
+    start = time.perf_counter()
+    frames = load_frames(program, source_fingerprints(), need_users=any(n.startswith("T10") for n in names))
+    print(f"Loaded frames in {time.perf_counter() - start:.2f}s")
+    fa = FrameAnalytics(*frames)
+
+    results = {}
+    for name in names:
+        start = time.perf_counter()
+        results[name] = fa.run(name)
+        seconds = time.perf_counter() - start
+        if TASKS[name] is not None:
+            print_results(results[name], order=TASKS[name], title=f"{name} ({seconds:.2f}s)")
+        else:
+            print(f"\n=== {name} ({seconds:.2f}s) ===")
+            for i, doc in enumerate(results[name], start=1):
+                print(f"#{i} {doc}")
+
+    if not check:
+        return results
+
+    failed = False
+    for name, expected in mongo_results(names).items():
+        diffs = compare_results(expected, results[name], ignore=ORDER_DEPENDENT_FIELDS.get(name, ()))
+        print(f"{name}: {'same as Mongo' if not diffs else f'{len(diffs)} differences'}")
+        for row, field, e, a in diffs[:5]:
+            print(f"  row {row} {field}: mongo={e!r} frames={a!r}")
+        failed = failed or bool(diffs)
+    if failed:
+        sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main(check="--check" in sys.argv)
@@ -0,0 +1,246 @@
+import asyncio
+import contextvars
+import sys
+import time
+from pprint import PrettyPrinter
+
+from pymongo.errors import PyMongoError
+
+from DbConnector import DbConnector
+from coappearance import CoAppearanceCounter
+from queries import QueryTasks, REPORTS, QUERY7_SEARCH, print_results
+from query2 import TASKS
+from task_runner import print_timings
+from term_index import TERM_COLLECTION, search_terms_async
+
+# asyncio variants of QueryPipeline (query2.py) and QueryTasks (queries.py).
+# Aggregations run on one event loop with an AsyncMongoClient, at most max_concurrency
+# at a time, and results are read from async cursors batch by batch. The pipelines are
+# the same definitions as query2.TASKS and QueryTasks.<task>_pipeline.
+
+# Timing dict of the task running in the current context (set by run_tasks_async), fetch
+# stores when the task got its first slot so queueing is not counted as query time
+_task_timing = contextvars.ContextVar("task_timing", default=None)
+
+
+def _mark_started():
+    timing = _task_timing.get()
+    if timing is not None and "start" not in timing:
+        timing["start"] = time.perf_counter()
+
+
+class AsyncQueryPipeline:
+    """
+    Runs the query2.py tasks (T2-T10B) on an AsyncMongoClient.
+
+    Example:
+    async with AsyncQueryPipeline(max_concurrency=8) as qp:
+        docs = await qp.run_task("T4")
+    """
+
+    def __init__(self, connection=None, max_concurrency=8):
+        self.connection = connection or DbConnector()
+        self.client = self.connection.async_client()
+        self.db = self.client[self.connection.database]
+        # Bounds the aggregations in flight on this client
+        self.limit = asyncio.Semaphore(max(1, max_concurrency))
+        self._server_version = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.client.close()
+
+    async def server_version(self):
+        if self._server_version is None:
+            info = await self.client.server_info()
+            self._server_version = tuple(info["versionArray"][:2])
+        return self._server_version
+
+    async def task_pipeline(self, name):
+        # (pipeline, collection) of a task in query2.TASKS
+        pipeline, collection_name, _ = TASKS[name]
+        if callable(pipeline):
+            pipeline = pipeline(server_version=await self.server_version())
+        return pipeline, collection_name
+
+    async def run_pipeline(self, pipeline, collection_name, *,
+                           allow_disk_use=True, max_time_ms=120000, batch_size=1000):
+        """Async cursor over the results, the caller iterates and closes it"""
+        collection = self.db[collection_name]
+        return await collection.aggregate(
+            pipeline,
+            allowDiskUse=allow_disk_use,
+            maxTimeMS=max_time_ms,
+            batchSize=batch_size,
+        )
+
+    async def iter_batches(self, cursor, batch_size=1000):
+        """
+        Documents of an async cursor in lists of up to batch_size. The cursor is closed
+        when the iteration ends, fails or is cancelled.
+        """
+        try:
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            await cursor.close()
+
+    async def fetch(self, pipeline, collection_name, batch_size=1000):
+        """All results of a pipeline, waits for a free slot first"""
+        async with self.limit:
+            _mark_started()
+            cursor = await self.run_pipeline(pipeline, collection_name, batch_size=batch_size)
+            docs = []
+            async for batch in self.iter_batches(cursor, batch_size):
+                docs.extend(batch)
+            return docs
+
+    async def calculate_t2(self, docs, mode="two-pass"):
+        # Counting pairs is CPU work, run it off the event loop
+        def count():
+            return CoAppearanceCounter().add_cursor(docs).top_pairs(minimum=3, limit=10, mode=mode)
+        return await asyncio.to_thread(count)
+
+    async def run_task(self, name):
+        pipeline, collection_name = await self.task_pipeline(name)
+        docs = await self.fetch(pipeline, collection_name)
+        if name == "T2":
+            return await self.calculate_t2(docs)
+        return docs
+
+    async def print_cursor(self, cursor, *, title=None, limit=None):
+        ppr = PrettyPrinter(indent=2, width=120, compact=True, sort_dicts=False)
+        if title:
+            print(f"\n=== {title} ===")
+
+        i = 0
+        async for batch in self.iter_batches(cursor):
+            for doc in batch:
+                i += 1
+                if limit and i > limit:
+                    print(f"... ({i-1} shown; truncated)")
+                    return
+                print(f"\n#{i}")
+                ppr.pprint(doc)
+
+
+class AsyncQueryTasks(AsyncQueryPipeline):
+    """
+    Runs the queries.py tasks (query1-query9), and the query2.py tasks, on one AsyncMongoClient.
+
+    Example:
+    async with AsyncQueryTasks() as q:
+        results, wall = await run_tasks_async([(name, lambda name=name: q.run_task(name))
+                                               for name in ["query1", "T4"]])
+    """
+
+    async def run_task(self, name):
+        if name not in REPORTS:
+            return await super().run_task(name)
+        if name == "query7":
+            collection_name, pipeline = QueryTasks.query7_pipeline(await self.query7_ids())
+        else:
+            collection_name, pipeline = getattr(QueryTasks, f"{name}_pipeline")()
+        return await self.fetch(pipeline, collection_name)
+
+    async def query7_ids(self):
+        # Same lookup as QueryTasks.query7: the Terms index, or None ($text) if it was not built
+        async with self.limit:
+            _mark_started()
+            if not await self.db[TERM_COLLECTION].estimated_document_count():
+                return None
+            return await search_terms_async(self.db, **QUERY7_SEARCH)
+
+
+async def run_tasks_async(tasks, timeout=None):
+    """
+    Run coroutine tasks concurrently on the running event loop, like task_runner.run_tasks.
+
+    tasks is a list of (name, coroutine function) pairs, names may repeat. Tasks still
+    running after timeout seconds are cancelled (their cursors are closed), their error
+    is a TimeoutError. If the caller is cancelled, every task is cancelled too.
+
+    seconds is measured from the moment a task got its first slot in fetch (waiting for
+    the semaphore is not counted). Tasks that never ask for a slot are timed from their
+    start, cancelled tasks that were still queued report 0.
+
+    Returns (results, wall_seconds), results are dicts with name, result, seconds and error.
+    """
+    timings = [{} for _ in tasks]
+
+    async def timed(fn, timing):
+        timing["created"] = time.perf_counter()
+        _task_timing.set(timing)
+        try:
+            result, error = await fn(), None
+        except Exception as e:
+            result, error = None, e
+        timing["end"] = time.perf_counter()
+        return result, error
+
+    start = time.perf_counter()
+    futures = [asyncio.ensure_future(timed(fn, timing)) for (_, fn), timing in zip(tasks, timings)]
+    try:
+        await asyncio.wait(futures, timeout=timeout)
+    finally:
+        for f in futures:
+            if not f.done():
+                f.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    results = []
+    for (name, _), f, timing in zip(tasks, futures, timings):
+        if f.cancelled():
+            seconds = time.perf_counter() - timing["start"] if "start" in timing else 0.0
+            results.append({"name": name, "result": None, "seconds": seconds,
+                            "error": TimeoutError(f"cancelled after {timeout}s")})
+        else:
+            result, error = f.result()
+            timing.setdefault("start", timing["created"])
+            results.append({"name": name, "result": result, "seconds": timing["end"] - timing["start"],
+                            "error": error})
+    return results, time.perf_counter() - start
+
+
+async def run_async(tasks=None, max_concurrency=8, timeout=None):
+    names = tasks or list(REPORTS) + list(TASKS)
+    async with AsyncQueryTasks(max_concurrency=max_concurrency) as q:
+        results, wall = await run_tasks_async([(name, lambda name=name: q.run_task(name)) for name in names],
+                                              timeout=timeout)
+
+    for r in results:
+        name = r["name"]
+        title = REPORTS[name][1] if name in REPORTS else TASKS[name][2]
+        if r["error"] is not None:
+            print(f"\n=== {title} ===\nERROR: {r['error']}", file=sys.stderr)
+            continue
+        if name in REPORTS:
+            print_results(r["result"], order=REPORTS[name][0], title=title)
+        else:
+            print(f"\n=== {title} ===")
+            PrettyPrinter(indent=2, width=120, compact=True, sort_dicts=False).pprint(r["result"])
+    print_timings(results, wall)
+    return results
+
+
+def main(tasks=None, max_concurrency=8, timeout=None):
+    """Run the query tasks of queries.py and query2.py on one event loop"""
+    try:
+        results = asyncio.run(run_async(tasks, max_concurrency, timeout))
+    except PyMongoError as e:
+        print(f"Mongo error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if any(r["error"] is not None for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
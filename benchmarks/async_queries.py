@@ -0,0 +1,104 @@
+"""
+Throughput of the query tasks under many concurrent requests: the thread based
+QueryTasks/QueryPipeline (task_runner.run_tasks) against the asyncio
+AsyncQueryTasks (async_queries.run_tasks_async) on one event loop.
+
+Every request runs one task of --tasks (round robin) against an already loaded
+database, e.g. the one filled by benchmarks/run_benchmarks.py. Reports wall time,
+requests per second and the peak number of threads of the process.
+
+Usage (from the repository root):
+    python benchmarks/async_queries.py --database movie_bench --requests 500 --concurrency 8 32 128
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ThreadPeak:
+    """Samples threading.active_count() in the background and keeps the maximum"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_threads(connection, names, concurrency):
+    from queries import QueryTasks
+    from query2 import QueryPipeline
+    from task_runner import run_tasks
+
+    q = QueryTasks(connection=connection)
+    qp = QueryPipeline(connection=connection)
+
+    def call(name):
+        if name.startswith("query"):
+            return getattr(q, name)()
+        pipeline, collection_name = qp.task_pipeline(name)
+        cursor = qp.run_pipeline(pipeline, collection_name)
+        return qp.calculate_t2(cursor) if name == "T2" else list(cursor)
+
+    return run_tasks([(name, lambda name=name: call(name)) for name in names], concurrency)
+
+
+def run_async(connection, names, concurrency):
+    from async_queries import AsyncQueryTasks, run_tasks_async
+
+    async def go():
+        async with AsyncQueryTasks(connection, max_concurrency=concurrency) as q:
+            return await run_tasks_async([(name, lambda name=name: q.run_task(name)) for name in names])
+
+    return asyncio.run(go())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="movie_bench")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--tasks", nargs="+", default=["query1", "query3", "query9", "T8", "T10A", "T10B"])
+    args = parser.parse_args()
+
+    from DbConnector import DbConnector
+
+    names = [args.tasks[i % len(args.tasks)] for i in range(args.requests)]
+    print(f"{args.requests} requests over {', '.join(args.tasks)}\n")
+    print(f"{'runner':<10}{'concurrency':>12}{'wall s':>9}{'req/s':>9}{'errors':>8}{'threads':>9}")
+    for concurrency in args.concurrency:
+        for label, runner in [("threads", run_threads), ("asyncio", run_async)]:
+            # maxPoolSize follows the concurrency so the pool is not the bottleneck of either runner
+            connection = DbConnector(DATABASE=args.database, URI=args.mongo_uri, shared=False,
+                                     maxPoolSize=concurrency)
+            try:
+                with ThreadPeak() as threads:
+                    start = time.perf_counter()
+                    results, _ = runner(connection, names, concurrency)
+                    wall = time.perf_counter() - start
+            finally:
+                connection.close_connection()
+            errors = sum(r["error"] is not None for r in results)
+            print(f"{label:<10}{concurrency:>12}{wall:>9.2f}{len(names) / wall:>9.1f}{errors:>8}{threads.peak:>9}")
+
+
+if __name__ == "__main__":
+    main()
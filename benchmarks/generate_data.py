@@ -0,0 +1,200 @@
+"""
+Seeded synthetic Movies/Credits/Ratings generator.
+
+Writes <out>/movies/{movies_metadata,links,credits,ratings,keywords}.csv in the same
+format as the Kaggle dataset, including Python-literal nested columns, malformed
+rows and duplicates, so MoviePipeline can run on it unchanged.
+
+Usage (from the repository root):
+    python benchmarks/generate_data.py --scale small --out bench_data
+    python benchmarks/generate_data.py --ratings 5000000 --movies 20000 --out bench_data
+"""
+import argparse
+import csv
+import os
+import random
+
+# scale -> (ratings, movies)
+SCALES = {
+    "small": (10000, 500),
+    "medium": (1000000, 10000),
+    "full": (26000000, 45000),
+}
+
+GENRES = [(28, "Action"), (12, "Adventure"), (16, "Animation"), (35, "Comedy"), (80, "Crime"),
+          (99, "Documentary"), (18, "Drama"), (10751, "Family"), (14, "Fantasy"), (36, "History"),
+          (27, "Horror"), (10402, "Music"), (9648, "Mystery"), (10749, "Romance"), (878, "Science Fiction"),
+          (53, "Thriller"), (10752, "War"), (37, "Western")]
+COUNTRIES = [("US", "United States of America"), ("GB", "United Kingdom"), ("FR", "France"),
+             ("DE", "Germany"), ("JP", "Japan"), ("IT", "Italy"), ("NO", "Norway")]
+LANGUAGES = ["en", "en", "en", "fr", "de", "ja", "it", "no", "es"]
+COMPANIES = [(i, name) for i, name in enumerate(
+    ["Paramount", "Warner Bros.", "Universal Pictures", "Pixar", "Gaumont", "Toho", "Nordisk Film",
+     "O'Brien Pictures"], start=1)]
+JOBS = [("Directing", "Director"), ("Writing", "Screenplay"), ("Production", "Producer"),
+        ("Sound", "Original Music Composer"), ("Camera", "Director of Photography"), ("Editing", "Editor")]
+WORDS = ["noir", "neo-noir", "detective", "love", "war", "space", "robot", "family", "heist", "revenge",
+         "friendship", "murder", "time travel", "dystopia", "based on novel", "sequel", "woman director"]
+VALID_RATINGS = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+
+MOVIE_COLUMNS = ["adult", "belongs_to_collection", "budget", "genres", "homepage", "id", "imdb_id",
+                 "original_language", "original_title", "overview", "popularity", "poster_path",
+                 "production_companies", "production_countries", "release_date", "revenue", "runtime",
+                 "spoken_languages", "status", "tagline", "title", "video", "vote_average", "vote_count"]
+
+
+def person_name(rng, pid):
+    first = rng.choice(["Tom", "Anna", "Liv", "Jean", "Akira", "Sean", "Maria", "Ola"])
+    last = rng.choice(["Hanks", "Berg", "Ullmann", "Reno", "Kurosawa", "O'Connor", "Rossi", "Nordmann"])
+    return f"{first} {last} {pid}"
+
+
+def write_movies(rng, out, n_movies, n_collections):
+    """Returns the tmdb ids of the generated movies"""
+    tmdb_ids = rng.sample(range(2, n_movies * 20), n_movies)
+    with open(os.path.join(out, "movies_metadata.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(MOVIE_COLUMNS)
+        for i, tmdb_id in enumerate(tmdb_ids):
+            genres = [{"id": g, "name": n} for g, n in rng.sample(GENRES, rng.randint(0, 4))]
+            companies = [{"name": n, "id": c} for c, n in rng.sample(COMPANIES, rng.randint(0, 3))]
+            countries = [{"iso_3166_1": c, "name": n} for c, n in rng.sample(COUNTRIES, rng.randint(0, 2))]
+            languages = [{"iso_639_1": l, "name": l.upper()} for l in sorted(set(rng.sample(LANGUAGES, 2)))]
+            collection = ""
+            if rng.random() < 0.2:
+                c = rng.randrange(n_collections)
+                collection = repr({"id": 1000 + c, "name": f"Saga {c} Collection",
+                                   "poster_path": f"/p{c}.jpg", "backdrop_path": None})
+            words = rng.sample(WORDS, 4)
+            row = {
+                "adult": "False",
+                "belongs_to_collection": collection,
+                "budget": str(rng.choice([0, rng.randint(10000, 200000000)])),
+                "genres": repr(genres),
+                "homepage": "",
+                "id": str(tmdb_id),
+                "imdb_id": f"tt{1000000 + i:07d}",
+                "original_language": rng.choice(LANGUAGES),
+                "original_title": f"Movie {i}",
+                "overview": "A story about " + ", ".join(words[:3]) + ".",
+                "popularity": f"{rng.uniform(0, 50):.6f}",
+                "poster_path": f"/m{i}.jpg",
+                "production_companies": repr(companies),
+                "production_countries": repr(countries),
+                "release_date": f"{rng.randint(1920, 2017)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "revenue": str(rng.choice([0, rng.randint(1000, 2000000000)])),
+                "runtime": str(rng.randint(60, 200)) if rng.random() > 0.02 else "",
+                "spoken_languages": repr(languages),
+                "status": "Released",
+                "tagline": f"The {words[3]} never ends.",
+                "title": f"Movie {i}",
+                "video": rng.choice(["False", "False", "True", ""]),
+                "vote_average": f"{rng.uniform(0, 10):.1f}",
+                "vote_count": str(rng.choice([rng.randint(0, 50), rng.randint(50, 15000)])),
+            }
+            writer.writerow([row[c] for c in MOVIE_COLUMNS])
+
+            # Duplicates, like in the real file
+            if rng.random() < 0.002:
+                writer.writerow([row[c] for c in MOVIE_COLUMNS])
+
+        # Malformed rows: shifted columns with a date as id and a path as budget
+        for _ in range(max(1, n_movies // 10000)):
+            bad = ["False", "", "/ff9qCepilowshEtG2GYWwzt2bs4.jpg", "[]", "", "1997-08-20", "0",
+                   "en", "Broken", "", "", "", "[]", "[]", "", "", "", "[]", "", "", "Broken", "", "", ""]
+            writer.writerow(bad)
+    return tmdb_ids
+
+
+def write_links(out, tmdb_ids):
+    """Returns the MovieLens ids of the generated movies"""
+    movie_ids = list(range(1, len(tmdb_ids) + 1))
+    with open(os.path.join(out, "links.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["movieId", "imdbId", "tmdbId"])
+        for i, (movie_id, tmdb_id) in enumerate(zip(movie_ids, tmdb_ids)):
+            # A few links without tmdbId
+            writer.writerow([movie_id, f"{1000000 + i:07d}", "" if i % 997 == 13 else tmdb_id])
+    return movie_ids
+
+
+def write_credits(rng, out, tmdb_ids, n_people):
+    with open(os.path.join(out, "credits.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cast", "crew", "id"])
+        for tmdb_id in tmdb_ids:
+            cast = []
+            for order in range(rng.randint(0, 30)):
+                pid = rng.randrange(1, n_people)
+                cast.append({"cast_id": order, "character": f"Role {order}", "credit_id": f"c{tmdb_id}{order}",
+                             "gender": rng.choice([0, 1, 2]), "id": pid, "name": person_name(rng, pid),
+                             "order": order, "profile_path": None})
+            # Duplicate cast entries
+            if cast and rng.random() < 0.01:
+                cast.append(dict(cast[0]))
+            crew = []
+            for department, job in rng.sample(JOBS, rng.randint(1, len(JOBS))):
+                pid = rng.randrange(1, n_people // 10 or 2)
+                crew.append({"credit_id": f"k{tmdb_id}{job}", "department": department, "gender": rng.choice([0, 1, 2]),
+                             "id": pid, "job": job, "name": person_name(rng, pid), "profile_path": None})
+            cast_text = repr(cast)
+            # Malformed literal
+            if rng.random() < 0.001:
+                cast_text = cast_text[:len(cast_text) // 2]
+            writer.writerow([cast_text, repr(crew), tmdb_id])
+
+
+def write_keywords(rng, out, tmdb_ids):
+    with open(os.path.join(out, "keywords.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "keywords"])
+        for tmdb_id in tmdb_ids:
+            words = rng.sample(WORDS, rng.randint(0, 5))
+            keywords = [{"id": WORDS.index(w) + 1, "name": w.title() if rng.random() < 0.3 else w} for w in words]
+            writer.writerow([tmdb_id, repr(keywords)])
+
+
+def write_ratings(rng, out, movie_ids, n_ratings, n_users, chunk=100000):
+    with open(os.path.join(out, "ratings.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["userId", "movieId", "rating", "timestamp"])
+        written = 0
+        while written < n_ratings:
+            rows = []
+            for _ in range(min(chunk, n_ratings - written)):
+                # A few ratings outside the valid set
+                rating = rng.choice(VALID_RATINGS) if rng.random() > 0.0005 else 7.0
+                rows.append((rng.randint(1, n_users), rng.choice(movie_ids), rating,
+                             rng.randint(789652009, 1501829500)))
+            writer.writerows(rows)
+            written += len(rows)
+
+
+def generate(out, n_ratings, n_movies, seed=42):
+    rng = random.Random(seed)
+    movies_dir = os.path.join(out, "movies")
+    os.makedirs(movies_dir, exist_ok=True)
+
+    tmdb_ids = write_movies(rng, movies_dir, n_movies, max(1, n_movies // 50))
+    movie_ids = write_links(movies_dir, tmdb_ids)
+    write_credits(rng, movies_dir, tmdb_ids, n_people=max(100, n_movies * 5))
+    write_keywords(rng, movies_dir, tmdb_ids)
+    write_ratings(rng, movies_dir, movie_ids, n_ratings, n_users=max(30, n_ratings // 100))
+    print(f"Wrote {n_movies} movies and {n_ratings} ratings to {movies_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--ratings", type=int, help="overrides the number of ratings of --scale")
+    parser.add_argument("--movies", type=int, help="overrides the number of movies of --scale")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args()
+
+    n_ratings, n_movies = SCALES[args.scale]
+    generate(args.out, args.ratings or n_ratings, args.movies or n_movies, args.seed)
+
+
+if __name__ == "__main__":
+    main()
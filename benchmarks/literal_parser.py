@@ -0,0 +1,83 @@
+"""
+Benchmark the literal parser against the ast.literal_eval based parse_json_list.
+
+Uses a column of a Kaggle CSV when it exists, otherwise synthetic cast lists.
+Also checks that both parsers return exactly the same values.
+
+Usage (from the repository root):
+    python benchmarks/literal_parser.py
+    python benchmarks/literal_parser.py --csv movies/credits.csv --column cast
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from literal_parser import parse_json_list, parse_column
+
+
+def literal_eval_list(x):
+    # parse_json_list as it was before the fast parser
+    if pd.isna(x) or x == "":
+        return []
+    try:
+        return ast.literal_eval(x)
+    except (ValueError, SyntaxError):
+        return []
+
+
+def synthetic_cast(rows, cast_size=25):
+    person = ("{'cast_id': %d, 'character': %s, 'credit_id': '52fe4284c3a36847f8024f95', "
+              "'gender': %d, 'id': %d, 'name': %s, 'order': %d, 'profile_path': None}")
+    values = []
+    for r in range(rows):
+        if r % 500 == 0:
+            values.append("[{'id': 1, 'name': 'broken'")
+            continue
+        cast = []
+        for i in range(cast_size):
+            # Every 7th name has an apostrophe (double-quoted) and one name in every 50th row an
+            # escape sequence, which is the only kind that takes the ast fallback path
+            name = "\"Tom O'Brien\"" if i % 7 == 0 else "'Tom Hanks'"
+            name = "'Zo\\xeb'" if r % 50 == 1 and i == 1 else name
+            cast.append(person % (i, "'Woody'", i % 3, r * 100 + i, name, i))
+        values.append("[" + ", ".join(cast) + "]")
+    return pd.Series(values)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<32}{time.perf_counter() - start:>8.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="movies/credits.csv")
+    parser.add_argument("--column", default="cast")
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic rows when the CSV is missing")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if os.path.exists(args.csv):
+        values = pd.read_csv(args.csv)[args.column]
+    else:
+        print(f"{args.csv} not found, using {args.rows} synthetic rows")
+        values = synthetic_cast(args.rows)
+
+    baseline = timed("ast.literal_eval (apply)", lambda: values.apply(literal_eval_list))
+    fast = timed("fast parser (apply)", lambda: values.apply(parse_json_list))
+    pooled = timed("fast parser (process pool)", lambda: parse_column(values, "list", workers=args.workers))
+
+    assert baseline.tolist() == fast.tolist() == pooled.tolist(), "parsers returned different values"
+    print("outputs identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Check that the group-level median accumulators give the same answers as the old
+$push + $sortArray medians, and compare their run time.
+
+Loads random movies into a scratch database on a local mongod and runs T4 and the
+query5 median in the old form and in every form pipelines.stats can build
+(portable fallback, native exact on MongoDB 8.0+, native approximate).
+
+Usage (from the repository root):
+    python benchmarks/medians.py --movies 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The T4 median as it was before pipelines.stats, run after the $group/$match of T4
+LEGACY_T4_MEDIAN = [
+    {"$set": {"votes_sorted": {"$sortArray": {"input": "$votes", "sortBy": 1}}}},
+    {"$set": {
+        "median_vote_average": {
+            "$let": {
+                "vars": {"n": {"$size": "$votes_sorted"}},
+                "in": {
+                    "$cond": [
+                        {"$eq": ["$$n", 0]},
+                        None,
+                        {"$cond": [
+                            {"$eq": [{"$mod": ["$$n", 2]}, 1]},
+                            {"$arrayElemAt": ["$votes_sorted", {"$floor": {"$divide": ["$$n", 2]}}]},
+                            {"$avg": [
+                                {"$arrayElemAt": ["$votes_sorted", {"$subtract": [{"$divide": ["$$n", 2]}, 1]}]},
+                                {"$arrayElemAt": ["$votes_sorted", {"$divide": ["$$n", 2]}]}
+                            ]}
+                        ]}
+                    ]
+                }
+            }
+        }
+    }},
+]
+
+
+def legacy_t4(pipeline):
+    # Swap the median accumulator of a T4 pipeline for the old $push of votes
+    legacy = []
+    for stage in pipeline:
+        if "$group" in stage:
+            group = {k: v for k, v in stage["$group"].items()
+                     if k != "median_vote_average" and not k.startswith("_median")}
+            group["votes"] = {"$push": {"$cond": [{"$ne": ["$_vote", None]}, "$_vote", "$$REMOVE"]}}
+            legacy.append({"$group": group})
+        elif "$match" in stage and "movie_count" in stage["$match"]:
+            legacy.append(stage)
+            legacy.extend(LEGACY_T4_MEDIAN)
+        elif "$set" in stage or "$unset" in stage:
+            continue
+        else:
+            legacy.append(stage)
+    return legacy
+
+
+def query5_pipeline(median_fields, after):
+    return [
+        {"$match": {"runtime": {"$ne": None}, "genres": {"$ne": []}}},
+        {"$group": {"_id": {"$arrayElemAt": ["$genres.name", 0]}, **median_fields}},
+        *after,
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def random_movies(n, seed=42):
+    rng = random.Random(seed)
+    genres = ["Drama", "Comedy", "Thriller", "Horror", "Animation", "Documentary"]
+    for i in range(n):
+        vote = None if rng.random() < 0.05 else round(rng.uniform(0, 10), 1)
+        yield {
+            "tmdbId": i,
+            "belongs_to_collection": {"id": i % 5000, "name": f"Collection {i % 5000}"},
+            "revenue": rng.randint(0, 10 ** 9),
+            "vote_average": vote,
+            "release_date": datetime(1920 + rng.randint(0, 100), 1, 1),
+            "runtime": rng.randint(60, 200),
+            "genres": [{"id": 0, "name": rng.choice(genres)}],
+        }
+
+
+def timed(db, pipeline):
+    start = time.perf_counter()
+    result = list(db.Movie.aggregate(pipeline, allowDiskUse=True))
+    return result, time.perf_counter() - start
+
+
+def same(a, b, key, tol=0.0):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if (x[key] is None) != (y[key] is None):
+            return False
+        if x[key] is not None and abs(x[key] - y[key]) > tol:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=200000)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="movie_bench_medians")
+    args = parser.parse_args()
+
+    from DbConnector import DbConnector
+    from pipelines.T4 import build_t4_pipeline
+    from pipelines.stats import percentile_fields, EXACT_PERCENTILE_VERSION
+
+    connection = DbConnector(DATABASE=args.database, URI=args.mongo_uri)
+    db = connection.db
+    try:
+        db.Movie.drop()
+        db.Movie.insert_many(random_movies(args.movies), ordered=False)
+        server = tuple(connection.client.server_info()["versionArray"][:2])
+        print(f"server {server[0]}.{server[1]}, {args.movies} movies\n")
+
+        baseline, base_time = timed(db, legacy_t4(build_t4_pipeline()))
+        runs = [("T4 fallback", build_t4_pipeline(server_version=None), 0.0)]
+        if server >= EXACT_PERCENTILE_VERSION:
+            runs.append(("T4 native exact", build_t4_pipeline(server_version=server), 1e-9))
+        runs.append(("T4 approximate", build_t4_pipeline(median_mode="approximate"), None))
+
+        print(f"{'pipeline':<24}{'seconds':>9}{'same':>7}")
+        print(f"{'T4 $push + $sortArray':<24}{base_time:>9.2f}{'-':>7}")
+        for name, pipeline, tol in runs:
+            result, seconds = timed(db, pipeline)
+            ok = "-" if tol is None else ("yes" if same(baseline, result, "median_vote_average", tol) else "NO")
+            print(f"{name:<24}{seconds:>9.2f}{ok:>7}")
+
+        # query5 median: the old $push of runtimes + $median over the array, vs the accumulator
+        old5 = query5_pipeline({"runtimes": {"$push": "$runtime"}},
+                               [{"$set": {"median_runtime": {"$median": {"input": "$runtimes", "method": "approximate"}}}},
+                                {"$unset": "runtimes"}])
+        new5 = query5_pipeline(*percentile_fields("median_runtime", "$runtime", mode="approximate"))
+        old_result, old_time = timed(db, old5)
+        new_result, new_time = timed(db, new5)
+        print(f"{'query5 $push runtimes':<24}{old_time:>9.2f}{'-':>7}")
+        ok = "yes" if same(old_result, new_result, "median_runtime") else "NO"
+        print(f"{'query5 accumulator':<24}{new_time:>9.2f}{ok:>7}")
+    finally:
+        db.Movie.drop()
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Check the portable percentile expression of pipelines.stats (_sorted_array_percentile,
+used by exact mode on servers without the continuous method) without a mongod.
+
+The expressions are evaluated by a small interpreter of the aggregation operators they
+use, on random sorted arrays of every length up to --max-size, and compared with the
+old T4 median expression (benchmarks/medians.py LEGACY_T4_MEDIAN), numpy.median and
+numpy.percentile (linear interpolation, like the continuous method).
+
+Usage (from the repository root):
+    python benchmarks/percentiles.py --arrays 2000 --max-size 40
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medians import LEGACY_T4_MEDIAN
+from pipelines.stats import _sorted_array_percentile
+
+
+def evaluate(expr, doc, variables=None):
+    """Value of an aggregation expression on doc, for the operators the medians use"""
+    variables = variables or {}
+    if isinstance(expr, str):
+        if expr.startswith("$$"):
+            return variables[expr[2:]]
+        if expr.startswith("$"):
+            return doc.get(expr[1:])
+        return expr
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+
+    op, args = next(iter(expr.items()))
+    if op == "$let":
+        scope = dict(variables, **{k: evaluate(v, doc, variables) for k, v in args["vars"].items()})
+        return evaluate(args["in"], doc, scope)
+    if op == "$cond":
+        condition, then, otherwise = args
+        return evaluate(then if evaluate(condition, doc, variables) else otherwise, doc, variables)
+
+    values = evaluate(args if isinstance(args, list) else [args], doc, variables)
+    if op == "$size":
+        return len(values[0])
+    if op == "$eq":
+        return values[0] == values[1]
+    if op == "$mod":
+        return values[0] % values[1]
+    if op == "$add":
+        return sum(values)
+    if op == "$subtract":
+        return values[0] - values[1]
+    if op == "$multiply":
+        return math.prod(values)
+    if op == "$divide":
+        return values[0] / values[1]
+    if op == "$floor":
+        return math.floor(values[0])
+    if op == "$ceil":
+        return math.ceil(values[0])
+    if op == "$toInt":
+        return int(values[0])
+    if op == "$avg":
+        return sum(values) / len(values)
+    if op == "$arrayElemAt":
+        array, index = values
+        if index != int(index):
+            raise ValueError(f"$arrayElemAt with a non-integral index {index}")
+        return array[int(index)]
+    raise ValueError(f"Operator not supported by this check: {op}")
+
+
+def legacy_median(votes_sorted):
+    expr = LEGACY_T4_MEDIAN[1]["$set"]["median_vote_average"]
+    return evaluate(expr, {"votes_sorted": votes_sorted})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arrays", type=int, default=2000)
+    parser.add_argument("--max-size", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    checked, failures = 0, []
+    for i in range(args.arrays):
+        n = i % (args.max_size + 1)
+        # vote averages have one decimal, like T4's input; ties are common
+        values = sorted(round(rng.uniform(0, 10), 1) for _ in range(n))
+        doc = {"values": values}
+
+        median = evaluate(_sorted_array_percentile("$values", 0.5), doc)
+        expected = None if n == 0 else float(np.median(values))
+        if n and not math.isclose(median, legacy_median(values), abs_tol=1e-9):
+            failures.append(("legacy T4", values, median, legacy_median(values)))
+        if (median is None) != (expected is None) or (n and not math.isclose(median, expected, abs_tol=1e-9)):
+            failures.append(("numpy median", values, median, expected))
+
+        for p in (0.1, 0.25, 0.9):
+            value = evaluate(_sorted_array_percentile("$values", p), doc)
+            expected = None if n == 0 else float(np.percentile(values, p * 100))
+            if (value is None) != (expected is None) or (n and not math.isclose(value, expected, abs_tol=1e-9)):
+                failures.append((f"numpy p={p}", values, value, expected))
+        checked += 1
+
+    for name, values, got, expected in failures[:10]:
+        print(f"MISMATCH vs {name}: {values} -> {got}, expected {expected}")
+    print(f"Checked {checked} arrays (sizes 0-{args.max_size}): {len(failures)} mismatches")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the one-document-per-rating layout of Ratings with the bucketed layout.
+
+Loads both layouts from ratings.csv into a local mongod and reports storage and
+index size, insert time and the time of a per-user count/mean/variance scan.
+
+Usage (from the repository root):
+    python benchmarks/generate_data.py --scale medium --out bench_data
+    python benchmarks/rating_layouts.py --data-dir bench_data
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def collection_size(db, name):
+    stats = db.command("collStats", name)
+    return stats["count"], stats["storageSize"], stats["totalIndexSize"]
+
+
+def scan_documents(db):
+    pipeline = [{"$group": {"_id": "$userId", "ratingCount": {"$sum": 1},
+                            "ratingMean": {"$avg": "$rating"}, "ratingVariance": {"$stdDevSamp": "$rating"}}}]
+    return list(db.Ratings.aggregate(pipeline, allowDiskUse=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="bench_data", help="directory containing movies/ratings.csv")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="movie_bench_layouts")
+    args = parser.parse_args()
+
+    from DbConnector import DbConnector
+    from clean import MoviePipeline
+    from rating_buckets import BUCKET_COLLECTION, build_buckets, user_rating_stats
+
+    connection = DbConnector(DATABASE=args.database, URI=args.mongo_uri)
+    program = MoviePipeline(connection=connection)
+    cwd = os.getcwd()
+    try:
+        os.chdir(args.data_dir)
+        df_ratings = program.clean_ratings()
+    finally:
+        os.chdir(cwd)
+
+    try:
+        _, insert_docs = timed(program.load_collection, "Ratings", df_ratings)
+        df_buckets, build_time = timed(build_buckets, df_ratings)
+        _, insert_buckets = timed(program.load_collection, BUCKET_COLLECTION, df_buckets)
+
+        _, scan_docs = timed(scan_documents, program.db)
+        _, scan_buckets = timed(user_rating_stats, program.db)
+
+        rows = [
+            ("documents", *collection_size(program.db, "Ratings"), insert_docs, scan_docs),
+            ("buckets", *collection_size(program.db, BUCKET_COLLECTION), build_time + insert_buckets, scan_buckets),
+        ]
+        print(f"\n{'layout':<10}{'docs':>12}{'storage MB':>12}{'index MB':>10}{'insert s':>10}{'user scan s':>13}")
+        for name, count, storage, index, insert, scan in rows:
+            print(f"{name:<10}{count:>12}{storage / 1024 ** 2:>12.1f}{index / 1024 ** 2:>10.1f}{insert:>10.2f}{scan:>13.2f}")
+    finally:
+        program.drop_coll("Ratings")
+        program.drop_coll(BUCKET_COLLECTION)
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
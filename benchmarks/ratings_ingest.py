@@ -0,0 +1,82 @@
+"""
+Compare memory and throughput of the eager and the streaming ratings ingestion.
+
+Each mode runs in its own process so the peak RSS of one does not hide the other.
+
+Usage (from the repository root):
+    python benchmarks/ratings_ingest.py
+    python benchmarks/ratings_ingest.py --insert --chunk-size 250000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, chunk_size, insert):
+    from clean import MoviePipeline
+
+    program = MoviePipeline()
+    start = time.perf_counter()
+    rows = 0
+    try:
+        if mode == "eager":
+            df_ratings = program.clean_ratings()
+            rows = len(df_ratings)
+            if insert:
+                program.insert_documents("Ratings", df_ratings)
+        elif insert:
+            rows = len(program.stream_ratings(chunk_size))
+        else:
+            for df_chunk in program.iter_ratings(chunk_size):
+                rows += len(df_chunk)
+    finally:
+        program.connection.close_connection()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["eager", "stream"], help="run a single mode in this process")
+    parser.add_argument("--chunk-size", type=int, default=500000)
+    parser.add_argument("--insert", action="store_true", help="also insert into the Ratings collection")
+    args = parser.parse_args()
+
+    if args.mode:
+        print("RESULT " + json.dumps(run_mode(args.mode, args.chunk_size, args.insert)))
+        return
+
+    results = []
+    for mode in ["eager", "stream"]:
+        cmd = [sys.executable, os.path.abspath(__file__), "--mode", mode, "--chunk-size", str(args.chunk_size)]
+        if args.insert:
+            cmd.append("--insert")
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        line = [l for l in out.splitlines() if l.startswith("RESULT ")][-1]
+        results.append(json.loads(line[len("RESULT "):]))
+
+    print(f"{'mode':<8}{'rows':>12}{'seconds':>10}{'rows/sec':>12}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['rows']:>12}{r['seconds']:>10}{r['rows_per_sec']:>12}{r['peak_rss_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Time every MoviePipeline stage and every query against a local mongod.
+
+Run generate_data.py first. Results (seconds, peak RSS sampled during each
+stage/query and how far it rose above the RSS at the stage start) are saved as
+JSON together with the git commit, so runs can be compared.
+
+Usage (from the repository root):
+    python benchmarks/generate_data.py --scale medium --out bench_data
+    python benchmarks/run_benchmarks.py --data-dir bench_data
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def current_rss_mb():
+    # Resident set size now, from /proc (Linux); elsewhere the process-wide peak (kilobytes on Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StagePeak:
+    """
+    Samples the RSS in the background while a stage runs and keeps its maximum, so every
+    stage reports its own peak instead of the process-wide high-water mark (ru_maxrss).
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+    def __init__(self):
+        self.records = []
+
+    def run(self, group, name, fn, *args):
+        with StagePeak() as memory:
+            start = time.perf_counter()
+            result = fn(*args)
+            seconds = time.perf_counter() - start
+        # peak_rss_mb: highest RSS during this stage, peak_delta_mb: how far it rose above the start
+        self.records.append({"group": group, "name": name, "seconds": round(seconds, 3),
+                             "peak_rss_mb": round(memory.peak, 1),
+                             "peak_delta_mb": round(memory.peak - memory.start, 1)})
+        print(f"{group:<8}{name:<24}{seconds:>9.2f}s{memory.peak:>10.1f} MB{memory.peak - memory.start:>+10.1f} MB")
+        return result
+
+
+def run_pipeline_stages(timer, connection):
+    from clean import MoviePipeline
+    from term_index import build_term_index
+
+    program = MoviePipeline(connection=connection)
+    df_movies = timer.run("clean", "clean_movies", program.clean_movies)
+    df_links = timer.run("clean", "clean_links", program.clean_links)
+    df_credits = timer.run("clean", "clean_credits", program.clean_credits)
+    df_ratings = timer.run("clean", "clean_ratings", program.clean_ratings)
+    df_keywords = timer.run("clean", "clean_keywords", program.clean_keywords)
+
+    df_movies = timer.run("clean", "merge_movies_and_links", program.merge_movies_and_links, df_movies, df_links)
+    df_movies = timer.run("clean", "merge_keywords", program.merge_keywords, df_movies, df_keywords)
+    df_users = timer.run("clean", "build_user_stats", program.build_user_stats, df_movies, df_ratings)
+    df_people = timer.run("clean", "build_people", program.build_people, df_movies, df_credits)
+    # Credits carry the Movie summary the credit queries filter on, as loaded by clean.main
+    df_credits = timer.run("clean", "embed_movie_summary", program.embed_movie_summary, df_credits, df_movies)
+    df_terms = timer.run("clean", "build_term_index", build_term_index, df_movies)
+
+    frames = {"Movie": df_movies, "Terms": df_terms, "Credits": df_credits, "Ratings": df_ratings,
+              "Users": df_users, "People": df_people}
+    for name, df in frames.items():
+        timer.run("load", name, program.load_collection, name, df)
+    return {name: len(df) for name, df in frames.items()}
+
+
+def run_queries(timer, connection):
+    from queries import QueryTasks, REPORTS
+    from query2 import QueryPipeline, TASKS
+
+    q = QueryTasks(connection=connection)
+    for name in REPORTS:
+        timer.run("query", name, getattr(q, name))
+
+    qp = QueryPipeline(connection=connection)
+    for name in TASKS:
+        pipeline, collection_name = qp.task_pipeline(name)
+        if name == "T2":
+            timer.run("query", name, lambda: qp.calculate_t2(qp.run_pipeline(pipeline, collection_name)))
+        else:
+            timer.run("query", name, lambda: list(qp.run_pipeline(pipeline, collection_name)))
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r["group"], r["name"]): r for r in json.load(f)["records"]}
+    with open(new_path) as f:
+        new = json.load(f)["records"]
+
+    print(f"{'stage':<32}{'old s':>9}{'new s':>9}{'ratio':>8}{'old MB':>9}{'new MB':>9}")
+    for r in new:
+        o = old.get((r["group"], r["name"]))
+        if o is None:
+            continue
+        ratio = r["seconds"] / o["seconds"] if o["seconds"] else float("nan")
+        print(f"{r['group'] + '.' + r['name']:<32}{o['seconds']:>9.2f}{r['seconds']:>9.2f}{ratio:>8.2f}"
+              f"{o['peak_rss_mb']:>9.1f}{r['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="bench_data", help="directory containing movies/*.csv")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="movie_bench")
+    parser.add_argument("--skip-queries", action="store_true")
+    parser.add_argument("--output", help="result file, default benchmarks/results/<commit>-<time>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from DbConnector import DbConnector
+
+    data_dir = os.path.abspath(args.data_dir)
+    commit = git_commit()
+    started = datetime.now(timezone.utc)
+    output = args.output or os.path.join(
+        REPO, "benchmarks", "results", f"{commit or 'nocommit'}-{started:%Y%m%dT%H%M%S}.json")
+
+    connection = DbConnector(DATABASE=args.database, URI=args.mongo_uri)
+    timer = Timer()
+    cwd = os.getcwd()
+    try:
+        # MoviePipeline reads movies/*.csv relative to the working directory
+        os.chdir(data_dir)
+        counts = run_pipeline_stages(timer, connection)
+        if not args.skip_queries:
+            run_queries(timer, connection)
+    finally:
+        os.chdir(cwd)
+        connection.close_connection()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "started": started.isoformat(),
+            "data_dir": data_dir,
+            "database": args.database,
+            "documents": counts,
+            "records": timer.records,
+        }, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
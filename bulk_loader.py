@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import BulkWriteError
+
+
+class BulkLoader:
+    """
+    Pipelined bulk writer for DataFrames.
+
+    Batches are converted to documents in a worker pool while earlier batches are
+    sent with unordered insert_many on several writer threads. The MongoClient pool
+    gives every writer thread its own connection. A bounded queue between the two
+    stages stops conversion from running too far ahead of the network.
+
+    Example:
+    loader = BulkLoader(db, batch_size=50000, writers=4)
+    loader.load("Movie", df_movies)
+    loader.print_stats()
+    """
+
+    def __init__(self, db, batch_size=100000, writers=4, converters=2, max_pending=8):
+        self.db = db
+        self.batch_size = batch_size
+        self.writers = writers
+        self.converters = converters
+        self.max_pending = max_pending
+        # Per collection: documents, failed_batches, seconds, docs_per_sec
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def load(self, collection_name, df, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        collection = self.db[collection_name]
+        total_rows = len(df)
+        stats = self.stats.setdefault(collection_name, {
+            "documents": 0, "failed_batches": 0, "seconds": 0.0, "docs_per_sec": 0.0
+        })
+        inserted_before = stats["documents"]
+        pending = queue.Queue(maxsize=self.max_pending)
+        start = time.perf_counter()
+
+        def write():
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                start_index, future = item
+                try:
+                    documents = future.result()
+                    collection.insert_many(documents, ordered=False)
+                    inserted = len(documents)
+                except BulkWriteError as e:
+                    inserted = e.details.get("nInserted", 0)
+                    print(f"Warning: Failed to insert part of batch starting at index {start_index}. Error: {e}")
+                    with self._lock:
+                        stats["failed_batches"] += 1
+                except Exception as e:
+                    # Any failure only loses this batch, a dead writer would block the producer on put()
+                    inserted = 0
+                    print(f"Warning: Failed to insert batch starting at index {start_index}. Error: {e}")
+                    with self._lock:
+                        stats["failed_batches"] += 1
+
+                with self._lock:
+                    stats["documents"] += inserted
+                    total_inserted = stats["documents"] - inserted_before
+                print(f" -> Inserted batch {start_index // batch_size + 1} to {collection_name}. "
+                      f"Total documents inserted: {total_inserted}/{total_rows}")
+
+        writer_threads = [threading.Thread(target=write, daemon=True) for _ in range(self.writers)]
+        for t in writer_threads:
+            t.start()
+
+        with ThreadPoolExecutor(max_workers=self.converters) as converter_pool:
+            try:
+                for i in range(0, total_rows, batch_size):
+                    df_chunk = df.iloc[i:i + batch_size]
+                    # Blocks when max_pending batches are waiting (backpressure)
+                    pending.put((i, converter_pool.submit(df_chunk.to_dict, "records")))
+            finally:
+                for _ in writer_threads:
+                    pending.put(None)
+                for t in writer_threads:
+                    t.join()
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats["seconds"] += elapsed
+            stats["docs_per_sec"] = round(stats["documents"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+
+        return stats["documents"] - inserted_before
+
+    def print_stats(self):
+        print("\nBulk load summary")
+        print(f"{'collection':<12}{'documents':>12}{'seconds':>10}{'docs/sec':>12}{'failed':>8}")
+        for name, s in self.stats.items():
+            print(f"{name:<12}{s['documents']:>12}{s['seconds']:>10.1f}{s['docs_per_sec']:>12.1f}{s['failed_batches']:>8}")
@@ -1,27 +1,86 @@
 from DbConnector import DbConnector
+from bulk_loader import BulkLoader
+from literal_parser import parse_column
+from ingest_state import source_fingerprints, changed_collections, save_fingerprints
+from frame_cache import FrameCache
+from rating_buckets import build_buckets
+from term_index import build_term_index
 from pprint import pprint
+import numpy as np
 import pandas as pd
-import ast
 import unicodedata
-
-
-def parse_json_list(x):
-    if pd.isna(x) or x == "":
-        return []
-    try:
-        return ast.literal_eval(x)
-    except(ValueError, SyntaxError):
-        return []
-
-
-def parse_json_obj(x):
-    if pd.isna(x) or x == "":
-        return None
-    try:
-        v = ast.literal_eval(x)
-        return v if isinstance(v, dict) else None
-    except (ValueError, SyntaxError):
-        return None
+from concurrent.futures import ThreadPoolExecutor
+
+# Ratings can only be in this set
+VALID_RATINGS = {0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0}
+
+# Indexes created on every collection before it is swapped in
+COLLECTION_INDEXES = {
+    "Movie": [
+        "tmdbId",
+        "movieId",
+        # multikey, movies by production country/company (query9, QueryTasks.movies_by_production)
+        [("countryCodes", 1), ("vote_count", -1)],
+        [("companyIds", 1), ("vote_count", -1)],
+        # NB: very important to create index if we do text search (see task 7)
+        [("overview", "text"), ("tagline", "text"), ("keywords", "text")],
+    ],
+    "Credits": ["tmdbId", "movie.vote_count"],
+    "Ratings": ["movieId"],
+    "Users": ["userId"],
+    "UserStats": [(["userId"], {"unique": True})],
+    "RatingBuckets": [[("userId", 1), ("start", 1)]],
+    # inverted index of Movie text, one document per term and part (see term_index.py)
+    "Terms": [([("term", 1), ("part", 1)], {"unique": True})],
+    # (keys, options) pairs are created with the options, e.g. partial indexes
+    "People": [
+        "personId",
+        ([("director.medianRevenue", -1)], {"partialFilterExpression": {"director.movieCount": {"$gt": 5}}}),
+        ([("actor.genreCount", -1), ("actor.movieCount", -1)],
+         {"partialFilterExpression": {"actor.movieCount": {"$gt": 10}}}),
+        "collaborations.meanVote",
+    ],
+}
+
+# Cleaning stages that can be cached: stage -> (MoviePipeline method, source files)
+CLEAN_STAGES = {
+    "movies": ("clean_movies", ["movies_metadata"]),
+    "links": ("clean_links", ["links"]),
+    "credits": ("clean_credits", ["credits"]),
+    "ratings": ("clean_ratings", ["ratings"]),
+    "keywords": ("clean_keywords", ["keywords"]),
+}
+
+# Compact dtypes used when reading ratings.csv
+RATINGS_DTYPES = {"userId": "int32", "movieId": "int32", "rating": "float32", "timestamp": "int64"}
+
+# Dtype policy per cleaned frame, applied by compact_frame:
+# - category: low-cardinality or repeated strings (person names are dictionary-encoded)
+# - integer:  downcast to the smallest int dtype that holds the values (nullable stays nullable)
+# - float:    float32, only where every value is exactly representable
+# Money columns (budget, revenue) stay int64 so sums cannot overflow.
+FRAME_DTYPES = {
+    "movies": {
+        "category": ["original_language", "status"],
+        "integer": ["tmdbId", "imdbId"],
+        "float": ["runtime", "vote_count"],
+    },
+    "links": {"integer": ["movieId", "imdbId", "tmdbId"]},
+    "cast": {"category": ["name"], "integer": ["tmdbId", "person_id", "gender", "order"]},
+    "crew": {"category": ["name", "department", "job"], "integer": ["tmdbId", "person_id", "gender"]},
+    "keywords": {"category": ["name"], "integer": ["tmdbId", "id"]},
+}
+
+
+# Company names that stand for a country but are not spelled like any production_countries name
+# (TMDB calls the US "United States of America"), normalized name -> ISO 3166-1 code
+COUNTRY_ALIASES = {
+    "united states": "US",
+    "usa": "US",
+    "u.s.a.": "US",
+    "united kingdom": "GB",
+    "uk": "GB",
+}
 
 
 def normalize_term(s: str) -> str:
@@ -38,16 +97,204 @@ def normalize_id(s: pd.Series) -> pd.Series:
     return pd.to_numeric(cleaned, errors='coerce').astype('Int64')
 
 
+def group_records(df, key, columns, name):
+    """
+    Group rows into one list of sub-documents per key, in the order the rows appear.
+
+    Rows are sorted by key once (stable) and the records are sliced on the group
+    boundaries, so there is no Python call per row. person_id becomes id.
+    """
+    df = df.sort_values(key, kind="stable").reset_index(drop=True)
+    records = df[columns].rename(columns={"person_id": "id"}).to_dict("records")
+
+    keys = df[key].to_numpy()
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], starts)) if len(keys) else starts
+    ends = np.append(starts[1:], len(keys))
+
+    return pd.DataFrame({
+        key: df[key].iloc[starts].reset_index(drop=True),
+        name: [records[a:b] for a, b in zip(starts, ends)],
+    })
+
+
+def genre_names(genres):
+    if not isinstance(genres, list):
+        return []
+    return [d.get("name") for d in genres if isinstance(d, dict) and "name" in d]
+
+
+def production_codes(companies, countries):
+    """
+    Normalized production fields of every movie: ISO 3166-1 country codes and company ids.
+
+    Companies named after a country (e.g. "United States") also count for that country,
+    names are mapped to codes with COUNTRY_ALIASES and the name/code pairs found in
+    production_countries.
+    Returns (country_codes, company_ids), one sorted list per movie.
+    """
+    code_of = dict(COUNTRY_ALIASES)
+    for movie_countries in countries:
+        for c in movie_countries if isinstance(movie_countries, list) else []:
+            if isinstance(c, dict) and isinstance(c.get("iso_3166_1"), str) and isinstance(c.get("name"), str):
+                code_of.setdefault(normalize_term(c["name"]), c["iso_3166_1"].strip().upper())
+
+    country_codes, company_ids = [], []
+    for movie_companies, movie_countries in zip(companies, countries):
+        movie_companies = [c for c in movie_companies if isinstance(c, dict)] if isinstance(movie_companies, list) else []
+        movie_countries = [c for c in movie_countries if isinstance(c, dict)] if isinstance(movie_countries, list) else []
+
+        codes = {c["iso_3166_1"].strip().upper() for c in movie_countries if isinstance(c.get("iso_3166_1"), str)}
+        codes |= {code_of[normalize_term(c["name"])] for c in movie_companies
+                  if isinstance(c.get("name"), str) and normalize_term(c["name"]) in code_of}
+        ids = set()
+        for c in movie_companies:
+            company_id = c.get("id")
+            if isinstance(company_id, str) and company_id.strip().isdigit():
+                company_id = int(company_id)
+            if isinstance(company_id, (int, float)) and not isinstance(company_id, bool) and company_id == company_id:
+                ids.add(int(company_id))
+
+        country_codes.append(sorted(codes))
+        company_ids.append(sorted(ids))
+    return country_codes, company_ids
+
+
+def genre_bitmasks(genres):
+    """
+    Encode the genre names of every movie as a bitmask, one row per movie.
+    Rows have one uint64 word per 64 distinct genre names.
+    Returns the masks and the genre name of every bit.
+    """
+    names = [genre_names(g) for g in genres]
+    bits = {}
+    for movie_names in names:
+        for name in movie_names:
+            if name is not None and name == name and name not in bits:
+                bits[name] = len(bits)
+
+    masks = np.zeros((len(names), max(1, (len(bits) + 63) // 64)), dtype=np.uint64)
+    for row, movie_names in enumerate(names):
+        for name in movie_names:
+            bit = bits.get(name)
+            if bit is not None:
+                masks[row, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    return masks, list(bits)
+
+
+def mask_names(mask, genre_list):
+    """Genre names of the bits set in one bitmask row"""
+    return [name for bit, name in enumerate(genre_list) if int(mask[bit // 64]) >> (bit % 64) & 1]
+
+
+def popcount(masks):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(masks).astype(np.int64)
+    counts = np.zeros(masks.shape, dtype=np.int64)
+    for bit in range(64):
+        counts += ((masks >> np.uint64(bit)) & np.uint64(1)).astype(np.int64)
+    return counts
+
+
+def discrete_median(values):
+    """
+    Median that is always one of the values (rank ceil(n/2)), like the $median
+    accumulator returns for these group sizes.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[(len(values) + 1) // 2 - 1]
+
+
+def flatten_members(df_credits, column, fields):
+    """
+    One row per cast/crew member with the tmdbId of the movie and the given fields.
+    """
+    rows = [
+        (tmdb_id, *(member.get(f) for f in fields))
+        for tmdb_id, members in zip(df_credits["tmdbId"].tolist(), df_credits[column])
+        for member in members
+        if isinstance(member, dict)
+    ]
+    return pd.DataFrame(rows, columns=["tmdbId", *fields])
+
+
+def compact_frame(df, policy):
+    """
+    Apply a FRAME_DTYPES policy to df (in place) and return it.
+    Columns that are missing or not numeric are left as they are.
+    """
+    for col in policy.get("category", []):
+        if col in df:
+            df[col] = df[col].astype("category")
+    for col in policy.get("integer", []):
+        if col in df and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col in policy.get("float", []):
+        if col in df and pd.api.types.is_float_dtype(df[col]):
+            values = df[col].to_numpy(dtype=np.float64)
+            compact = values.astype(np.float32)
+            if np.array_equal(compact.astype(np.float64), values, equal_nan=True):
+                df[col] = compact
+    return df
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
 def create_coll(self, collection_name):
     collection = self.db.create_collection(collection_name)
     print('Created collection: ', collection)
 
 
 class MoviePipeline:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, cache=None, connection=None):
+        self.connection = connection or DbConnector()
         self.client = self.connection.client
         self.db = self.connection.db
+        self.loader = BulkLoader(self.db)
+        # Optional FrameCache for the cleaned frames
+        self.cache = cache
+        # Frame -> (bytes before, bytes after) the dtype policy, see print_memory_report
+        # (before is None for frames loaded from the frame cache)
+        self.memory = {}
+
+    def compact(self, name, df, policy=None):
+        """Apply the dtype policy of a frame and record its memory before and after"""
+        before = frame_bytes(df)
+        df = compact_frame(df, FRAME_DTYPES[name] if policy is None else policy)
+        self.memory[name] = (before, frame_bytes(df))
+        return df
+
+    def print_memory_report(self):
+        if not self.memory:
+            return
+        print(f"\n{'frame':<12}{'before MB':>12}{'after MB':>12}{'saved':>8}")
+        for name, (before, after) in self.memory.items():
+            if before is None:
+                # loaded from the frame cache, already compact
+                print(f"{name:<12}{'cached':>12}{after / 1024 ** 2:>12.1f}{'-':>8}")
+                continue
+            saved = 1 - after / before if before else 0.0
+            print(f"{name:<12}{before / 1024 ** 2:>12.1f}{after / 1024 ** 2:>12.1f}{saved:>8.0%}")
+
+    def cleaned(self, stage, fingerprints):
+        """
+        Run a clean_* stage, or load its output from the frame cache when its
+        source files and code are unchanged.
+        """
+        method_name, sources = CLEAN_STAGES[stage]
+        build = getattr(self, method_name)
+        if self.cache is None:
+            return build()
+        recorded = set(self.memory)
+        df = self.cache.get_or_build(stage, build, {source: fingerprints[source] for source in sources})
+        if set(self.memory) == recorded:
+            # Not cleaned in this run, report the size of the cached frame
+            self.memory[stage] = (None, frame_bytes(df))
+        return df
 
     def clean_movies(self):
         df_movies = pd.read_csv("movies/movies_metadata.csv",
@@ -78,10 +325,10 @@ class MoviePipeline:
         object_cols = ["belongs_to_collection"]
 
         for col in array_cols:
-            df_movies[col] = df_movies[col].apply(parse_json_list)
+            df_movies[col] = parse_column(df_movies[col], "list")
 
         for col in object_cols:
-            df_movies[col] = df_movies[col].apply(parse_json_obj)
+            df_movies[col] = parse_column(df_movies[col], "obj")
 
         def _sanitize_collection(d):
             if not isinstance(d, dict):
@@ -93,6 +340,10 @@ class MoviePipeline:
 
         df_movies['belongs_to_collection'] = df_movies['belongs_to_collection'].apply(_sanitize_collection)
 
+        # Normalized, indexed production fields (multikey)
+        df_movies['countryCodes'], df_movies['companyIds'] = production_codes(
+            df_movies['production_companies'], df_movies['production_countries'])
+
         # Mapping boolean values
         df_movies['video'] = df_movies['video'].replace('', 'False')
         df_movies['video'] = df_movies['video'].map({'False': False, 'True': True})
@@ -108,7 +359,7 @@ class MoviePipeline:
 
         df_movies = df_movies.rename(columns={'id': 'tmdbId', 'imdb_id': 'imdbId'})
 
-        return df_movies
+        return self.compact("movies", df_movies)
 
     def clean_links(self):
         df_links = pd.read_csv("movies/links.csv", )
@@ -118,28 +369,101 @@ class MoviePipeline:
         df_links = df_links.drop_duplicates(subset=['movieId'])
         # Cast tmdbId to int, as it previously contained NaN which made it a float.
         df_links['tmdbId'] = df_links['tmdbId'].astype('int64')
-        return df_links
+        df_links['imdbId'] = df_links['imdbId'].astype('int64')
+        return self.compact("links", df_links)
 
     def clean_ratings(self):
-        df_ratings = pd.read_csv("movies/ratings.csv")
-        # Ratings can only be in this set
-        valid_ratings = {0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0}
-        # check if it is in this sete
-        df_ratings = df_ratings[df_ratings['rating'].isin(valid_ratings)]
-        df_ratings['timestamp'] = pd.to_datetime(df_ratings['timestamp'], errors='coerce')
+        # Parsed straight into the compact dtypes, so the wide int64/float64 frame never exists
+        try:
+            df_ratings = pd.read_csv("movies/ratings.csv", usecols=list(RATINGS_DTYPES), dtype=RATINGS_DTYPES)
+        except ValueError as e:
+            # A malformed value: parse with default dtypes and drop the bad rows (twice the memory)
+            print(f"Warning: ratings.csv has malformed values, reading it without dtypes. Error: {e}")
+            df_ratings = self._coerce_ratings(pd.read_csv("movies/ratings.csv", usecols=list(RATINGS_DTYPES)))
+        # Size with the default dtypes, computed from the row count (8 bytes per column)
+        before = len(df_ratings) * 8 * len(RATINGS_DTYPES)
+        df_ratings = self._clean_ratings_chunk(df_ratings).reset_index(drop=True)
+        self.memory["ratings"] = (before, frame_bytes(df_ratings))
         return df_ratings
 
+    def _clean_ratings_chunk(self, df_ratings):
+        # check if it is in the set of valid ratings
+        df_ratings = df_ratings[df_ratings['rating'].isin(VALID_RATINGS)].copy()
+        # ratings.csv has epoch seconds
+        df_ratings['timestamp'] = pd.to_datetime(df_ratings['timestamp'], unit='s', errors='coerce')
+        return df_ratings
+
+    def _coerce_ratings(self, df_ratings):
+        """
+        Cast ratings to RATINGS_DTYPES, dropping rows with a malformed or missing
+        value (read_csv with dtype= raises on the first such row).
+        """
+        columns = list(RATINGS_DTYPES)
+        df_ratings = df_ratings[columns].apply(pd.to_numeric, errors="coerce")
+        bad = df_ratings.isna().any(axis=1)
+        if bad.any():
+            print(f"Dropped {int(bad.sum())} malformed ratings rows")
+            df_ratings = df_ratings[~bad]
+        return df_ratings.astype(RATINGS_DTYPES)
+
+    def iter_ratings(self, chunk_size=500000):
+        """
+        Read ratings.csv in bounded chunks, cast each chunk to the compact dtypes and
+        clean it. Malformed rows are dropped per chunk instead of failing the ingest.
+        """
+        reader = pd.read_csv("movies/ratings.csv", usecols=list(RATINGS_DTYPES), chunksize=chunk_size)
+        for df_chunk in reader:
+            yield self._clean_ratings_chunk(self._coerce_ratings(df_chunk))
+
+    def stream_ratings(self, chunk_size=500000, collection_name="Ratings",
+                       keep_columns=("userId", "movieId", "rating")):
+        """
+        Clean and insert ratings chunk by chunk, inserting one chunk while the next is parsed.
+        Only the parsed chunks and their documents are bounded by chunk_size: the returned
+        keep_columns still grow with ratings.csv (about 12 bytes per rating for the default
+        columns, 20 with timestamp). Pass keep_columns=() when nothing else needs them.
+
+        Returns the compact keep_columns (by default the ones needed by build_user_stats).
+        """
+        keep_columns = list(keep_columns)
+        kept = []
+        pending = None
+
+        # A single writer thread keeps at most one chunk in flight
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for df_chunk in self.iter_ratings(chunk_size):
+                if keep_columns:
+                    kept.append(df_chunk[keep_columns])
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(self.insert_documents, collection_name, df_chunk, chunk_size)
+
+            if pending is not None:
+                pending.result()
+
+        if not kept:
+            return pd.DataFrame({col: pd.Series(dtype=RATINGS_DTYPES[col]) for col in keep_columns})
+        return pd.concat(kept, ignore_index=True)
+
     def clean_credits(self):
-        import pandas as pd
         df_credits = pd.read_csv("movies/credits.csv")
+        credits_df, counts = self._clean_credits_chunk(df_credits)
+        self._print_credit_counts(counts)
+        return credits_df
 
+    def _clean_credits_chunk(self, df_credits, record_memory=True):
+        """
+        Clean credit rows into one document per movie with deduplicated cast/crew arrays.
+        All rows of a movie must be in df_credits (duplicates are removed per movie).
+        Returns the documents and the duplicate counts.
+        """
         # Remove entries with no id
         df_credits["id"] = pd.to_numeric(df_credits["id"], errors="coerce").astype("Int64")
         df_credits = df_credits.dropna(subset=["id"]).copy()
 
         # Convert list strings to actual lists (json objects)
-        df_credits["cast"] = df_credits["cast"].apply(parse_json_list)
-        df_credits["crew"] = df_credits["crew"].apply(parse_json_list)
+        df_credits["cast"] = parse_column(df_credits["cast"], "list")
+        df_credits["crew"] = parse_column(df_credits["crew"], "list")
 
         # --- CREW ---
         ex_crew = df_credits.set_index('id')['crew'].explode().rename('crew_dict')
@@ -157,10 +481,10 @@ class MoviePipeline:
 
         # Select and rename columns
         df_crew = df_crew_normalized.rename(columns={"id": "person_id"})
-        df_crew = df_crew[["tmdbId", "person_id", "name", "gender", "department", "job"]].copy()
+        df_crew = df_crew.reindex(columns=["tmdbId", "person_id", "name", "gender", "department", "job"])
 
         df_cast = df_cast_normalized.rename(columns={"id": "person_id"})
-        df_cast = df_cast[["tmdbId", "person_id", "name", "gender", "character", "order"]].copy()
+        df_cast = df_cast.reindex(columns=["tmdbId", "person_id", "name", "gender", "character", "order"])
 
         # Use 'Int64' (nullable integer) for IDs and numeric values
         for col in ["person_id", "gender"]:
@@ -169,56 +493,36 @@ class MoviePipeline:
 
         df_cast["order"] = pd.to_numeric(df_cast["order"], errors="coerce").astype("Int64")
 
+        # Repeated names/jobs as categoricals, the records below share one str per distinct value
+        if record_memory:
+            df_cast = self.compact("cast", df_cast)
+            df_crew = self.compact("crew", df_crew)
+        else:
+            df_cast = compact_frame(df_cast, FRAME_DTYPES["cast"])
+            df_crew = compact_frame(df_crew, FRAME_DTYPES["crew"])
+
         # Deduplication is performed on the primary movie/person/role key
         cast_subset = ["tmdbId", "person_id", "character"]
         crew_subset = ["tmdbId", "person_id", "job", "department"]
 
         # Count all duplicates
-        cast_duplicates = df_cast.duplicated(subset=cast_subset, keep=False).sum() // 2
-        crew_duplicates = df_crew.duplicated(subset=crew_subset, keep=False).sum() // 2
-
-        print(f"Number of cast duplicates: {cast_duplicates}")
-        print(f"Number of crew duplicates: {crew_duplicates}")
+        counts = {
+            "cast_duplicates": int(df_cast.duplicated(subset=cast_subset, keep=False).sum() // 2),
+            "crew_duplicates": int(df_crew.duplicated(subset=crew_subset, keep=False).sum() // 2),
+        }
 
         # Remove all duplicates (keep first)
         before_cast = len(df_cast)
         df_cast = df_cast.drop_duplicates(subset=cast_subset, keep="first").reset_index(drop=True)
-        removed_cast = before_cast - len(df_cast)
-        print(f"Removed {removed_cast} cast entries. {len(df_cast)} remain.")
+        counts["removed_cast"], counts["cast"] = before_cast - len(df_cast), len(df_cast)
 
         before_crew = len(df_crew)
         df_crew = df_crew.drop_duplicates(subset=crew_subset, keep="first").reset_index(drop=True)
-        removed_crew = before_crew - len(df_crew)
-        print(f"Removed {removed_crew} crew entries. {len(df_crew)} remain.")
-
-
-        # Helper function to create the desired dict from a row
-        def create_cast_dict(row):
-            return {
-                'id': row['person_id'],
-                'name': row['name'],
-                'gender': row['gender'],
-                'character': row['character'],
-                'order': row['order']
-            }
+        counts["removed_crew"], counts["crew"] = before_crew - len(df_crew), len(df_crew)
 
-        def create_crew_dict(row):
-            return {
-                'id': row['person_id'],
-                'name': row['name'],
-                'gender': row['gender'],
-                'department': row['department'],
-                'job': row['job']
-            }
-
-        # Apply the helper functions to create a dictionary column for each person
-        df_cast['cast_member'] = df_cast.apply(create_cast_dict, axis=1)
-        df_crew['crew_member'] = df_crew.apply(create_crew_dict, axis=1)
-
-        # Group the dictionary lists
-        # Group the dictionary columns (cast_member/crew_member) into a list for each movie
-        cast_grouped = df_cast.groupby("tmdbId")['cast_member'].apply(list).reset_index(name="cast")
-        crew_grouped = df_crew.groupby("tmdbId")['crew_member'].apply(list).reset_index(name="crew")
+        # Build the nested cast/crew arrays per movie straight from the columns
+        cast_grouped = group_records(df_cast, "tmdbId", ["person_id", "name", "gender", "character", "order"], "cast")
+        crew_grouped = group_records(df_crew, "tmdbId", ["person_id", "name", "gender", "department", "job"], "crew")
 
         # Final merge
         credits_df = cast_grouped.merge(crew_grouped, on="tmdbId", how="outer")
@@ -227,12 +531,80 @@ class MoviePipeline:
         for col in ["cast", "crew"]:
             credits_df[col] = credits_df[col].apply(lambda v: v if isinstance(v, list) else [])
 
-        return credits_df
+        return credits_df, counts
+
+    def _print_credit_counts(self, counts):
+        print(f"Number of cast duplicates: {counts['cast_duplicates']}")
+        print(f"Number of crew duplicates: {counts['crew_duplicates']}")
+        print(f"Removed {counts['removed_cast']} cast entries. {counts['cast']} remain.")
+        print(f"Removed {counts['removed_crew']} crew entries. {counts['crew']} remain.")
+
+    def iter_credits(self, chunk_size=5000):
+        """
+        Read credits.csv in movie-aligned chunks: every chunk holds all rows of its movies.
+        A first pass over the id column finds movies with more than one row, their rows
+        are held back until the last one is read (so they can be deduplicated together).
+        """
+        ids = pd.to_numeric(pd.read_csv("movies/credits.csv", usecols=["id"])["id"], errors="coerce")
+        repeated = ids[ids.duplicated(keep=False) & ids.notna()]
+        last_row = pd.Series(repeated.index, index=repeated.to_numpy()).groupby(level=0).max().to_dict()
+        del ids, repeated
+
+        held = None
+        end = 0
+        for df_chunk in pd.read_csv("movies/credits.csv", chunksize=chunk_size):
+            end += len(df_chunk)
+            if held is not None and len(held):
+                df_chunk = pd.concat([held, df_chunk])
+            chunk_ids = pd.to_numeric(df_chunk["id"], errors="coerce")
+            later = chunk_ids.map(last_row).fillna(-1).to_numpy() >= end
+            held = df_chunk[later]
+            if (~later).any():
+                yield df_chunk[~later]
+        if held is not None and len(held):
+            yield held
+
+    def stream_credits(self, df_movies, chunk_size=5000, collection_name="Credits", keep=False):
+        """
+        Clean credits.csv in movie-aligned chunks and insert the finished Credits documents
+        (with their movie summary) while the next chunk is parsed, so peak memory depends on
+        chunk_size instead of the size of credits.csv.
+
+        Returns the cleaned credits without the summary if keep=True (build_people needs them).
+        """
+        summaries = self.movie_summaries(df_movies)
+        totals = {}
+        kept = []
+        pending = None
+
+        # A single writer thread keeps at most one chunk in flight
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for df_chunk in self.iter_credits(chunk_size):
+                df_chunk, counts = self._clean_credits_chunk(df_chunk, record_memory=False)
+                for name, count in counts.items():
+                    totals[name] = totals.get(name, 0) + count
+                if keep:
+                    kept.append(df_chunk)
+                df_docs = self.embed_movie_summary(df_chunk, summaries=summaries)
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(self.insert_documents, collection_name, df_docs, chunk_size)
+
+            if pending is not None:
+                pending.result()
+
+        if totals:
+            self._print_credit_counts(totals)
+        if not keep:
+            return None
+        if not kept:
+            return pd.DataFrame({"tmdbId": pd.Series(dtype="Int64"), "cast": [], "crew": []})
+        return pd.concat(kept, ignore_index=True)
 
     def clean_keywords(self):
         df_keywords = pd.read_csv("movies/keywords.csv")
 
-        df_keywords["keywords"] = df_keywords["keywords"].apply(parse_json_list)
+        df_keywords["keywords"] = parse_column(df_keywords["keywords"], "list")
 
         ex_keywords = (
             df_keywords[["id", "keywords"]]
@@ -253,7 +625,7 @@ class MoviePipeline:
 
         # Types and validation
         df_keywords["id"] = pd.to_numeric(df_keywords["id"], errors="coerce").astype("Int64")
-        df_keywords["name"] = df_keywords["name"].astype("string")
+        df_keywords = self.compact("keywords", df_keywords)
 
         # Removing duplicates, defining dedupe keys
         keywords_subset = ["tmdbId", "id", "name"]
@@ -292,23 +664,21 @@ class MoviePipeline:
         df_movies = df_movies.merge(df_links, on=['tmdbId'], how='left')
         return df_movies
 
-    def build_user_stats(self, df_movies, df_ratings):
+    def user_aggregates(self, df_movies, df_ratings):
         """
-        Compute per-user rating statistics and genre diversity using pandas.
+        Per-user rating count, mean and variance (unrounded, every user) and the
+        OR of the genre bitmasks of the movies each user rated.
+        Returns (user_stats, user_masks, genre_list), user_masks rows follow user_stats.
         """
-        # 1) Keep only required columns
-        df_movies = df_movies[["movieId", "genres"]].copy()
-        df_ratings = df_ratings[["userId", "movieId", "rating"]].copy()
+        # 1) Keep only required columns, genres as one bitmask per movie
+        masks, genre_list = genre_bitmasks(df_movies["genres"])
+        df_movies = pd.DataFrame({"movieId": df_movies["movieId"].to_numpy(), "mask_row": np.arange(len(df_movies))})
+        # Statistics are computed in float64 whatever the stored rating dtype
+        df_ratings = df_ratings[["userId", "movieId", "rating"]].astype({"rating": "float64"})
 
-        # 2)  Merge ratings and genres
+        # 2)  Merge ratings and genre bitmask rows (movies without a match get no genres)
         merged = df_ratings.merge(df_movies, on="movieId", how="left")
 
-        # Clean genres into name lists
-        merged["genres"] = merged["genres"].apply(
-            lambda g: [d.get("name") for d in g if isinstance(d, dict) and "name" in d]
-            if isinstance(g, list) else []
-        )
-
         # 3) Compute per-user stats
         user_stats = (
             merged.groupby("userId")["rating"]
@@ -317,19 +687,29 @@ class MoviePipeline:
             .reset_index()
         )
 
-        # 4) Count distinct genres
-        exploded = merged.explode("genres", ignore_index=True)
-        genre_counts = (
-            exploded.dropna(subset=["genres"])
-            .groupby("userId")["genres"]
-            .nunique()
-            .reset_index(name="distinctGenres")
-        )
+        # 4) OR the bitmasks of each user's ratings
+        mask_rows = merged["mask_row"].to_numpy()
+        rating_masks = np.zeros((len(merged), masks.shape[1]), dtype=np.uint64)
+        matched = ~np.isnan(mask_rows)
+        rating_masks[matched] = masks[mask_rows[matched].astype(np.int64)]
+
+        order = np.argsort(merged["userId"].to_numpy(), kind="stable")
+        user_ids = merged["userId"].to_numpy()[order]
+        starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]]) if len(order) else order
+        user_masks = np.bitwise_or.reduceat(rating_masks[order], starts, axis=0) if len(order) else rating_masks
+        return user_stats, user_masks, genre_list
+
+    def build_user_stats(self, df_movies, df_ratings):
+        """
+        Compute per-user rating statistics and genre diversity using pandas.
+        Genres are encoded as a bitmask per movie, so distinct genres per user are a
+        group-wise bitwise OR and a popcount instead of exploding every rating.
+        """
+        user_stats, user_masks, _ = self.user_aggregates(df_movies, df_ratings)
+        user_stats["distinctGenres"] = popcount(user_masks).sum(axis=1)
 
-        # 5) Merge both sets of stats
-        df_users = user_stats.merge(
-            genre_counts, on="userId", how="left").fillna({"distinctGenres": 0})
-        df_users = df_users[user_stats["ratingCount"] >= 20].reset_index(drop=True)
+        # 5) Keep users with enough ratings
+        df_users = user_stats[user_stats["ratingCount"] >= 20].reset_index(drop=True)
 
         # 6) Round values
         df_users["ratingVariance"] = df_users["ratingVariance"].round(3)
@@ -338,6 +718,155 @@ class MoviePipeline:
 
         return df_users
 
+    def movie_summaries(self, df_movies):
+        """tmdbId -> small typed summary of the Movie document, see embed_movie_summary"""
+        movies = df_movies.drop_duplicates(subset="tmdbId", keep="first")
+
+        def optional(value, cast):
+            return None if value is None or pd.isna(value) else cast(value)
+
+        return {
+            int(row.tmdbId): {
+                "year": optional(row.release_date, lambda d: pd.Timestamp(d).year),
+                "vote_average": optional(row.vote_average, float),
+                "vote_count": optional(row.vote_count, int),
+                "revenue": optional(row.revenue, int),
+                "genres": genre_names(row.genres),
+            }
+            for row in movies[["tmdbId", "release_date", "vote_average", "vote_count", "revenue", "genres"]]
+            .itertuples(index=False)
+        }
+
+    def embed_movie_summary(self, df_credits, df_movies=None, summaries=None):
+        """
+        Embed a small typed summary of the Movie document (year, vote stats, revenue,
+        genre names) into every Credits document, so the queries on Credits do not
+        have to $lookup Movie. Credits without a movie get movie = None.
+        summaries from movie_summaries can be passed instead of df_movies.
+        """
+        if summaries is None:
+            summaries = self.movie_summaries(df_movies)
+
+        df_credits = df_credits.copy()
+        df_credits["movie"] = [summaries.get(int(t)) for t in df_credits["tmdbId"]]
+        return df_credits
+
+    def build_user_state(self, df_movies, df_ratings):
+        """
+        Mergeable statistics per user (count, mean, M2 and genre names) for every
+        user, used by UserStatsUpdater to apply new ratings without a full recompute.
+        """
+        user_stats, user_masks, genre_list = self.user_aggregates(df_movies, df_ratings)
+        return pd.DataFrame({
+            "userId": user_stats["userId"],
+            "count": user_stats["ratingCount"],
+            "mean": user_stats["ratingMean"],
+            # M2 = sum of squared differences from the mean
+            "m2": (user_stats["ratingVariance"] * (user_stats["ratingCount"] - 1)).fillna(0.0),
+            "genres": [mask_names(mask, genre_list) for mask in user_masks],
+        })
+
+    def build_people(self, df_movies, df_credits):
+        """
+        Build one document per person id with the movie data the director/actor
+        queries need, so they do not have to unwind Credits and join Movie.
+        """
+        # 1) Movie fields used by the queries
+        movies = df_movies[["tmdbId", "revenue", "vote_average", "vote_count", "genres"]].copy()
+        movies["tmdbId"] = movies["tmdbId"].astype("int64")
+        movies["genre_names"] = movies["genres"].map(genre_names)
+
+        # 2) One row per cast/crew member
+        crew = flatten_members(df_credits, "crew", ["id", "name", "job"]).rename(columns={"id": "person_id"})
+        cast = flatten_members(df_credits, "cast", ["id", "name"]).rename(columns={"id": "person_id"})
+        crew = crew.dropna(subset=["person_id"]).astype({"tmdbId": "int64", "person_id": "int64"})
+        cast = cast.dropna(subset=["person_id"]).astype({"tmdbId": "int64", "person_id": "int64"})
+
+        # 3) All people with their movies and roles
+        roles = pd.concat([
+            crew[["person_id", "name", "tmdbId", "job"]],
+            cast[["person_id", "name", "tmdbId"]].assign(job="Actor"),
+        ], ignore_index=True)
+        people = (
+            roles.groupby("person_id")
+            .agg(name=("name", "first"),
+                 movies=("tmdbId", lambda s: sorted(set(s.tolist()))),
+                 roles=("job", lambda s: sorted(set(s.dropna().tolist()))))
+            .reset_index()
+            .rename(columns={"person_id": "personId"})
+        )
+
+        # 4) Director stats (only movies that exist in Movie)
+        directors = crew[crew["job"] == "Director"].merge(movies, on="tmdbId", how="inner")
+        director_stats = directors.groupby("person_id").agg(
+            movieCount=("tmdbId", "size"),
+            movies=("tmdbId", lambda s: s.tolist()),
+            revenues=("revenue", lambda s: s.tolist()),
+            voteAverages=("vote_average", lambda s: s.tolist()),
+        )
+        director_docs = {
+            person_id: {
+                "movieCount": int(row.movieCount),
+                "medianRevenue": discrete_median(row.revenues),
+                "avgVote": float(np.nanmean(row.voteAverages)) if row.voteAverages else None,
+                "movies": row.movies,
+                "revenues": row.revenues,
+                "voteAverages": row.voteAverages,
+            }
+            for person_id, row in director_stats.iterrows()
+        }
+
+        # 5) Actor genre breadth (only movies that exist in Movie and have genres)
+        actors = cast.merge(movies, on="tmdbId", how="inner")
+        actors = actors[actors["genre_names"].map(len) > 0]
+        actor_stats = actors.groupby("person_id").agg(
+            movies=("tmdbId", lambda s: sorted(set(s.tolist()))),
+            genres=("genre_names", lambda s: sorted({g for names in s for g in names})),
+        )
+        actor_docs = {
+            person_id: {
+                "movieCount": len(row.movies),
+                "genreCount": len(row.genres),
+                "genres": row.genres,
+            }
+            for person_id, row in actor_stats.iterrows()
+        }
+
+        # 6) Director-actor pairs with >= 3 movies that have >= 100 votes
+        popular = movies[movies["vote_count"] >= 100][["tmdbId", "vote_average", "revenue"]]
+        pairs = (
+            crew[crew["job"] == "Director"][["tmdbId", "person_id", "name"]]
+            .rename(columns={"person_id": "directorId", "name": "director"})
+            .merge(popular, on="tmdbId", how="inner")
+            .merge(cast[["tmdbId", "person_id", "name"]].rename(columns={"person_id": "actorId", "name": "actor"}),
+                   on="tmdbId", how="inner")
+            .drop_duplicates(subset=["directorId", "director", "actorId", "actor", "tmdbId"])
+        )
+        pair_stats = (
+            pairs.groupby(["directorId", "director", "actorId", "actor"], dropna=False)
+            .agg(filmCount=("tmdbId", "size"), meanVote=("vote_average", "mean"), meanRevenue=("revenue", "mean"))
+            .reset_index()
+        )
+        pair_stats = pair_stats[pair_stats["filmCount"] >= 3]
+        collaborations = {}
+        for row in pair_stats.itertuples(index=False):
+            collaborations.setdefault(row.directorId, []).append({
+                "director": row.director,
+                "actorId": int(row.actorId),
+                "actor": row.actor,
+                "filmCount": int(row.filmCount),
+                "meanVote": float(row.meanVote),
+                "meanRevenue": float(row.meanRevenue),
+            })
+
+        # 7) Attach the role documents
+        people["director"] = [director_docs.get(p) for p in people["personId"]]
+        people["actor"] = [actor_docs.get(p) for p in people["personId"]]
+        people["collaborations"] = [collaborations.get(p, []) for p in people["personId"]]
+
+        print(f"Built {len(people)} people, {len(director_docs)} directors, {len(actor_docs)} actors")
+        return people
+
 
     def create_coll(self, collection_name):
         existing = self.db.list_collection_names()
@@ -353,69 +882,162 @@ class MoviePipeline:
         collection.drop()
 
     def insert_documents(self, collection_name, df, chunk_size=100000):
-        collection = self.db[collection_name]
+        # Batches are converted and inserted in parallel by the bulk loader
+        return self.loader.load(collection_name, df, batch_size=chunk_size)
 
-        total_inserted = 0
-        total_rows = len(df)
+    def staging_name(self, collection_name):
+        return f"{collection_name}_staging"
 
-        for i in range(0, total_rows, chunk_size):
-            df_chunk = df.iloc[i:i + chunk_size]
-            documents = df_chunk.to_dict("records")
+    def prepare_staging(self, collection_name):
+        staging = self.staging_name(collection_name)
+        self.drop_coll(staging)
+        self.create_coll(staging)
+        # Fresh loader stats, check_staging compares them with what this load wrote
+        self.loader.stats.pop(staging, None)
+        return staging
 
-            try:
-                collection.insert_many(documents)
-                total_inserted += len(documents)
-                print(
-                    f" -> Inserted batch {i // chunk_size + 1} to {collection_name}. Total documents inserted: {total_inserted}/{total_rows}")
-            except Exception as e:
-                print(f"Warning: Failed to insert batch starting at index {i}. Error: {e}")
+    def check_staging(self, collection_name, expected=None):
+        """
+        Raise if the load into the staging collection lost documents: a failed batch,
+        fewer stored documents than inserted, or fewer than expected (when known).
+        The staging collection is kept for inspection and the live one is untouched.
+        """
+        staging = self.staging_name(collection_name)
+        stats = self.loader.stats.get(staging, {"documents": 0, "failed_batches": 0})
+        stored = self.db[staging].count_documents({})
+        if stats["failed_batches"] or stored != stats["documents"] or (expected is not None and stored != expected):
+            raise RuntimeError(
+                f"Incomplete load of {collection_name}: {stored} documents stored, "
+                f"{expected if expected is not None else stats['documents']} expected, "
+                f"{stats['failed_batches']} failed batches. {staging} was not swapped in"
+            )
+
+    def swap_in(self, collection_name, expected=None):
+        """
+        Check the staging collection was loaded completely, create its indexes and
+        rename it over the live one, so readers never see a half-loaded collection.
+        """
+        self.check_staging(collection_name, expected)
+        staging = self.staging_name(collection_name)
+        for spec in COLLECTION_INDEXES[collection_name]:
+            keys, options = spec if isinstance(spec, tuple) else (spec, {})
+            self.db[staging].create_index(keys, **options)
+        self.db[staging].rename(collection_name, dropTarget=True)
+        print(f"Swapped {staging} in as {collection_name}")
+
+    def load_collection(self, collection_name, df):
+        staging = self.prepare_staging(collection_name)
+        self.insert_documents(staging, df)
+        self.swap_in(collection_name, expected=len(df))
 
     def show_coll(self):
-        collections = self.client['movie_db'].list_collection_names()
+        collections = self.db.list_collection_names()
         print(collections)
 
 
-def main():
+def main(stream_ratings=False, ratings_chunk_size=500000, force=False,
+         use_cache=True, rebuild_cache=False, cache_dir=".frame_cache", ratings_layout="documents",
+         stream_credits=False, credits_chunk_size=5000):
+    """
+    Rebuild the collections whose source files changed since their last load.
+    Every collection is loaded into a staging collection and renamed over the live one.
+    force=True rebuilds everything. Cleaned frames are cached in cache_dir unless
+    use_cache=False, rebuild_cache=True re-cleans and overwrites the cached frames.
+    ratings_layout is "documents" (Ratings, one document per rating), "buckets"
+    (RatingBuckets, one document per user and year) or "both".
+    stream_credits=True cleans and inserts credits.csv in movie-aligned chunks of
+    credits_chunk_size rows instead of cleaning the whole file first.
+    """
     program = None
     try:
-        program = MoviePipeline()
-
-        program.drop_coll(collection_name="Movie")
-        program.drop_coll(collection_name="Credits")
-        program.drop_coll(collection_name="Ratings")
-        program.drop_coll(collection_name="Users")
-
-        program.create_coll(collection_name="Movie")
-        program.create_coll(collection_name="Credits")
-        program.create_coll(collection_name="Ratings")
-        program.create_coll(collection_name="Users")
-
-        df_movies = program.clean_movies()
-        df_links = program.clean_links()
-        df_credits = program.clean_credits()
-        df_ratings = program.clean_ratings()
-        df_keywords = program.clean_keywords()
-
-        df_movies = program.merge_movies_and_links(df_movies, df_links)
-        df_movies = program.merge_keywords(df_movies, df_keywords)
-
-        df_users = program.build_user_stats(df_movies, df_ratings)
-        program.insert_documents("Movie", df_movies)
-        program.insert_documents("Credits", df_credits)
-        program.insert_documents("Ratings", df_ratings)
-        program.insert_documents("Users", df_users)
-
-        print("started creating index")
-        program.db.Movie.create_index("tmdbId")
-        program.db.Credits.create_index("tmdbId")
-        program.db.Ratings.create_index("movieId")
-        program.db.Movie.create_index("movieId")
-
-        # NB: very important to create index if we do text search (see task 7)
-        program.db.Movie.create_index([("overview", "text"), ("tagline", "text"), ("keywords", "text")])
-
-        print("finished creating index")
-
+        cache = FrameCache(cache_dir, rebuild=rebuild_cache) if use_cache else None
+        program = MoviePipeline(cache=cache)
+
+        fingerprints = source_fingerprints()
+        rebuild = changed_collections(program.db, fingerprints, force=force)
+
+        # Only the ratings layouts that were asked for
+        layouts = {"documents": ["Ratings"], "buckets": ["RatingBuckets"], "both": ["Ratings", "RatingBuckets"]}
+        skipped = {"Ratings", "RatingBuckets"} - set(layouts[ratings_layout])
+        rebuild = [name for name in rebuild if name not in skipped]
+        if not rebuild:
+            print("All source files are unchanged, nothing to do")
+            return
+        print("Rebuilding collections:", rebuild)
+
+        # Users and UserStats are always rebuilt together
+        if {"Users", "UserStats"} & set(rebuild):
+            rebuild = sorted(set(rebuild) | {"Users", "UserStats"})
+        need_movies = any(name in rebuild for name in ["Movie", "Terms", "Credits", "Users", "People"])
+        need_ratings = "Ratings" in rebuild or "Users" in rebuild or "RatingBuckets" in rebuild
+
+        df_movies = None
+        if need_movies:
+            df_movies = program.cleaned("movies", fingerprints)
+            df_links = program.cleaned("links", fingerprints)
+            df_movies = program.merge_movies_and_links(df_movies, df_links)
+            if "Movie" in rebuild or "Terms" in rebuild:
+                df_keywords = program.cleaned("keywords", fingerprints)
+                df_movies = program.merge_keywords(df_movies, df_keywords)
+
+        if stream_credits and "Credits" in rebuild:
+            # Credits documents are inserted while credits.csv is read, kept only if People needs them
+            staging = program.prepare_staging("Credits")
+            df_credits = program.stream_credits(df_movies, credits_chunk_size, collection_name=staging,
+                                                keep="People" in rebuild)
+            program.swap_in("Credits")
+            save_fingerprints(program.db, "Credits", fingerprints)
+            if "People" in rebuild:
+                program.load_collection("People", program.build_people(df_movies, df_credits))
+                save_fingerprints(program.db, "People", fingerprints)
+            del df_credits
+        elif "Credits" in rebuild or "People" in rebuild:
+            # Credits carry a summary of their Movie, so they are reloaded with Movie
+            df_credits = program.embed_movie_summary(program.cleaned("credits", fingerprints), df_movies)
+            if "Credits" in rebuild:
+                program.load_collection("Credits", df_credits)
+                save_fingerprints(program.db, "Credits", fingerprints)
+            if "People" in rebuild:
+                program.load_collection("People", program.build_people(df_movies, df_credits))
+                save_fingerprints(program.db, "People", fingerprints)
+            del df_credits
+
+        df_ratings = None
+        if need_ratings:
+            if stream_ratings and "Ratings" in rebuild:
+                # Ratings are inserted while they are read, only the columns for user stats are kept
+                staging = program.prepare_staging("Ratings")
+                keep = ["userId", "movieId", "rating"] if "Users" in rebuild or "RatingBuckets" in rebuild else []
+                keep += ["timestamp"] if "RatingBuckets" in rebuild else []
+                df_ratings = program.stream_ratings(ratings_chunk_size, collection_name=staging, keep_columns=keep)
+                program.swap_in("Ratings")
+            else:
+                df_ratings = program.cleaned("ratings", fingerprints)
+                if "Ratings" in rebuild:
+                    program.load_collection("Ratings", df_ratings)
+            if "Ratings" in rebuild:
+                save_fingerprints(program.db, "Ratings", fingerprints)
+            if "RatingBuckets" in rebuild:
+                program.load_collection("RatingBuckets", build_buckets(df_ratings))
+                save_fingerprints(program.db, "RatingBuckets", fingerprints)
+
+        if "Users" in rebuild:
+            df_users = program.build_user_stats(df_movies, df_ratings)
+            program.load_collection("Users", df_users)
+            save_fingerprints(program.db, "Users", fingerprints)
+            program.load_collection("UserStats", program.build_user_state(df_movies, df_ratings))
+            save_fingerprints(program.db, "UserStats", fingerprints)
+
+        if "Movie" in rebuild:
+            program.load_collection("Movie", df_movies)
+            save_fingerprints(program.db, "Movie", fingerprints)
+
+        if "Terms" in rebuild:
+            program.load_collection("Terms", build_term_index(df_movies))
+            save_fingerprints(program.db, "Terms", fingerprints)
+
+        program.loader.print_stats()
+        program.print_memory_report()
         program.show_coll()
     except Exception as e:
         print("ERROR: Failed to use database:", e)
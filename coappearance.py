@@ -0,0 +1,178 @@
+import heapq
+from operator import itemgetter
+
+import numpy as np
+
+# Person ids are packed into one int64 key as (smaller id << 32) | larger id
+_ID_BITS = 32
+
+
+class CoAppearanceCounter:
+    """
+    Counts how often two actors appear in the same movie, with compact storage.
+
+    Casts are kept as flat numpy arrays (ids, votes, offsets per movie). Pairs are
+    generated per batch of movies with packed integer keys, and counted/summed with
+    numpy instead of a dict with one entry per pair.
+
+    Modes of top_pairs:
+    - "exact":     count every pair in one pass
+    - "two-pass":  count keys batch by batch first, then only keep the pairs that
+                   reach the minimum when summing votes
+    - "count-min": like two-pass, but the first pass is a fixed size count-min sketch
+                   (never underestimates, so no pair that reaches the minimum is lost)
+
+    All modes return the same pairs, in the same order, as summing in a dict.
+
+    Example:
+    counter = CoAppearanceCounter()
+    counter.add_cursor(cursor)
+    counter.top_pairs(minimum=3, limit=10)
+    """
+
+    def __init__(self):
+        self._ids = []
+        self._names = []
+        self._sizes = []
+        self._votes = []
+        self.ids = None
+        self.offsets = None
+        self.votes = None
+        self._triu = {}
+
+    def add_movie(self, cast, vote):
+        self._ids.extend(actor['id'] for actor in cast)
+        self._names.extend(actor['name'] for actor in cast)
+        self._sizes.append(len(cast))
+        self._votes.append(vote)
+
+    def add_cursor(self, cursor):
+        for movie_doc in cursor:
+            self.add_movie(movie_doc.get('cast', []), movie_doc.get('vote', 0.0))
+        self._freeze()
+        return self
+
+    def _freeze(self):
+        self.ids = np.asarray(self._ids, dtype=np.int64)
+        self.names = self._names
+        self.offsets = np.concatenate(([0], np.cumsum(self._sizes, dtype=np.int64)))
+        self.votes = np.asarray(self._votes, dtype=np.float64)
+        if len(self.ids) and (self.ids.min() < 0 or self.ids.max() >= 1 << _ID_BITS):
+            raise ValueError("person ids must fit in 32 bits to be packed")
+        self._ids = []
+
+    def _pairs(self, start, stop):
+        """
+        Pairs of the movies in [start, stop), in the order itertools.combinations gives them.
+        Returns packed keys, the flat position of the first/second name and the vote.
+        """
+        pos_a, pos_b, movie = [], [], []
+        for m in range(start, stop):
+            offset = self.offsets[m]
+            n = int(self.offsets[m + 1] - offset)
+            if n < 2:
+                continue
+            if n not in self._triu:
+                self._triu[n] = np.triu_indices(n, 1)
+            i, j = self._triu[n]
+            pos_a.append(i + offset)
+            pos_b.append(j + offset)
+            movie.append(np.full(len(i), m, dtype=np.int64))
+
+        if not pos_a:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, np.empty(0, dtype=np.float64)
+
+        pos_a = np.concatenate(pos_a)
+        pos_b = np.concatenate(pos_b)
+        id_a, id_b = self.ids[pos_a], self.ids[pos_b]
+
+        # The smaller id (and its name) always comes first
+        swap = id_a > id_b
+        first = np.where(swap, pos_b, pos_a)
+        second = np.where(swap, pos_a, pos_b)
+        keys = (np.minimum(id_a, id_b) << _ID_BITS) | np.maximum(id_a, id_b)
+        return keys, first, second, self.votes[np.concatenate(movie)]
+
+    def _batches(self, batch_movies):
+        for start in range(0, len(self.votes), batch_movies):
+            yield self._pairs(start, min(start + batch_movies, len(self.votes)))
+
+    def _exact_counts(self, minimum, batch_movies):
+        # Merge the unique keys and counts of every batch, integers so order does not matter
+        keys, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        for batch_keys, _, _, _ in self._batches(batch_movies):
+            keys = np.concatenate((keys, batch_keys))
+            counts = np.concatenate((counts, np.ones(len(batch_keys), dtype=np.int64)))
+            keys, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        candidates = keys[counts >= minimum]
+        return lambda k: np.isin(k, candidates, assume_unique=False)
+
+    def _sketch_counts(self, minimum, batch_movies, width, depth):
+        seeds = np.arange(1, depth + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        sketch = np.zeros((depth, width), dtype=np.int32)
+
+        def cells(k):
+            hashed = (k.astype(np.uint64)[None, :] * seeds[:, None]) >> np.uint64(33)
+            return (hashed % np.uint64(width)).astype(np.int64)
+
+        for batch_keys, _, _, _ in self._batches(batch_movies):
+            c = cells(batch_keys)
+            for d in range(depth):
+                np.add.at(sketch[d], c[d], 1)
+
+        def keep(k):
+            c = cells(k)
+            estimate = np.min(np.stack([sketch[d][c[d]] for d in range(depth)]), axis=0)
+            return estimate >= minimum
+        return keep
+
+    def top_pairs(self, minimum=3, limit=10, mode="exact", batch_movies=5000,
+                  sketch_width=1 << 22, sketch_depth=4):
+        if self.ids is None:
+            self._freeze()
+
+        if mode == "exact":
+            keep = None
+        elif mode == "two-pass":
+            keep = self._exact_counts(minimum, batch_movies)
+        elif mode == "count-min":
+            keep = self._sketch_counts(minimum, batch_movies, sketch_width, sketch_depth)
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+        # Keep the pair rows (filtered by the first pass) in movie order
+        parts = []
+        for keys, first, second, votes in self._batches(batch_movies):
+            if keep is not None:
+                mask = keep(keys)
+                keys, first, second, votes = keys[mask], first[mask], second[mask], votes[mask]
+            parts.append((keys, first, second, votes))
+
+        if not parts or not sum(len(p[0]) for p in parts):
+            return []
+        keys, first, second, votes = (np.concatenate(col) for col in zip(*parts))
+
+        # Votes are summed in movie order so averages are bit-identical to a running sum
+        unique, first_index, inverse, counts = np.unique(
+            keys, return_index=True, return_inverse=True, return_counts=True)
+        sums = np.bincount(inverse, weights=votes, minlength=len(unique))
+
+        # Walk the qualifying pairs in order of first appearance (dict insertion order)
+        qualifying = np.flatnonzero(counts >= minimum)
+        qualifying = qualifying[np.argsort(first_index[qualifying], kind="stable")]
+
+        results = []
+        for u in qualifying:
+            row = first_index[u]
+            count = int(counts[u])
+            results.append({
+                'actor1': self.names[first[row]],
+                'actor2': self.names[second[row]],
+                'co_appearances': count,
+                'avg_vote': round(float(sums[u]) / count, 2)
+            })
+
+        # Same as a stable sort by (co_appearances, avg_vote) descending
+        return heapq.nlargest(limit, results, key=itemgetter('co_appearances', 'avg_vote'))
@@ -0,0 +1,158 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional, frames are pickled without it
+    pa = None
+    feather = None
+
+# Bump to invalidate every cached frame, e.g. after changing how frames are stored
+CACHE_VERSION = 2
+
+# Schema metadata key listing the object columns of a frame stored as Arrow
+OBJECT_COLUMNS_KEY = b"frame_cache.object_columns"
+
+# Modules whose code shapes the cleaned frames besides the module of the clean_* method
+# (helpers, dtype policies), their source is part of every key
+CODE_MODULES = ["literal_parser"]
+
+
+class FrameCache:
+    """
+    Local artifact cache for cleaned DataFrames.
+
+    Frames are stored as Arrow IPC (feather) files, which keep nested list/dict columns
+    and are read back without pickle's per-object overhead. Object columns come back as
+    object columns with None for missing values (Arrow would turn a column of Timestamps
+    and None into datetime64 with NaT, which BSON cannot encode). Frames Arrow cannot
+    represent are pickled.
+    The key of an artifact is the stage name, the fingerprints of its source files and
+    the source code of the module defining the cleaning function plus CODE_MODULES, so
+    editing a clean_* method, a helper it calls (e.g. compact_frame, FRAME_DTYPES,
+    literal_parser) or a CSV invalidates it. The least recently used artifacts are evicted above max_bytes.
+
+    Example:
+    cache = FrameCache(".frame_cache", max_bytes=5 * 1024 ** 3)
+    df_credits = cache.get_or_build("credits", program.clean_credits, {"credits": "12:ab.."})
+    """
+
+    def __init__(self, cache_dir=".frame_cache", max_bytes=5 * 1024 ** 3, rebuild=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rebuild = rebuild
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, stage, build_fn, fingerprints):
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_VERSION}:{stage}".encode())
+        for name in sorted(fingerprints):
+            digest.update(f"{name}={fingerprints[name]}".encode())
+        digest.update(getattr(build_fn, "__qualname__", repr(build_fn)).encode())
+        modules = [inspect.getmodule(build_fn)] + [importlib.import_module(name) for name in CODE_MODULES]
+        for module in modules:
+            try:
+                digest.update(inspect.getsource(module).encode())
+            except (OSError, TypeError):
+                digest.update(repr(module).encode())
+        return f"{stage}-{digest.hexdigest()[:16]}"
+
+    def get_or_build(self, stage, build_fn, fingerprints):
+        key = self.key(stage, build_fn, fingerprints)
+
+        if not self.rebuild:
+            df = self._read(key)
+            if df is not None:
+                print(f"Loaded {stage} from cache ({key})")
+                return df
+
+        df = build_fn()
+        self._write(key, df)
+        self.evict()
+        return df
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+
+    def _read(self, key):
+        arrow_path = self._path(key, "arrow")
+        pickle_path = self._path(key, "pkl")
+
+        if feather is not None and os.path.exists(arrow_path):
+            os.utime(arrow_path)
+            table = feather.read_table(arrow_path)
+            df = table.to_pandas()
+            # object column -> its missing value in the cleaned frame ("none" or "nan")
+            object_columns = json.loads((table.schema.metadata or {}).get(OBJECT_COLUMNS_KEY, b"{}"))
+            for i, field in enumerate(table.schema):
+                if pa.types.is_nested(field.type):
+                    # Arrow gives nested columns back as numpy arrays, restore plain Python lists/dicts
+                    df[field.name] = pd.Series(table.column(i).to_pylist(), index=df.index, dtype=object)
+                elif field.name in object_columns:
+                    # e.g. datetime64/NaT or bool/None, back to the objects of the cleaned frame
+                    missing = None if object_columns[field.name] == "none" else float("nan")
+                    column = df[field.name]
+                    df[field.name] = column.astype(object).where(column.notna(), missing)
+            return df
+
+        if os.path.exists(pickle_path):
+            os.utime(pickle_path)
+            with open(pickle_path, "rb") as f:
+                return pickle.load(f)
+        return None
+
+    def _write(self, key, df):
+        if feather is not None:
+            tmp = self._path(key, "arrow.tmp")
+            try:
+                df = df.reset_index(drop=True)
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                object_columns = {}
+                for c in df.columns:
+                    if df[c].dtype == object:
+                        missing = df[c][df[c].isna()]
+                        object_columns[str(c)] = "nan" if len(missing) and missing.iloc[0] is not None else "none"
+                metadata = {**(table.schema.metadata or {}), OBJECT_COLUMNS_KEY: json.dumps(object_columns).encode()}
+                feather.write_feather(table.replace_schema_metadata(metadata), tmp, compression="uncompressed")
+                os.replace(tmp, self._path(key, "arrow"))
+                return
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                print(f"Warning: cannot store {key} as Arrow, pickling it instead. Error: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+        tmp = self._path(key, "pkl.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key, "pkl"))
+
+    def evict(self):
+        """
+        Delete the least recently used artifacts until the cache fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            print(f"Evicted {os.path.basename(path)} from frame cache")
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
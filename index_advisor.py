@@ -0,0 +1,364 @@
+import importlib
+import inspect
+import pkgutil
+import sys
+
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+import pipelines
+from clean import COLLECTION_INDEXES
+from task_runner import run_tasks
+
+# Proposes indexes for the aggregation pipelines in pipelines/ and queries.py.
+#
+# Only what the query layer can use is read: the leading $match/$sort stages (inclusion-only
+# $project stages in between are skipped, the server moves the $match in front of them)
+# and the foreignField of every $lookup. Keys are ordered equality, sort, range (ESR):
+# - compound: several keys from the same pipeline
+# - partial:  a constant range filter in front of a sort on other fields indexes the sort
+#             keys with the filter as partialFilterExpression (like the People indexes)
+# - multikey: keys inside arrays, at most one array per compound index
+#
+# With --build the indexes of each collection are created by one createIndexes command
+# (the server builds them together), collections in parallel, and every index is checked
+# with explain on the pipelines it was proposed for.
+
+# Pipelines in pipelines/ that are not in query2.TASKS: name -> collection
+PIPELINE_COLLECTIONS = {"t4_pipeline": "Movie", "t8_pipeline": "Credits"}
+
+# Arguments for the QueryTasks pipeline builders that take parameters: name -> kwargs.
+# The defaults of a parameterised builder (e.g. an empty $match) are not a real query,
+# builders with parameters that are not listed here are skipped.
+PIPELINE_ARGS = {
+    "query7_pipeline": {},  # the $text form, the Terms form only matches tmdbIds
+    "movies_by_production_pipeline": {"country": "US"},
+}
+
+# Array fields per collection, keys below them make multikey indexes
+ARRAY_FIELDS = {
+    "Movie": {"genres", "production_companies", "production_countries", "spoken_languages", "keywords",
+              "countryCodes", "companyIds"},
+    "Credits": {"cast", "crew", "movie.genres"},
+    "People": {"movies", "roles", "collaborations", "actor.genres", "director.movies",
+               "director.revenues", "director.voteAverages"},
+    "RatingBuckets": {"movieIds", "ratings", "timestamps"},
+}
+
+RANGE_OPS = {"$gt", "$gte", "$lt", "$lte"}
+EQUALITY_OPS = {"$eq", "$in"}
+
+# Indexes only on a not-null/exists filter are proposed when it keeps less than this share
+SELECTIVITY_LIMIT = 0.3
+
+
+def collect_pipelines():
+    """(label, collection, pipeline) of every pipeline in pipelines/ and queries.py"""
+    from queries import QueryTasks
+    from query2 import TASKS
+
+    found = []
+    seen = set()
+
+    def add(label, collection_name, pipeline):
+        key = (collection_name, repr(pipeline))
+        if key not in seen:
+            seen.add(key)
+            found.append((label, collection_name, pipeline))
+
+    for name, (pipeline, collection_name, _) in TASKS.items():
+        add(name, collection_name, pipeline() if callable(pipeline) else pipeline)
+
+    for module_info in pkgutil.iter_modules(pipelines.__path__):
+        module = importlib.import_module(f"pipelines.{module_info.name}")
+        for attr, value in vars(module).items():
+            if not attr.endswith("_pipeline") or not isinstance(value, list):
+                continue
+            if attr in PIPELINE_COLLECTIONS:
+                add(attr, PIPELINE_COLLECTIONS[attr], value)
+            elif repr(value) not in {key for _, key in seen}:
+                print(f"Skipping {module_info.name}.{attr}: unknown collection (add it to PIPELINE_COLLECTIONS)")
+
+    for attr in sorted(dir(QueryTasks)):
+        if not attr.endswith("_pipeline"):
+            continue
+        builder = getattr(QueryTasks, attr)
+        if inspect.signature(builder).parameters and attr not in PIPELINE_ARGS:
+            print(f"Skipping QueryTasks.{attr}: takes parameters (add representative ones to PIPELINE_ARGS)")
+            continue
+        collection_name, pipeline = builder(**PIPELINE_ARGS.get(attr, {}))
+        add(attr[:-len("_pipeline")], collection_name, pipeline)
+    return found
+
+
+def leading_stages(pipeline):
+    """The merged leading $match filter and the $sort that follows it (or None)"""
+    match, sort = {}, None
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match" and sort is None:
+            match.update(spec)
+        elif name == "$sort":
+            sort = spec
+            break
+        elif name == "$project" and all(v in (0, 1, True, False) for v in spec.values()):
+            continue
+        else:
+            break
+    return match, sort
+
+
+def is_multikey(collection_name, field):
+    arrays = ARRAY_FIELDS.get(collection_name, set())
+    parts = field.split(".")
+    return any(".".join(parts[:i]) in arrays for i in range(1, len(parts) + 1))
+
+
+def _array_root(collection_name, field):
+    parts = field.split(".")
+    for i in range(1, len(parts) + 1):
+        if ".".join(parts[:i]) in ARRAY_FIELDS.get(collection_name, set()):
+            return ".".join(parts[:i])
+    return None
+
+
+def _proposal(collection_name, keys, options, label, reason, selective=None):
+    # selective: filter whose selectivity decides if the index is worth it (see advise)
+    return {
+        "collection": collection_name,
+        "keys": keys,
+        "options": options,
+        "multikey": any(is_multikey(collection_name, f) for f, _ in keys),
+        "sources": [label],
+        "reason": reason,
+        "selective": selective,
+    }
+
+
+def _split_arrays(collection_name, keys):
+    # A compound index can hold one array, keys of other arrays are dropped from the end
+    roots, kept = set(), []
+    for field, direction in keys:
+        root = _array_root(collection_name, field)
+        if root is not None and roots and root not in roots:
+            continue
+        if root is not None:
+            roots.add(root)
+        kept.append((field, direction))
+    return kept
+
+
+def analyze(label, collection_name, pipeline):
+    """Index proposals for one pipeline"""
+    proposals = []
+    for stage in pipeline:
+        lookup = stage.get("$lookup")
+        if isinstance(lookup, dict) and "foreignField" in lookup:
+            proposals.append(_proposal(lookup["from"], [(lookup["foreignField"], 1)], {}, label,
+                                       f"$lookup foreignField from {collection_name}"))
+
+    match, sort = leading_stages(pipeline)
+    if "$text" in match:
+        return proposals  # the text index answers the $match, other indexes are not combined with it
+    equality, ranges, in_ranges, exists = [], {}, [], []
+    for field, cond in match.items():
+        if field == "$or":
+            # every clause needs an index of its own for the $or to use indexes
+            for clause in cond:
+                for f, c in clause.items():
+                    if not f.startswith("$") and (not isinstance(c, dict) or set(c) <= EQUALITY_OPS):
+                        proposals.append(_proposal(collection_name, [(f, 1)], {}, label, "$or clause"))
+            continue
+        if field.startswith("$") or any(part.isdigit() for part in field.split(".")):
+            continue  # $text/$expr and positional paths
+        if isinstance(cond, dict) and "$in" in cond and len(cond["$in"]) > 1 and sort:
+            # several $in values in front of a sort are a range for the index (ESR), the
+            # server merges one index scan per value; one value is an equality
+            in_ranges.append(field)
+        elif not isinstance(cond, dict) or set(cond) <= EQUALITY_OPS:
+            equality.append(field)
+        elif set(cond) <= RANGE_OPS:
+            ranges[field] = cond
+        elif cond in ({"$ne": None}, {"$exists": True}):
+            exists.append(field)
+
+    sort_keys = [(f, d) for f, d in (sort or {}).items() if isinstance(d, int)]
+    if sort_keys and ranges and sort_keys[0][0] not in ranges:
+        # Constant range filter + sort on other fields: partial index on the sort keys
+        keys = [(f, 1) for f in equality] + sort_keys
+        options = {"partialFilterExpression": dict(ranges)}
+        proposals.append(_proposal(collection_name, _split_arrays(collection_name, keys), options, label,
+                                   "range filter in front of a sort"))
+    elif equality or sort_keys or ranges or in_ranges:
+        keys = [(f, 1) for f in equality] + sort_keys
+        keys += [(f, 1) for f in list(ranges) + in_ranges if f not in dict(keys)]
+        proposals.append(_proposal(collection_name, _split_arrays(collection_name, keys), {}, label,
+                                   "leading $match/$sort"))
+    elif exists:
+        proposals.append(_proposal(collection_name, [(exists[0], 1)], {}, label,
+                                   "not-null filter", selective=match))
+    return proposals
+
+
+def merge_proposals(proposals):
+    merged = {}
+    for p in proposals:
+        key = (p["collection"], tuple(p["keys"]), repr(p["options"]))
+        if key in merged:
+            merged[key]["sources"] = sorted(set(merged[key]["sources"]) | set(p["sources"]))
+        else:
+            merged[key] = dict(p)
+    return list(merged.values())
+
+
+def _existing(db, collection_name):
+    """(keys, partialFilterExpression) of the indexes that exist or that clean.py creates"""
+    specs = []
+    for spec in COLLECTION_INDEXES.get(collection_name, []):
+        keys, options = spec if isinstance(spec, tuple) else (spec, {})
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        specs.append((keys, options.get("partialFilterExpression")))
+    if db is not None:
+        for info in db[collection_name].index_information().values():
+            specs.append((list(info["key"]), info.get("partialFilterExpression")))
+    return specs
+
+
+def is_covered(proposal, existing):
+    """True if an index with these keys as prefix (and the same partial filter) exists"""
+    keys = proposal["keys"]
+    partial = proposal["options"].get("partialFilterExpression")
+    for other_keys, other_partial in existing:
+        same_filter = other_partial == partial
+        if same_filter and [tuple(k) for k in other_keys[:len(keys)]] == [tuple(k) for k in keys]:
+            return True
+        # two indexes with the same keys but other options cannot both exist
+        if [tuple(k) for k in other_keys] == [tuple(k) for k in keys]:
+            return True
+    return False
+
+
+def advise(db=None):
+    """
+    Proposals for all pipelines that are not covered by an existing index.
+    With db, not-null filters are only kept when they are selective enough.
+    """
+    proposals = []
+    for label, collection_name, pipeline in collect_pipelines():
+        proposals.extend(analyze(label, collection_name, pipeline))
+
+    advice = []
+    for p in merge_proposals(proposals):
+        if is_covered(p, _existing(db, p["collection"])):
+            continue
+        selective = p.pop("selective")
+        if selective is not None:
+            if db is None:
+                p["reason"] += " (selectivity unknown)"
+            else:
+                total = db[p["collection"]].estimated_document_count()
+                share = db[p["collection"]].count_documents(selective) / total if total else 1.0
+                if share > SELECTIVITY_LIMIT:
+                    continue
+                p["reason"] += f" (keeps {share:.0%})"
+        advice.append(p)
+    return advice
+
+
+def index_kind(p):
+    kinds = []
+    if len(p["keys"]) > 1:
+        kinds.append("compound")
+    if "partialFilterExpression" in p["options"]:
+        kinds.append("partial")
+    if p["multikey"]:
+        kinds.append("multikey")
+    return ", ".join(kinds) or "single"
+
+
+def build_indexes(db, advice, max_concurrency=4):
+    """
+    Create the proposed indexes, one createIndexes command per collection, collections
+    in parallel. Sets p["name"] (or p["error"]) on every proposal.
+    """
+    by_collection = {}
+    for p in advice:
+        by_collection.setdefault(p["collection"], []).append(p)
+
+    def create(collection_name, items):
+        models = [IndexModel(p["keys"], **p["options"]) for p in items]
+        return db[collection_name].create_indexes(models)
+
+    results, _ = run_tasks([(name, lambda name=name, items=items: create(name, items))
+                            for name, items in by_collection.items()], max_concurrency)
+    for r in results:
+        for i, p in enumerate(by_collection[r["name"]]):
+            if r["error"] is not None:
+                p["error"] = r["error"]
+            else:
+                p["name"] = r["result"][i]
+    return advice
+
+
+def verify_indexes(db, advice):
+    """Explain every source pipeline of a built index and record which ones use it"""
+    from profiling import PipelineProfiler, summarize_explain
+
+    profiler = PipelineProfiler(db)
+    pipelines_by_label = {label: (c, p) for label, c, p in collect_pipelines()}
+    for p in advice:
+        p["used_by"] = []
+        if "name" not in p:
+            continue
+        for label in p["sources"]:
+            collection_name, pipeline = pipelines_by_label[label]
+            if collection_name != p["collection"]:
+                continue  # $lookup indexes are used inside the join, not by the outer plan
+            stages = summarize_explain(profiler.explain(collection_name, pipeline))
+            if any(p["name"] in (s.get("indexesUsed") or []) for s in stages):
+                p["used_by"].append(label)
+    return advice
+
+
+def print_advice(advice):
+    if not advice:
+        print("No new indexes proposed, the pipelines are covered by the existing indexes")
+        return
+    for p in advice:
+        keys = ", ".join(f"{f}: {d}" for f, d in p["keys"])
+        print(f"\n{p['collection']} {{{keys}}}  [{index_kind(p)}]")
+        if "partialFilterExpression" in p["options"]:
+            print(f"  partial filter: {p['options']['partialFilterExpression']}")
+        print(f"  for {', '.join(p['sources'])}: {p['reason']}")
+        if "error" in p:
+            print(f"  build failed: {p['error']}")
+        elif "used_by" in p:
+            unused = sorted(set(p["sources"]) - set(p["used_by"]))
+            print(f"  built as {p['name']}, used by: {', '.join(p['used_by']) or '-'}"
+                  + (f", not used by: {', '.join(unused)}" if unused else ""))
+
+
+def main(build=False):
+    """
+    Print the proposed indexes for the current database.
+    build=True also creates them and checks with explain that the pipelines use them.
+    """
+    from DbConnector import DbConnector
+
+    connection = DbConnector()
+    try:
+        db = connection.db
+        advice = advise(db)
+        if build and advice:
+            build_indexes(db, advice)
+            verify_indexes(db, advice)
+        print_advice(advice)
+    except PyMongoError as e:
+        print(f"Mongo error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main(build="--build" in sys.argv)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import uuid
+from datetime import datetime, timezone
+
+# Source CSVs read by MoviePipeline
+SOURCE_FILES = {
+    "movies_metadata": "movies/movies_metadata.csv",
+    "links": "movies/links.csv",
+    "credits": "movies/credits.csv",
+    "ratings": "movies/ratings.csv",
+    "keywords": "movies/keywords.csv",
+}
+
+# Which source files every collection is computed from
+COLLECTION_SOURCES = {
+    "Movie": ["movies_metadata", "links", "keywords"],
+    "Terms": ["movies_metadata", "links", "keywords"],
+    "Credits": ["credits", "movies_metadata"],
+    "Ratings": ["ratings"],
+    "RatingBuckets": ["ratings"],
+    "Users": ["movies_metadata", "links", "ratings"],
+    "UserStats": ["movies_metadata", "links", "ratings"],
+    "People": ["movies_metadata", "credits"],
+}
+
+# Version of the document shape of a collection (default 1). Bump it when the cleaning code
+# adds or changes fields, so collections loaded by older code are rebuilt even though
+# their source files did not change.
+SCHEMA_VERSIONS = {
+    "Movie": 2,  # countryCodes, companyIds (query9)
+    "Ratings": 2,  # timestamps parsed as epoch seconds
+    "RatingBuckets": 2,
+    "Terms": 1,
+}
+
+# Collection holding the fingerprints of the last successful load of each collection
+STATE_COLLECTION = "_ingest_state"
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """
+    Fingerprint of a source file: size plus sha256 of the content.
+    Returns None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return f"{os.path.getsize(path)}:{digest.hexdigest()}"
+
+
+def source_fingerprints():
+    return {name: file_fingerprint(path) for name, path in SOURCE_FILES.items()}
+
+
+def collection_fingerprints(collection_name, fingerprints):
+    return {source: fingerprints[source] for source in COLLECTION_SOURCES[collection_name]}
+
+
+def schema_version(collection_name):
+    return SCHEMA_VERSIONS.get(collection_name, 1)
+
+
+def changed_collections(db, fingerprints, force=False):
+    """
+    Collections whose sources or schema version changed since their last load, or that
+    do not exist. Loads written before schema versions were stored count as version 1.
+    """
+    existing = set(db.list_collection_names())
+    changed = []
+    for name in COLLECTION_SOURCES:
+        state = db[STATE_COLLECTION].find_one({"_id": name})
+        current = collection_fingerprints(name, fingerprints)
+        if force or name not in existing or state is None or state.get("sources") != current \
+                or state.get("schema", 1) != schema_version(name):
+            changed.append(name)
+    return changed
+
+
+def save_fingerprints(db, collection_name, fingerprints):
+    db[STATE_COLLECTION].replace_one(
+        {"_id": collection_name},
+        {
+            "_id": collection_name,
+            "sources": collection_fingerprints(collection_name, fingerprints),
+            "schema": schema_version(collection_name),
+            "loadedAt": datetime.now(timezone.utc),
+            # Data-version stamp, changes on every load (used by ResultCache)
+            "version": uuid.uuid4().hex,
+        },
+        upsert=True,
+    )
+
+
+def bump_version(db, collection_name):
+    """
+    New data-version stamp after a collection was updated in place, so ResultCache
+    entries that read it are not reused. The source fingerprints are kept.
+    """
+    db[STATE_COLLECTION].update_one(
+        {"_id": collection_name},
+        {"$set": {"version": uuid.uuid4().hex, "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def record_batch(db, collection_name, batch_id):
+    """
+    Remember that an incremental batch was applied to a collection. Returns False if it
+    was already recorded. A full reload (save_fingerprints) forgets the batches.
+    """
+    result = db[STATE_COLLECTION].update_one(
+        {"_id": collection_name}, {"$addToSet": {"appliedBatches": batch_id}}, upsert=True
+    )
+    return result.modified_count > 0 or result.upserted_id is not None
+
+
+def batch_applied(db, collection_name, batch_id):
+    return db[STATE_COLLECTION].count_documents({"_id": collection_name, "appliedBatches": batch_id}, limit=1) > 0
+
+
+def data_version(db, collection_name):
+    """
+    Version stamp written by the last load of a collection, or None if it was not
+    loaded by MoviePipeline.
+    """
+    state = db[STATE_COLLECTION].find_one({"_id": collection_name}, {"version": 1})
+    return state.get("version") if state else None
@@ -0,0 +1,108 @@
+import ast
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+_decoder = json.JSONDecoder()
+
+# Any letter left in the structure after removing None/True/False (e/E belong to numbers)
+_UNKNOWN_NAME = re.compile(r"[A-DF-Za-df-z_]")
+
+# A single- or double-quoted string without escapes, split() puts them at the odd positions
+_STRING = re.compile(r"""('[^'\\\n]*'|"[^"\\\n]*")""")
+
+
+def _to_json(s):
+    """
+    Rewrite a literal without backslashes (escape sequences) to JSON, or return None.
+
+    Strings of both quote styles are tokenized first, so only the structure in between
+    gets its constants rewritten. Double-quoted strings are JSON already, single-quoted
+    ones get double quotes (a double quote inside them is escaped).
+    """
+    if "\\" in s or "\x00" in s:
+        return None
+    parts = _STRING.split(s)
+
+    structure = "\x00".join(parts[0::2])
+    if "'" in structure or '"' in structure:
+        return None  # a quote that does not close on the same line
+    if _UNKNOWN_NAME.search(structure.replace("None", "").replace("True", "").replace("False", "")):
+        return None
+    structure = structure.replace("None", "null").replace("True", "true").replace("False", "false")
+
+    parts[0::2] = structure.split("\x00")
+    parts[1::2] = ['"' + p[1:-1].replace('"', '\\"') + '"' if p[0] == "'" else p for p in parts[1::2]]
+    return "".join(parts)
+
+
+def fast_literal_eval(s):
+    """
+    Parse a Python literal made of lists, dicts, strings, numbers, None, True and False.
+
+    Literals whose strings have no escape sequences are rewritten to JSON and parsed with
+    the json C parser. Everything else (escapes, tuples, ...) and anything json rejects
+    is handed to ast.literal_eval, so the result and the exceptions raised are
+    the same as ast.literal_eval.
+    """
+    if isinstance(s, str):
+        text = _to_json(s)
+        if text is not None:
+            try:
+                return _decoder.decode(text)
+            except ValueError:
+                pass
+    return ast.literal_eval(s)
+
+
+def parse_json_list(x):
+    if pd.isna(x) or x == "":
+        return []
+    try:
+        return fast_literal_eval(x)
+    except(ValueError, SyntaxError):
+        return []
+
+
+def parse_json_obj(x):
+    if pd.isna(x) or x == "":
+        return None
+    try:
+        v = fast_literal_eval(x)
+        return v if isinstance(v, dict) else None
+    except (ValueError, SyntaxError):
+        return None
+
+
+_PARSERS = {"list": parse_json_list, "obj": parse_json_obj}
+
+
+def _parse_chunk(args):
+    kind, values = args
+    parse = _PARSERS[kind]
+    return [parse(v) for v in values]
+
+
+def parse_column(series, kind="list", workers=None, chunk_size=5000):
+    """
+    Parse a column of literal strings, spreading chunks of it over a process pool.
+
+    kind is "list" (same output as parse_json_list) or "obj" (same as parse_json_obj).
+    Small columns and workers=1 are parsed in this process.
+    """
+    values = series.tolist()
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(values) <= chunk_size:
+        parsed = _parse_chunk((kind, values))
+    else:
+        chunks = [(kind, values[i:i + chunk_size]) for i in range(0, len(values), chunk_size)]
+        parsed = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_parse_chunk, chunks):
+                parsed.extend(part)
+
+    return pd.Series(parsed, index=series.index, name=series.name, dtype=object)
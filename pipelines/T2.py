@@ -1,7 +1,11 @@
 t2_pipeline = [
+    # Keep only credits with a movie (summary embedded at ingest)
+    {"$match": {"movie": {"$ne": None}}},
+
     # Select columns and values
     {"$project": {
         "tmdbId": 1,
+        "vote": "$movie.vote_average",
         "cast": {
             "$map": {
                 "input": {"$ifNull": ["$cast", []]},
@@ -16,16 +20,4 @@ t2_pipeline = [
 
     # Keep only movies with < 2 cast members
     {"$match": {"$expr": {"$gte": [{"$size": "$cast"}, 2]}}},
-
-    # Join Movie data
-    {"$lookup": {
-        "from": "Movie",
-        "localField": "tmdbId",
-        "foreignField": "tmdbId",
-        "pipeline": [{"$project": {"_id": 0, "vote_average": 1}}],
-        "as": "m"
-    }},
-    {"$unwind": "$m"},
-    {"$set": {"vote": "$m.vote_average"}},
-    {"$unset": "m"},
 ]
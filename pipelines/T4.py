@@ -1,84 +1,77 @@
-t4_pipeline = [
-  # Keep only movies that belong to a collection
-  {"$match": {"belongs_to_collection.name": {"$ne": None}}},
+from pipelines.stats import percentile_fields
 
-  # Normalize documents
-  {"$addFields": {
-    "_collectionId": "$belongs_to_collection.id",
-    "_collectionName": "$belongs_to_collection.name",
-    "_revenue": {"$ifNull": ["$revenue", 0]},
-    "_vote": {
-      "$cond": [
-        {"$and": [
-          {"$ne": ["$vote_average", None]},
-          {"$ne": ["$vote_average", float("nan")]}
-        ]},
-        "$vote_average",
-        None
-      ]
-    },
-    "_date": {
-      "$cond": [
-        {"$eq": [{"$type": "$release_date"}, "date"]},
-        "$release_date",
-        {"$toDate": "$release_date"}
-      ]
-    }
-  }},
 
-  # Group per collection
-  # Compute movie count and total revenue, list vote average per movie, and find earliest and latest release date
-  {"$group": {
-    "_id": {"id": "$_collectionId", "name": "$_collectionName"},
-    "movie_count": {"$sum": 1},
-    "total_revenue": {"$sum": "$_revenue"},
-    "votes": {"$push": {"$cond": [{"$ne": ["$_vote", None]}, "$_vote", "$$REMOVE"]}},
-    "earliest_release_date": {"$min": "$_date"},
-    "latest_release_date": {"$max": "$_date"}
-  }},
+def build_t4_pipeline(median_mode="exact", server_version=None):
+  """
+  T4 pipeline, the median vote average is computed in the $group by pipelines.stats.
+  median_mode "exact" matches the median of the sorted votes, "approximate" uses the
+  server's streaming estimate. server_version (e.g. (8, 0)) picks the native accumulator
+  when the server has it, None keeps the $push + $sortArray form that works everywhere.
+  """
+  median_fields, after_median = percentile_fields(
+    "median_vote_average", "$_vote", mode=median_mode, server_version=server_version)
 
-  # Only keep collections with more than 3 movies
-  {"$match": {"movie_count": {"$gte": 3}}},
+  return [
+    # Keep only movies that belong to a collection
+    {"$match": {"belongs_to_collection.name": {"$ne": None}}},
 
-  # Find the median vote average
-  {"$set": {"votes_sorted": {"$sortArray": {"input": "$votes", "sortBy": 1}}}},
-  {"$set": {
-    "median_vote_average": {
-      "$let": {
-        "vars": {"n": {"$size": "$votes_sorted"}},
-        "in": {
-          "$cond": [
-            {"$eq": ["$$n", 0]},
-            None,
-            {
-              "$cond": [
-                {"$eq": [{"$mod": ["$$n", 2]}, 1]},  # odd length
-                {"$arrayElemAt": ["$votes_sorted", {"$floor": {"$divide": ["$$n", 2]}}]},
-                {"$avg": [
-                  {"$arrayElemAt": ["$votes_sorted", {"$subtract": [{"$divide": ["$$n", 2]}, 1]}]},
-                  {"$arrayElemAt": ["$votes_sorted", {"$divide": ["$$n", 2]}]}
-                ]}
-              ]
-            }
-          ]
-        }
+    # Normalize documents
+    {"$addFields": {
+      "_collectionId": "$belongs_to_collection.id",
+      "_collectionName": "$belongs_to_collection.name",
+      "_revenue": {"$ifNull": ["$revenue", 0]},
+      "_vote": {
+        "$cond": [
+          {"$and": [
+            {"$ne": ["$vote_average", None]},
+            {"$ne": ["$vote_average", float("nan")]}
+          ]},
+          "$vote_average",
+          None
+        ]
+      },
+      "_date": {
+        "$cond": [
+          {"$eq": [{"$type": "$release_date"}, "date"]},
+          "$release_date",
+          {"$toDate": "$release_date"}
+        ]
       }
-    }
-  }},
+    }},
 
-  # Final shape
-  {"$project": {
-    "_id": 0,
-    "collection_id": "$_id.id",
-    "collection_name": "$_id.name",
-    "movie_count": 1,
-    "total_revenue": 1,
-    "median_vote_average": 1,
-    "earliest_release_date": 1,
-    "latest_release_date": 1
-  }},
+    # Group per collection
+    # Compute movie count and total revenue, median vote average, and find earliest and latest release date
+    {"$group": {
+      "_id": {"id": "$_collectionId", "name": "$_collectionName"},
+      "movie_count": {"$sum": 1},
+      "total_revenue": {"$sum": "$_revenue"},
+      **median_fields,
+      "earliest_release_date": {"$min": "$_date"},
+      "latest_release_date": {"$max": "$_date"}
+    }},
 
-  # Return top-10 by total revenue
-  {"$sort": {"total_revenue": -1}},
-  {"$limit": 10}
-]
+    # Only keep collections with more than 3 movies
+    {"$match": {"movie_count": {"$gte": 3}}},
+    *after_median,
+
+    # Final shape
+    {"$project": {
+      "_id": 0,
+      "collection_id": "$_id.id",
+      "collection_name": "$_id.name",
+      "movie_count": 1,
+      "total_revenue": 1,
+      "median_vote_average": 1,
+      "earliest_release_date": 1,
+      "latest_release_date": 1
+    }},
+
+    # Return top-10 by total revenue
+    {"$sort": {"total_revenue": -1}},
+    {"$limit": 10}
+  ]
+
+
+# Portable form (server version unknown): $push + $sortArray. QueryPipeline.task_pipeline
+# builds T4 for the connected server instead.
+t4_pipeline = build_t4_pipeline()
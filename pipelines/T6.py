@@ -2,9 +2,10 @@ t6_pipeline = [
     # Keep only docs that has non-empty cast array
     {"$match": {"cast": {"$type": "array", "$ne": []}}},
 
-    # Select columns (movie id and top-5 billed cast genders)
+    # Select columns (movie id, release year and top-5 billed cast genders)
     {"$project": {
         "tmdbId": 1,
+        "year": "$movie.year",
         "castTop5": {
             "$filter": {
                 "input": {
@@ -46,42 +47,11 @@ t6_pipeline = [
     }},
     {"$match": {"femaleProp": {"$ne": None}}},
 
-    # Join with Movie to get release year per movie
-    {"$lookup": {
-        "from": "Movie",
-        "localField": "tmdbId",
-        "foreignField": "tmdbId",
-        "pipeline": [
-            {"$project": {
-                "_id": 0,
-                "_rd": {
-                    "$cond": [
-                        {"$eq": [{"$type": "$release_date"}, "date"]},
-                        "$release_date",
-                        {"$convert": {"input": "$release_date", "to": "date", "onError": None, "onNull": None}}
-                    ]
-                },
-                "releaseYear": 1
-            }},
-            {"$project": {
-                "year": {
-                    "$cond": [
-                        {"$ne": ["$_rd", None]},
-                        {"$year": "$_rd"},
-                        "$releaseYear"
-                    ]
-                }
-            }}
-        ],
-        "as": "m"
-    }},
-    {"$unwind": "$m"},
-
-    # Ensure year is numeric
-    {"$match": {"m.year": {"$type": "number"}}},
+    # Ensure year is numeric (movie summary embedded at ingest)
+    {"$match": {"year": {"$type": "number"}}},
 
     # Compute decade bucket
-    {"$set": {"decade": {"$subtract": ["$m.year", {"$mod": ["$m.year", 10]}]}}},
+    {"$set": {"decade": {"$subtract": ["$year", {"$mod": ["$year", 10]}]}}},
 
     # Aggregate by decade
     {"$group": {
@@ -1,16 +1,5 @@
 t8_pipeline = [
-    # Join with Movie
-    {
-        "$lookup": {
-            "from": "Movie",
-            "localField": "tmdbId",
-            "foreignField": "tmdbId",
-            "as": "movie"
-        }
-    },
-    {"$unwind": "$movie"},
-
-    # Keep only movies with sufficient votes
+    # Keep only movies with sufficient votes (movie summary embedded at ingest)
     {"$match": {"movie.vote_count": {"$gte": 100}}},
 
     # Select columns and build a director/actor array
@@ -102,3 +91,28 @@ t8_pipeline = [
         }
     }
 ]
+
+# Same result read from the People collection built at ingest
+t8_people_pipeline = [
+    # Only directors with at least one pair (multikey index on collaborations.meanVote)
+    {"$match": {"collaborations.meanVote": {"$exists": True}}},
+    {"$project": {"_id": 0, "personId": 1, "collaborations": 1}},
+    {"$unwind": "$collaborations"},
+
+    # Sort by highest mean vote_average and limit to top-20
+    {"$sort": {"collaborations.meanVote": -1}},
+    {"$limit": 20},
+
+    # Final shape
+    {
+        "$project": {
+            "directorId": "$personId",
+            "director": "$collaborations.director",
+            "actorId": "$collaborations.actorId",
+            "actor": "$collaborations.actor",
+            "filmCount": "$collaborations.filmCount",
+            "meanVote": {"$round": ["$collaborations.meanVote", 2]},
+            "meanRevenue": {"$round": ["$collaborations.meanRevenue", 0]}
+        }
+    }
+]
@@ -0,0 +1,78 @@
+# Percentile/median accumulators for $group stages.
+#
+# percentile_fields returns the fields to put in a $group and the stages to run after it.
+#   - "approximate": $median/$percentile with method "approximate" (MongoDB 7.0+). This is
+#                    the only mode whose group memory does not grow with group size.
+#   - "exact":       method "continuous" (MongoDB 8.0+), which interpolates between the
+#                    two middle values like the median in T4. The server still keeps every
+#                    value of the group, but no array is materialized in the documents.
+#                    Older or unknown servers (server_version=None) fall back to
+#                    $push + $sortArray + indexing, which holds every value as well.
+#
+# benchmarks/percentiles.py checks the fallback against the old T4 median and numpy
+# without a server.
+
+# First server version with the "continuous" (exact) percentile method
+EXACT_PERCENTILE_VERSION = (8, 0)
+
+
+def _sorted_array_percentile(values, p):
+    # Linear interpolation between the closest ranks (same as the "continuous" method)
+    n = {"$size": values}
+    rank = {"$multiply": [p, {"$subtract": [n, 1]}]}
+    lower = {"$floor": rank}
+    upper = {"$ceil": rank}
+    return {
+        "$cond": [
+            {"$eq": [n, 0]},
+            None,
+            {"$add": [
+                {"$arrayElemAt": [values, {"$toInt": lower}]},
+                {"$multiply": [
+                    {"$subtract": [rank, lower]},
+                    {"$subtract": [
+                        {"$arrayElemAt": [values, {"$toInt": upper}]},
+                        {"$arrayElemAt": [values, {"$toInt": lower}]}
+                    ]}
+                ]}
+            ]}
+        ]
+    }
+
+
+def percentile_fields(name, expr, p=0.5, mode="exact", server_version=None):
+    """
+    Fields for a $group stage computing the p-th percentile of expr into name,
+    and the stages to add right after the $group.
+
+    Values that are null or missing are ignored, as by the $median accumulator.
+
+    Example:
+    fields, after = percentile_fields("median_vote", "$_vote")
+    [{"$group": {"_id": "$k", **fields}}, *after]
+    """
+    if mode == "approximate":
+        if p == 0.5:
+            return {name: {"$median": {"input": expr, "method": "approximate"}}}, []
+        return {name: {"$percentile": {"input": expr, "p": [p], "method": "approximate"}}}, \
+            [{"$set": {name: {"$arrayElemAt": [f"${name}", 0]}}}]
+
+    if mode != "exact":
+        raise ValueError(f"Unknown percentile mode: {mode}")
+
+    if server_version is not None and tuple(server_version) >= EXACT_PERCENTILE_VERSION:
+        if p == 0.5:
+            return {name: {"$median": {"input": expr, "method": "continuous"}}}, []
+        return {name: {"$percentile": {"input": expr, "p": [p], "method": "continuous"}}}, \
+            [{"$set": {name: {"$arrayElemAt": [f"${name}", 0]}}}]
+
+    # Older servers: collect, sort and index
+    values = f"_{name}_values"
+    return (
+        {values: {"$push": {"$cond": [{"$ne": [expr, None]}, expr, "$$REMOVE"]}}},
+        [
+            {"$set": {values: {"$sortArray": {"input": f"${values}", "sortBy": 1}}}},
+            {"$set": {name: _sorted_array_percentile(f"${values}", p)}},
+            {"$unset": values},
+        ],
+    )
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+
+def _plan_stages(plan):
+    """Yield every stage of a query plan tree (inputStage/inputStages/queryPlan)"""
+    if not isinstance(plan, dict):
+        return
+    yield plan
+    for key in ("inputStage", "queryPlan", "winningPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def _indexes(planner):
+    winning = (planner or {}).get("winningPlan", {})
+    names = [s["indexName"] for s in _plan_stages(winning) if s.get("stage") in ("IXSCAN", "EXPRESS_IXSCAN") and "indexName" in s]
+    scans = sum(1 for s in _plan_stages(winning) if s.get("stage") == "COLLSCAN")
+    return sorted(set(names)), scans
+
+
+def _cursor_stage(planner, stats):
+    indexes, collscans = _indexes(planner)
+    stats = stats or {}
+    return {
+        "stage": "$cursor",
+        "nReturned": stats.get("nReturned"),
+        "executionTimeMillisEstimate": stats.get("executionTimeMillis"),
+        "docsExamined": stats.get("totalDocsExamined"),
+        "keysExamined": stats.get("totalKeysExamined"),
+        "indexesUsed": indexes,
+        "collectionScans": collscans,
+        "usedDisk": False,
+    }
+
+
+def summarize_explain(explain):
+    """
+    Turn the output of explain("executionStats") for an aggregate into one record
+    per stage: time, documents examined vs returned, index use and disk spills.
+    """
+    if "stages" not in explain:
+        # The whole pipeline was pushed down into the query layer
+        return [_cursor_stage(explain.get("queryPlanner"), explain.get("executionStats"))]
+
+    stages = []
+    for stage in explain["stages"]:
+        name = next(k for k in stage if k.startswith("$"))
+        if name == "$cursor":
+            cursor = stage["$cursor"]
+            record = _cursor_stage(cursor.get("queryPlanner"), cursor.get("executionStats"))
+            record["executionTimeMillisEstimate"] = stage.get("executionTimeMillisEstimate",
+                                                              record["executionTimeMillisEstimate"])
+        else:
+            record = {
+                "stage": name,
+                "nReturned": stage.get("nReturned"),
+                "executionTimeMillisEstimate": stage.get("executionTimeMillisEstimate"),
+                "docsExamined": stage.get("totalDocsExamined"),
+                "keysExamined": stage.get("totalKeysExamined"),
+                "indexesUsed": sorted(stage.get("indexesUsed", [])),
+                "collectionScans": stage.get("collectionScans", 0),
+                "usedDisk": bool(stage.get("usedDisk") or stage.get("spills")),
+            }
+        stages.append(record)
+    return stages
+
+
+class PipelineProfiler:
+    """
+    Opt-in instrumentation for aggregation pipelines.
+
+    Every profiled pipeline is run once to measure client-side fetch (server + network)
+    and BSON decode time separately, and once with explain("executionStats") for the
+    per-stage numbers. Records are collected in self.records and written as one JSON
+    report per run with save().
+
+    Example:
+    profiler = PipelineProfiler(db)
+    q = QueryTasks()
+    q.profiler = profiler
+    q.query3()
+    profiler.print_report()
+    profiler.save()
+    """
+
+    def __init__(self, db, report_dir="profiles"):
+        self.db = db
+        self.report_dir = report_dir
+        self.records = []
+
+    def explain(self, collection_name, pipeline, allow_disk_use=True):
+        return self.db.command({
+            "explain": {"aggregate": collection_name, "pipeline": pipeline,
+                        "cursor": {}, "allowDiskUse": allow_disk_use},
+            "verbosity": "executionStats",
+        })
+
+    def aggregate(self, collection_name, pipeline, label=None, **kwargs):
+        # Fetch raw BSON so fetching and decoding can be timed separately
+        raw = self.db[collection_name].with_options(
+            codec_options=CodecOptions(document_class=RawBSONDocument))
+        start = time.perf_counter()
+        raw_docs = list(raw.aggregate(pipeline, **kwargs))
+        fetch = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [bson.decode(doc.raw) for doc in raw_docs]
+        decode = time.perf_counter() - start
+
+        stages = summarize_explain(self.explain(collection_name, pipeline, kwargs.get("allowDiskUse", True)))
+        self.records.append({
+            "label": label or collection_name,
+            "collection": collection_name,
+            "documents": len(results),
+            "bytes": sum(len(doc.raw) for doc in raw_docs),
+            "fetchMillis": round(fetch * 1000, 1),
+            "decodeMillis": round(decode * 1000, 1),
+            "docsExamined": sum(s["docsExamined"] or 0 for s in stages),
+            "usedDisk": any(s["usedDisk"] for s in stages),
+            "stages": stages,
+        })
+        return results
+
+    def print_report(self):
+        for r in self.records:
+            print(f"\n=== {r['label']} on {r['collection']} ===")
+            print(f"fetch {r['fetchMillis']} ms, decode {r['decodeMillis']} ms, "
+                  f"{r['documents']} documents ({r['bytes']} bytes), examined {r['docsExamined']}")
+            for s in r["stages"]:
+                indexes = ",".join(s["indexesUsed"]) or ("COLLSCAN" if s["collectionScans"] else "-")
+                print(f"  {s['stage']:<14}{str(s['executionTimeMillisEstimate']):>8} ms"
+                      f"  returned {str(s['nReturned']):>9}  examined {str(s['docsExamined']):>9}"
+                      f"  index {indexes}{'  SPILLED' if s['usedDisk'] else ''}")
+
+    def save(self, path=None):
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = path or os.path.join(self.report_dir, f"profile-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.json")
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=2, default=str)
+        print(f"Saved profile report to {path}")
+        return path
@@ -1,5 +1,11 @@
 
+import sys
 from DbConnector import DbConnector
+from task_runner import run_tasks, print_timings
+from result_cache import ResultCache
+from profiling import PipelineProfiler
+from pipelines.stats import percentile_fields
+from term_index import TERM_COLLECTION, TEXT_FIELDS, search_terms, search_phrase
 from pprint import pprint
 # This file includes the query tasks: 1,3,5,7,9
 
@@ -38,32 +44,69 @@ def print_results(results, order=None, round_floats=2, title=None):
 
         print(ordered)
 
+# Country codes query9 counts as produced in america
+AMERICA = ["US"]
+
+# Terms index lookup of query7 (term_index.search_terms arguments), shared with async_queries
+QUERY7_SEARCH = {"terms": ["noir"], "min_votes": 50, "limit": 20}
+
+
 class QueryTasks:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, cache=None, connection=None):
+        self.connection = connection or DbConnector()
         self.db = self.connection.db
+        # Optional ResultCache, results are reused until a collection is reloaded
+        self.cache = cache
+        # Optional PipelineProfiler, records explain stats and fetch/decode time per pipeline
+        self.profiler = None
 
+    def aggregate(self, collection_name, pipeline, label=None):
+        # label names the pipeline in profile reports, like QueryPipeline.run_pipeline
+        if self.profiler is not None:
+            return self.profiler.aggregate(collection_name, pipeline, label=label or collection_name,
+                                           allowDiskUse=True)
+        if self.cache is not None:
+            return self.cache.aggregate(collection_name, pipeline, allowDiskUse=True)
+        return list(self.db[collection_name].aggregate(pipeline, allowDiskUse=True))
 
 
-    def query1(self):
-        """Top 10 directors with greater than 5 movies by median revenue"""
+
+    @staticmethod
+    def query1_pipeline():
+        """Collection and pipeline of query1"""
         pipeline = [
-                # using unwind to so each job is own document
-                {"$unwind": "$crew"},
+            # uses the partial index on director.medianRevenue
+            {"$match": {"director.movieCount": {"$gt": 5}}},
+            {"$sort": {"director.medianRevenue": -1}},
+            {"$limit": 10},
+            {
+                "$project": {
+                    "_id": 0,
+                    "director": "$name",
+                    "movie_count": "$director.movieCount",
+                    "avg_vote": "$director.avgVote",
+                    "median_revenue": "$director.medianRevenue"
+                }
+            }
+        ]
+        return "People", pipeline
+
+    def query1(self):
+        """Top 10 directors with greater than 5 movies by median revenue, read from People"""
+        return self.aggregate(*self.query1_pipeline(), label="query1")
 
+    @staticmethod
+    def query1_from_credits_pipeline():
+        """Collection and pipeline of query1_from_credits"""
+        pipeline = [
+                # only credits with a director, can use the multikey index on crew.job
                 {"$match": {"crew.job": "Director"}},
 
-                {
-                    "$lookup": {
-                        "from": "Movie",
-                        "localField": "tmdbId",
-                        "foreignField": "tmdbId",
-                        "as": "movie_info"
-                    }
-                },
+                # using unwind to so each job is own document
+                {"$unwind": "$crew"},
 
-                # after joining, we flatten movie_info too
-                {"$unwind": "$movie_info"},
+                # the movie summary is embedded at ingest, so no join with Movie
+                {"$match": {"crew.job": "Director", "movie": {"$ne": None}}},
 
                 {
                     "$group": {
@@ -71,11 +114,11 @@ class QueryTasks:
                         "movie_count": {"$sum": 1},
                         "median_revenue": {
                             "$median": {
-                                "input": "$movie_info.revenue",
+                                "input": "$movie.revenue",
                                 "method": "approximate"
                             }
                         },
-                        "avg_vote": {"$avg": "$movie_info.vote_average"},
+                        "avg_vote": {"$avg": "$movie.vote_average"},
                     }
                 },
 
@@ -94,29 +137,51 @@ class QueryTasks:
                     }
                 }
             ]
-        return list(self.db.Credits.aggregate(pipeline, allowDiskUse=True))
+        return "Credits", pipeline
+
+    def query1_from_credits(self):
+        """Top 10 directors with greater than 5 movies by median revenue"""
+        return self.aggregate(*self.query1_from_credits_pipeline(), label="query1_from_credits")
 
 
 
+    @staticmethod
+    def query3_pipeline():
+        """Collection and pipeline of query3"""
+        pipeline = [
+            # uses the partial index on actor.genreCount, actor.movieCount
+            {"$match": {"actor.movieCount": {"$gt": 10}}},
+            {"$sort": {"actor.genreCount": -1, "actor.movieCount": -1}},
+            {"$limit": 10},
+            {
+                "$project": {
+                    "_id": 0,
+                    "actor": "$name",
+                    "genre_count": "$actor.genreCount",
+                    "movie_count": "$actor.movieCount",
+                    "examples_genre": {"$slice": ["$actor.genres", 5]}
+                }
+            }
+        ]
+        return "People", pipeline
+
     def query3(self):
-        """Top 10 actors with more than 10 movies with widest genre batch"""
+        """Top 10 actors with more than 10 movies with widest genre batch, read from People"""
+        return self.aggregate(*self.query3_pipeline(), label="query3")
+
+    @staticmethod
+    def query3_from_credits_pipeline():
+        """Collection and pipeline of query3_from_credits"""
         pipeline=[
+            # the movie summary (with genre names) is embedded at ingest, so no join with Movie
+            {"$match": {"movie.genres.0": {"$exists": True}}},
             {"$unwind": "$cast"},
-            {
-                "$lookup": {
-                   "from": "Movie",
-                   "localField": "tmdbId",
-                   "foreignField": "tmdbId",
-                   "as": "movie_info"
-                }
-            },
-            {"$unwind": "$movie_info"},
-            {"$unwind": "$movie_info.genres"},
+            {"$unwind": "$movie.genres"},
 
             {
                 "$group": {
                     "_id": "$cast.name",
-                    "genres": {"$addToSet": "$movie_info.genres.name"},
+                    "genres": {"$addToSet": "$movie.genres"},
                     "movies": {"$addToSet": "$tmdbId"}
                 }
             },
@@ -135,10 +200,16 @@ class QueryTasks:
             {"$sort": {"genre_count": -1, "movie_count": -1}},
             {"$limit": 10}
                 ]
-        results = list(self.db.Credits.aggregate(pipeline, allowDiskUse=True))
-        return results
-    def query5(self):
-        """By decade and primary genre (first element in genres), find median runtime and movie count"""
+        return "Credits", pipeline
+
+    def query3_from_credits(self):
+        """Top 10 actors with more than 10 movies with widest genre batch"""
+        return self.aggregate(*self.query3_from_credits_pipeline(), label="query3_from_credits")
+
+    @staticmethod
+    def query5_pipeline():
+        """Collection and pipeline of query5"""
+        median_runtime, _ = percentile_fields("median_runtime", "$runtime", mode="approximate")
         pipeline=[
             {
                 "$match": {
@@ -163,17 +234,11 @@ class QueryTasks:
             {
                 "$group": {
                     "_id": {"decade": "$decade", "genre": "$primary_genre"},
-                    "runtimes": {"$push": "$runtime"},
+                    # streaming accumulator, no per-group array of runtimes
+                    **median_runtime,
                     "movie_count": {"$sum": 1}
                 }
             },
-            {
-                "$set": {
-                    "median_runtime": {
-                        "$median": {"input": "$runtimes", "method": "approximate"}
-                    }
-                }
-            },
             {
                 "$project": {
                     "_id": 0,
@@ -185,15 +250,25 @@ class QueryTasks:
             },
             {"$sort": {"decade": 1, "median_runtime": -1}},
         ]
-        return list(self.db.Movie.aggregate(pipeline, allowDiskUse=True))
-    def query7(self):
-        """Top 20 neo-noir or noir movies by vote_average (have to have more than 50 votes)"""
+        return "Movie", pipeline
 
-        pipeline=[
+    def query5(self):
+        """By decade and primary genre (first element in genres), find median runtime and movie count"""
+        return self.aggregate(*self.query5_pipeline(), label="query5")
+
+    @staticmethod
+    def query7_pipeline(tmdb_ids=None):
+        """Collection and pipeline of query7, on the tmdbIds found in the Terms index or with $text if None"""
+        if tmdb_ids is None:
             # use text search from mongodb (remember to check if indexes exists before running this)
-            {"$match": {"$text": {"$search": "noir"}}},
-            {"$match": {"vote_count": {"$gte": 50}}},
+            match = [
+                {"$match": {"$text": {"$search": "noir"}}},
+                {"$match": {"vote_count": {"$gte": 50}}},
+            ]
+        else:
+            match = [{"$match": {"tmdbId": {"$in": list(tmdb_ids)}}}]
 
+        pipeline= match + [
             {"$addFields": {"year": {"$year": "$release_date"}}},
             {"$sort": {"vote_average": -1, "vote_count": -1}},
 
@@ -209,19 +284,26 @@ class QueryTasks:
                 }
             }
         ]
-        return list(self.db.Movie.aggregate(pipeline, allowDiskUse=True))
+        return "Movie", pipeline
 
-    def query9(self):
+    def query7(self):
+        """Top 20 neo-noir or noir movies by vote_average (have to have more than 50 votes)"""
+        # "noir" postings are stored best ranked first, so the top 20 ids are read without scanning the
+        # text index; only the titles come from Movie. Without a Terms collection use $text instead.
+        tmdb_ids = None
+        if self.db[TERM_COLLECTION].estimated_document_count():
+            tmdb_ids = search_terms(self.db, **QUERY7_SEARCH)
+        return self.aggregate(*self.query7_pipeline(tmdb_ids), label="query7")
+
+    @staticmethod
+    def query9_pipeline():
+        """Collection and pipeline of query9"""
         pipeline=[
             {
+                # one multikey lookup on the normalized country codes (countries and companies named after them)
                 "$match": {
+                    "countryCodes": {"$in": AMERICA},
                     "original_language": {"$ne": "en"},
-                    "$or": [
-                        {"production_companies.name": "United States"},
-                        {"production_companies.name": "United States of America"},
-                        {"production_countries.name": "United States"},
-                        {"production_countries.name": "United States of America"}
-                    ]
                 }
             },
 
@@ -247,46 +329,117 @@ class QueryTasks:
             }
         ]
 
-        return list(self.db.Movie.aggregate(pipeline, allowDiskUse=True))
+        return "Movie", pipeline
+
+    def query9(self):
+        """Top 10 original languages of non-English movies produced by an american company or in america"""
+        return self.aggregate(*self.query9_pipeline(), label="query9")
+
+    @staticmethod
+    def movies_by_production_pipeline(country=None, company=None, limit=20):
+        """Collection and pipeline of movies_by_production"""
+        match = {}
+        if country is not None:
+            codes = [country] if isinstance(country, str) else list(country)
+            match["countryCodes"] = {"$in": [c.strip().upper() for c in codes]}
+        if company is not None:
+            match["companyIds"] = {"$in": [company] if isinstance(company, int) else list(company)}
+        pipeline = [
+            # uses the multikey indexes countryCodes/companyIds + vote_count
+            {"$match": match},
+            {"$sort": {"vote_count": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "tmdbId": 1, "title": 1, "release_date": 1,
+                          "vote_average": 1, "vote_count": 1, "countryCodes": 1, "companyIds": 1}},
+        ]
+        return "Movie", pipeline
+
+    def movies_by_production(self, country=None, company=None, limit=20):
+        """
+        Most voted movies produced in a country and/or by a company.
+        country is an ISO 3166-1 code (or a list of them), company a company id (or a list).
+
+        Example:
+        q.movies_by_production(country="FR", limit=10)
+        q.movies_by_production(company=[6194, 33])
+        """
+        return self.aggregate(*self.movies_by_production_pipeline(country, company, limit),
+                              label="movies_by_production")
+
+    @staticmethod
+    def search_movies_pipeline(tmdb_ids=()):
+        """Collection and pipeline of search_movies"""
+        pipeline = [
+            {"$match": {"tmdbId": {"$in": list(tmdb_ids)}}},
+            # same order as the posting lists
+            {"$sort": {"vote_average": -1, "vote_count": -1}},
+            {"$project": {"_id": 0, "tmdbId": 1, "title": 1, "release_date": 1,
+                          "vote_average": 1, "vote_count": 1}},
+        ]
+        return "Movie", pipeline
+
+    def search_movies(self, query, phrase=False, fields=TEXT_FIELDS, min_votes=None, limit=20):
+        """
+        Best ranked movies (vote_average, then vote_count) containing every word of query,
+        looked up in the Terms index. phrase=True needs the words next to each other.
+        fields are term_index field bits, e.g. term_index.GENRES searches the genre names.
+        Words only match up to plural folding (term_index.stem), this is not $text stemming.
+
+        Example:
+        q.search_movies("heist", min_votes=100)
+        q.search_movies("film noir", phrase=True)
+        q.search_movies("science fiction", fields=term_index.GENRES)
+        """
+        if phrase:
+            tmdb_ids = search_phrase(self.db, query, fields=fields, min_votes=min_votes, limit=limit)
+        else:
+            tmdb_ids = search_terms(self.db, query.split(), fields=fields, min_votes=min_votes, limit=limit)
+        return self.aggregate(*self.search_movies_pipeline(tmdb_ids), label="search_movies")
 
 
 
 
 
-def main():
+# Print settings per task: (order, title)
+REPORTS = {
+    "query1": (["director", "movie_count", "avg_vote", "median_revenue"],
+               "Top 10 directors with more than 5 movies with highest median revenue"),
+    "query3": (["actor", "genre_count", "movie_count", "examples_genre"],
+               "Top 10 actors with more than 10 movies with widest genre"),
+    "query5": (["decade", "primary_genre", "median_runtime", "movie_count"],
+               "Top genre and median runtime of movies summarized by decade"),
+    "query7": (["title", "year", "vote_average", "vote_count"],
+               "Top 20 movies with neo-noir or noir in overview or tag, sorted by vote avg."),
+    "query9": (["original_language", "count", "example_title"],
+               "Top 10 Non-English movies that are produced by american company or in america"),
+}
+
+
+def main(tasks=None, max_concurrency=5, use_cache=True, profile=False):
+    """Run the chosen query tasks concurrently on one client and print them in the usual order"""
     q = QueryTasks()
-    q1 = q.query1()
-    print_results(
-        q1,
-        order=["director", "movie_count", "avg_vote", "median_revenue"],
-        title="Top 10 directors with more than 5 movies with highest median revenue"
-    )
-    del q1
-    q3 = q.query3()
-    print_results(
-        q3,
-        order=["actor", "genre_count", "movie_count", "examples_genre"],
-        title="Top 10 actors with more than 10 movies with widest genre"
-    )
-    del q3
-    q5 = q.query5()
-    print_results(
-        q5,
-        order=["decade", "primary_genre", "median_runtime", "movie_count"],
-        title="Top genre and median runtime of movies summarized by decade"
-    )
-    del q5
-    q7 = q.query7()
-    print_results(
-        q7,
-        order=["title", "year", "vote_average", "vote_count"],
-        title="Top 20 movies with neo-noir or noir in overview or tag, sorted by vote avg."
-    )
-    q9 = q.query9()
-    print_results(
-        q9,
-        order=["original_language", "count", "example_title"],
-        title="Top 10 Non-English movies that are produced by american company or in america"
-    )
+    if use_cache:
+        q.cache = ResultCache(q.db)
+    if profile:
+        q.profiler = PipelineProfiler(q.db)
+    names = tasks or list(REPORTS)
+    try:
+        results, wall = run_tasks([(name, getattr(q, name)) for name in names], max_concurrency)
+        for r in results:
+            order, title = REPORTS[r["name"]]
+            if r["error"] is not None:
+                print(f"\n{title}\nERROR: {r['error']}")
+                continue
+            print_results(r["result"], order=order, title=title)
+        print_timings(results, wall)
+        if q.profiler is not None:
+            q.profiler.print_report()
+            q.profiler.save()
+    finally:
+        q.connection.close_connection()
+    if any(r["error"] is not None for r in results):
+        sys.exit(1)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,89 +1,82 @@
 import sys
 from pprint import PrettyPrinter
-from itertools import combinations
-from operator import itemgetter
 from pipelines.T2 import t2_pipeline
-from pipelines.T4 import t4_pipeline
+from pipelines.T4 import build_t4_pipeline
 from pipelines.T6 import t6_pipeline
-from pipelines.T8 import t8_pipeline
+from pipelines.T8 import t8_people_pipeline
 from pipelines.T10 import t10A_pipeline, t10B_pipeline
 
 from DbConnector import DbConnector
+from coappearance import CoAppearanceCounter
+from task_runner import run_tasks, print_timings
+from result_cache import ResultCache
+from profiling import PipelineProfiler
 from pymongo.errors import PyMongoError
 
 # This file includes the query tasks: 2,4,6,8,10
 
 class QueryPipeline:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, cache=None, connection=None):
+        self.connection = connection or DbConnector()
         self.client = self.connection.client   # MongoClient
         self.db = self.connection.db           # Database
+        self.cache = cache                     # Optional ResultCache
+        self.profiler = None                   # Optional PipelineProfiler
+        self._server_version = None
 
-    def calculate_t2(self, cursor):
-        final_aggregator = {}
+    def server_version(self):
+        # (major, minor) of the server, picks native accumulators in pipelines that have them
+        if self._server_version is None:
+            self._server_version = tuple(self.client.server_info()["versionArray"][:2])
+        return self._server_version
+
+    def calculate_t2(self, cursor, mode="two-pass"):
         minimum = 3  # Minimum co-appearances
         limit = 10   # Result limit
 
-        for movie_doc in cursor:
-            vote = movie_doc.get('vote', 0.0)
-            cast = movie_doc.get('cast', [])
-
-            # Generate all unique, unordered pairs
-            for actor_a, actor_b in combinations(cast, 2):
-
-                #  Normalize the pair by ID
-                id_a, name_a = actor_a['id'], actor_a['name']
-                id_b, name_b = actor_b['id'], actor_b['name']
-
-                # Ensure the smaller ID always comes first
-                if id_a <= id_b:
-                    aid, bid = id_a, id_b
-                    name1, name2 = name_a, name_b
-                else:
-                    aid, bid = id_b, id_a
-                    name1, name2 = name_b, name_a
-
-                key = f"{aid}-{bid}"
-
-                # 3. Aggregate
-                if key not in final_aggregator:
-                    final_aggregator[key] = {
-                        'count': 1,
-                        'sum_vote': vote,
-                        'names': (name1, name2)
-                    }
-                else:
-                    final_aggregator[key]['count'] += 1
-                    final_aggregator[key]['sum_vote'] += vote
-
-        # Final Filtering, Calculation, and Sorting
-        final_results = []
-
-        for pair_data in final_aggregator.values():
-            count = pair_data['count']
-
-            # Filter: Only pairs with minimum 3 co-appearances
-            if count >= minimum:
-                sum_vote = pair_data['sum_vote']
-
-                # Calculate Average:
-                avg_vote = round(sum_vote / count, 2)
-
-                final_results.append({
-                    'actor1': pair_data['names'][0],
-                    'actor2': pair_data['names'][1],
-                    'co_appearances': count,
-                    'avg_vote': avg_vote
-                })
-
-        # Sort by number of co-appearances and average vote
-        final_results.sort(key=itemgetter('co_appearances', 'avg_vote'), reverse=True)
-
-        # Return the final results as an iterable list
-        return final_results[:limit]
+        # Pairs are counted with packed integer keys in numpy arrays, top-10 from a heap
+        counter = CoAppearanceCounter().add_cursor(cursor)
+        return counter.top_pairs(minimum=minimum, limit=limit, mode=mode)
+
+    def run_t2(self, pipeline, collection_name, mode="two-pass", label="T2"):
+        """
+        T2 pair counts. With a cache the counts are cached under the pipeline and data
+        versions, not the projection they are counted from (every cast array of Credits).
+        """
+        if self.cache is not None and self.profiler is None:
+            return self.cache.aggregate(
+                collection_name,
+                pipeline,
+                reduce=lambda cursor: self.calculate_t2(cursor, mode),
+                reduce_name=f"calculate_t2:{mode}",
+                allowDiskUse=True,
+                maxTimeMS=120000,
+                batchSize=1000,
+            )
+        return self.calculate_t2(self.run_pipeline(pipeline, collection_name, label=label), mode)
 
     def run_pipeline(self, pipeline, collection_name, *,
-                  allow_disk_use=True, max_time_ms=120000, batch_size=1000):
+                  allow_disk_use=True, max_time_ms=120000, batch_size=1000, label=None):
+        if self.profiler is not None:
+            return self.profiler.aggregate(
+                collection_name,
+                pipeline,
+                label=label,
+                allowDiskUse=allow_disk_use,
+                maxTimeMS=max_time_ms,
+                batchSize=batch_size,
+            )
+
+        if self.cache is not None:
+            # Cached results are a list, which iterates like the cursor
+            return self.cache.aggregate(
+                collection_name,
+                pipeline,
+                allowDiskUse=allow_disk_use,
+                maxTimeMS=max_time_ms,
+                batchSize=batch_size,
+            )
+
         collection = self.db[collection_name]
         cursor = collection.aggregate(
             pipeline,
@@ -93,6 +86,13 @@ class QueryPipeline:
         )
         return cursor
 
+    def task_pipeline(self, name):
+        # (pipeline, collection) of a task in TASKS
+        pipeline, collection_name, _ = TASKS[name]
+        if callable(pipeline):
+            pipeline = pipeline(server_version=self.server_version())
+        return pipeline, collection_name
+
     def print_cursor(self, cursor, *, title=None, limit=None):
         ppr = PrettyPrinter(
             indent=2,
@@ -111,28 +111,48 @@ class QueryPipeline:
             ppr.pprint(doc)
 
 
-def main():
+# Task -> (pipeline, collection, title), a callable pipeline is built for the server version
+TASKS = {
+    "T2": (t2_pipeline, "Credits", "Top 10 actor-pairs with most co-appearances "),
+    "T4": (build_t4_pipeline, "Movie", "Top 10 collections with largest total revenue"),
+    "T6": (t6_pipeline, "Credits", "Decades ranked by largest proportion of female cast"),
+    "T8": (t8_people_pipeline, "People", "Top 20 director-actor pairs with highest mean average votes"),
+    "T10A": (t10A_pipeline, "Users", "Top 10 most genre-diverse users"),
+    "T10B": (t10B_pipeline, "Users", "Top 10 highest-variance users"),
+}
+
+
+def main(tasks=None, max_concurrency=6, use_cache=True, profile=False):
     qp = None
     try:
         qp = QueryPipeline()
-        cursor = qp.run_pipeline(t2_pipeline, "Credits")
-        cursor = qp.calculate_t2(cursor)
-        qp.print_cursor(cursor, title="Top 10 actor-pairs with most co-appearances ")
-
-        cursor = qp.run_pipeline(t4_pipeline, "Movie")
-        qp.print_cursor(cursor, title="Top 10 collections with largest total revenue")
-
-        cursor = qp.run_pipeline(t6_pipeline, "Credits")
-        qp.print_cursor(cursor, title="Decades ranked by largest proportion of female cast")
-
-        cursor = qp.run_pipeline(t8_pipeline, "Credits")
-        qp.print_cursor(cursor, title="Top 20 director-actor pairs with highest mean average votes")
-
-        cursor = qp.run_pipeline(t10A_pipeline, "Users")
-        qp.print_cursor(cursor, title="Top 10 most genre-diverse users")
-
-        cursor = qp.run_pipeline(t10B_pipeline, "Users")
-        qp.print_cursor(cursor, title="Top 10 highest-variance users")
+        if use_cache:
+            qp.cache = ResultCache(qp.db)
+        if profile:
+            qp.profiler = PipelineProfiler(qp.db)
+        names = tasks or list(TASKS)
+
+        def task(name):
+            pipeline, collection_name = qp.task_pipeline(name)
+            if name == "T2":
+                return qp.run_t2(pipeline, collection_name)
+            return list(qp.run_pipeline(pipeline, collection_name, label=name))
+
+        results, wall = run_tasks([(name, lambda name=name: task(name)) for name in names], max_concurrency)
+        for r in results:
+            title = TASKS[r["name"]][2]
+            if r["error"] is not None:
+                print(f"\n=== {title} ===\nERROR: {r['error']}", file=sys.stderr)
+                continue
+            qp.print_cursor(r["result"], title=title)
+        print_timings(results, wall)
+        if qp.profiler is not None:
+            qp.profiler.print_report()
+            qp.profiler.save()
+
+        # Any failed task fails the run, like an uncaught exception did before
+        if any(r["error"] is not None for r in results):
+            sys.exit(1)
 
     except PyMongoError as e:
         print(f"Mongo error: {e}", file=sys.stderr)
@@ -141,8 +161,8 @@ def main():
         print(f"Unexpected error: {e}", file=sys.stderr)
         sys.exit(1)
     finally:
-        if qp is not None and qp.client is not None:
-            qp.client.close()
+        if qp is not None:
+            qp.connection.close_connection()
 
 
 if __name__ == "__main__":
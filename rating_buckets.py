@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# Collection holding the bucketed layout of Ratings
+BUCKET_COLLECTION = "RatingBuckets"
+
+# Ratings are stored as rating * 2 in one byte (0.5 -> 1, 5.0 -> 10)
+_RATING_SCALE = 2
+
+
+def build_buckets(df_ratings, window="Y", max_per_bucket=1000):
+    """
+    Pack ratings into one document per userId and time window (a pandas period
+    frequency, "Y" by default), split further so no bucket has more than
+    max_per_bucket ratings.
+
+    Each bucket stores the ratings as packed little-endian arrays:
+    movieIds (int32), ratings (uint8, rating * 2) and timestamps (int64 ns).
+    """
+    df = df_ratings[["userId", "movieId", "rating", "timestamp"]].copy()
+    # Raw ratings.csv timestamps are epoch seconds, cleaned ones are datetimes already
+    unit = "s" if pd.api.types.is_numeric_dtype(df["timestamp"]) else None
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit=unit)
+    df = df.dropna(subset=["timestamp"])
+    df["window"] = df["timestamp"].dt.to_period(window).dt.start_time
+    df = df.sort_values(["userId", "window", "timestamp"], kind="stable").reset_index(drop=True)
+    df["part"] = df.groupby(["userId", "window"]).cumcount() // max_per_bucket
+
+    keys = df[["userId", "window", "part"]]
+    new_bucket = (keys != keys.shift()).any(axis=1).to_numpy()
+    starts = np.flatnonzero(new_bucket)
+    ends = np.append(starts[1:], len(df))
+
+    movie_ids = df["movieId"].to_numpy(dtype="<i4")
+    ratings = np.rint(df["rating"].to_numpy() * _RATING_SCALE).astype("u1")
+    timestamps = df["timestamp"].to_numpy().astype("datetime64[ns]").view("<i8")
+    user_ids = df["userId"].to_numpy()
+
+    return pd.DataFrame({
+        "userId": user_ids[starts].astype("int64"),
+        "start": df["timestamp"].iloc[starts].to_numpy(),
+        "end": df["timestamp"].iloc[ends - 1].to_numpy(),
+        "count": (ends - starts).astype("int64"),
+        "movieIds": [movie_ids[a:b].tobytes() for a, b in zip(starts, ends)],
+        "ratings": [ratings[a:b].tobytes() for a, b in zip(starts, ends)],
+        "timestamps": [timestamps[a:b].tobytes() for a, b in zip(starts, ends)],
+    })
+
+
+def unpack_bucket(doc):
+    """The packed arrays of one bucket as numpy arrays (movieIds, ratings, timestamps)"""
+    return (
+        np.frombuffer(doc["movieIds"], dtype="<i4"),
+        np.frombuffer(doc["ratings"], dtype="u1") / _RATING_SCALE,
+        np.frombuffer(doc["timestamps"], dtype="<i8").astype("datetime64[ns]"),
+    )
+
+
+def iter_ratings(db, user_id=None, start=None, end=None):
+    """
+    Yield the individual ratings in the bucketed layout as dicts shaped like the
+    documents in Ratings, optionally for one user and/or a time range.
+    """
+    query = {}
+    if user_id is not None:
+        query["userId"] = user_id
+    if start is not None:
+        query["end"] = {"$gte": start}
+    if end is not None:
+        query["start"] = {"$lte": end}
+
+    for doc in db[BUCKET_COLLECTION].find(query, {"_id": 0}).sort([("userId", 1), ("start", 1)]):
+        movie_ids, ratings, timestamps = unpack_bucket(doc)
+        for movie_id, rating, timestamp in zip(movie_ids.tolist(), ratings.tolist(), timestamps):
+            timestamp = pd.Timestamp(timestamp)
+            if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                continue
+            yield {"userId": doc["userId"], "movieId": movie_id, "rating": rating, "timestamp": timestamp}
+
+
+def user_rating_stats(db):
+    """
+    Per-user count, mean and sample variance of the ratings, computed by scanning
+    the buckets (one document per user and window instead of one per rating).
+    """
+    totals = {}
+    for doc in db[BUCKET_COLLECTION].find({}, {"_id": 0, "userId": 1, "ratings": 1}):
+        ratings = np.frombuffer(doc["ratings"], dtype="u1").astype(np.int64)
+        # Sums of the scaled integer ratings are exact
+        count, total, squares = totals.get(doc["userId"], (0, 0, 0))
+        totals[doc["userId"]] = (count + len(ratings), total + int(ratings.sum()), squares + int((ratings ** 2).sum()))
+
+    rows = []
+    for user_id, (count, total, squares) in totals.items():
+        mean = total / count / _RATING_SCALE
+        variance = ((squares - total * total / count) / (count - 1) / _RATING_SCALE ** 2) if count > 1 else float("nan")
+        rows.append((user_id, count, mean, variance))
+    return pd.DataFrame(rows, columns=["userId", "ratingCount", "ratingMean", "ratingVariance"])
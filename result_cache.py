@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from ingest_state import data_version
+
+
+def referenced_collections(collection_name, pipeline):
+    """
+    The collection a pipeline runs on plus every collection it reads with $lookup,
+    $graphLookup or $unionWith (also inside sub-pipelines).
+    """
+    names = {collection_name}
+
+    def walk(value):
+        if isinstance(value, dict):
+            for key, v in value.items():
+                if key in ("$lookup", "$graphLookup") and isinstance(v, dict) and "from" in v:
+                    names.add(v["from"])
+                elif key == "$unionWith":
+                    names.add(v if isinstance(v, str) else v.get("coll"))
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+
+    walk(pipeline)
+    names.discard(None)
+    return sorted(names)
+
+
+def pipeline_hash(collection_name, pipeline):
+    canonical = json.dumps([collection_name, pipeline], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache (in-memory LRU and on-disk) for aggregation results.
+
+    The key is a hash of the pipeline, the collection and the data-version stamps
+    that MoviePipeline writes when it loads a collection, so reloading any collection
+    the pipeline reads makes its old results unreachable. Pipelines over collections
+    without a stamp are never cached. The disk tier evicts the least recently used
+    results above disk_max_bytes.
+
+    Example:
+    cache = ResultCache(db)
+    results = cache.aggregate("Movie", t4_pipeline, allowDiskUse=True)
+    """
+
+    def __init__(self, db, cache_dir=".result_cache", memory_entries=64, disk_max_bytes=512 * 1024 ** 2):
+        self.db = db
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, collection_name, pipeline, reduce_name=None):
+        versions = {}
+        for name in referenced_collections(collection_name, pipeline):
+            version = data_version(self.db, name)
+            if version is None:
+                return None
+            versions[name] = version
+        digest = hashlib.sha256(pipeline_hash(collection_name, pipeline).encode())
+        digest.update(json.dumps(versions, sort_keys=True).encode())
+        if reduce_name is not None:
+            digest.update(f"reduce={reduce_name}".encode())
+        return digest.hexdigest()
+
+    def aggregate(self, collection_name, pipeline, reduce=None, reduce_name=None, **kwargs):
+        """
+        Results of a pipeline, from the cache when the collections it reads are unchanged.
+
+        With reduce (a function of the cursor, named by reduce_name in the key) only its
+        output is cached, e.g. the T2 pair counts instead of every Credits cast array.
+        """
+        key = self.key(collection_name, pipeline, reduce_name if reduce is not None else None)
+        compute = reduce or list
+        if key is None:
+            return compute(self.db[collection_name].aggregate(pipeline, **kwargs))
+
+        results = self.get(key)
+        if results is not None:
+            self.hits += 1
+            return results
+
+        self.misses += 1
+        results = compute(self.db[collection_name].aggregate(pipeline, **kwargs))
+        self.put(key, results)
+        return results
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            with open(path, "rb") as f:
+                results = pickle.load(f)
+            self._remember(key, results)
+            return results
+        return None
+
+    def put(self, key, results):
+        self._remember(key, results)
+        tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def _remember(self, key, results):
+        with self._lock:
+            self._memory[key] = results
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # evicted by another thread
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_tasks(tasks, max_concurrency=4):
+    """
+    Run independent tasks concurrently and return their results in the given order.
+
+    tasks is a list of (name, callable) pairs. The callables should share one
+    MongoClient (it is thread-safe and pools its connections), so running them on
+    threads overlaps the time spent waiting on the server.
+
+    Returns (results, wall_seconds) where results is a list of dicts with
+    name, result, seconds and error (None if the task succeeded).
+    """
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            result, error = fn(), None
+        except Exception as e:
+            result, error = None, e
+        return {"name": name, "result": result, "seconds": time.perf_counter() - start, "error": error}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = [pool.submit(timed, name, fn) for name, fn in tasks]
+        results = [f.result() for f in futures]
+    return results, time.perf_counter() - start
+
+
+def print_timings(results, wall_seconds):
+    print("\nTask timings")
+    for r in results:
+        status = "ok" if r["error"] is None else f"failed: {r['error']}"
+        print(f"  {r['name']:<10}{r['seconds']:>8.2f}s  {status}")
+    total = sum(r["seconds"] for r in results)
+    print(f"  {'wall':<10}{wall_seconds:>8.2f}s  (sum of tasks {total:.2f}s)")
@@ -0,0 +1,214 @@
+import re
+import unicodedata
+from contextlib import aclosing
+
+import numpy as np
+import pandas as pd
+
+# Collection holding the inverted term index of Movie
+TERM_COLLECTION = "Terms"
+
+# Field bits of a posting: which fields of the movie contain the term
+OVERVIEW, TAGLINE, KEYWORDS, GENRES = 1, 2, 4, 8
+TEXT_FIELDS = OVERVIEW | TAGLINE | KEYWORDS
+
+# Words too common to be worth a posting list
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "he", "her", "his",
+    "in", "into", "is", "it", "its", "of", "on", "or", "she", "that", "the", "their", "they", "this",
+    "to", "was", "who", "will", "with",
+}
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def stem(word):
+    # Plural folding only ("noirs" -> "noir"). This is enough for query7, but unlike the English
+    # stemming of $text other inflections stay separate terms ("heists" = "heist", "running" != "run")
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Normalized terms of a text in order (NFKC, lower case), stopwords removed"""
+    if not isinstance(text, str):
+        return []
+    words = _WORD.findall(unicodedata.normalize("NFKC", text).lower())
+    return [stem(w) for w in words if w not in STOPWORDS]
+
+
+def _join(values):
+    return " ".join(v for v in values if isinstance(v, str)) if isinstance(values, list) else ""
+
+
+def build_term_index(df_movies, max_per_bucket=50000):
+    """
+    Inverted index of Movie: one posting list per term (split into parts of at most
+    max_per_bucket postings) from the tokenized overview/tagline, the normalized
+    keywords and the genre names.
+
+    Postings are stored in ranking order (vote_average, then vote_count, descending),
+    so the best matches of a term come first and a search can stop early. Each part
+    stores packed little-endian arrays: tmdbIds (int32), fields (uint8, field bits) and
+    voteCounts (int32, -1 if unknown).
+    """
+    movies = df_movies.drop_duplicates(subset="tmdbId", keep="first")
+    movies = movies.sort_values(["vote_average", "vote_count"], ascending=False, na_position="last", kind="stable")
+    keywords = movies["keywords"] if "keywords" in movies else pd.Series([[]] * len(movies), index=movies.index)
+
+    terms, ranks, bits = [], [], []
+    for rank, (overview, tagline, movie_keywords, genres) in enumerate(
+            zip(movies["overview"], movies["tagline"], keywords, movies["genres"])):
+        for field, text in ((OVERVIEW, overview), (TAGLINE, tagline), (KEYWORDS, _join(movie_keywords)),
+                            (GENRES, _join([g.get("name") for g in genres if isinstance(g, dict)]
+                                           if isinstance(genres, list) else None))):
+            for term in set(tokenize(text)):
+                terms.append(term)
+                ranks.append(rank)
+                bits.append(field)
+
+    postings = pd.DataFrame({"term": terms, "rank": np.asarray(ranks, dtype=np.int64), "bit": np.asarray(bits, dtype=np.uint8)})
+    # Field bits are distinct powers of two, so the sum per (term, movie) is their OR
+    postings = postings.groupby(["term", "rank"], sort=True)["bit"].sum().reset_index()
+    postings["part"] = postings.groupby("term").cumcount() // max_per_bucket
+
+    keys = postings[["term", "part"]]
+    starts = np.flatnonzero((keys != keys.shift()).any(axis=1).to_numpy())
+    ends = np.append(starts[1:], len(postings))
+
+    ranked_ids = movies["tmdbId"].to_numpy(dtype="<i4")
+    vote_counts = pd.to_numeric(movies["vote_count"], errors="coerce").fillna(-1).to_numpy().astype("<i4")
+    rank = postings["rank"].to_numpy()
+    tmdb_ids = ranked_ids[rank]
+    counts = vote_counts[rank]
+    fields = postings["bit"].to_numpy(dtype="u1")
+
+    return pd.DataFrame({
+        "term": postings["term"].to_numpy()[starts],
+        "part": postings["part"].to_numpy()[starts].astype("int64"),
+        "count": (ends - starts).astype("int64"),
+        "tmdbIds": [tmdb_ids[a:b].tobytes() for a, b in zip(starts, ends)],
+        "fields": [fields[a:b].tobytes() for a, b in zip(starts, ends)],
+        "voteCounts": [counts[a:b].tobytes() for a, b in zip(starts, ends)],
+    })
+
+
+def unpack_postings(doc):
+    """The packed arrays of one posting list part (tmdbIds, fields, voteCounts)"""
+    return (
+        np.frombuffer(doc["tmdbIds"], dtype="<i4"),
+        np.frombuffer(doc["fields"], dtype="u1"),
+        np.frombuffer(doc["voteCounts"], dtype="<i4"),
+    )
+
+
+def _matching_ids(doc, fields, min_votes):
+    tmdb_ids, field_bits, vote_counts = unpack_postings(doc)
+    keep = (field_bits & fields) != 0
+    if min_votes is not None:
+        keep &= vote_counts >= min_votes
+    return tmdb_ids[keep]
+
+
+def _query_terms(terms):
+    return list(dict.fromkeys(t for term in terms for t in tokenize(term)))
+
+
+def _intersect(found, tmdb_ids, others, limit):
+    # Adds the ids of one part of the first term that every other term has, True when limit is reached
+    for other in others:
+        tmdb_ids = tmdb_ids[np.isin(tmdb_ids, other)]
+    found.extend(tmdb_ids.tolist())
+    return limit is not None and len(found) >= limit
+
+
+def _concat(parts):
+    return np.concatenate(parts) if parts else np.empty(0, dtype="<i4")
+
+
+def iter_postings(db, term, fields=TEXT_FIELDS, min_votes=None):
+    """Yield the tmdbIds of one term in ranking order, part by part"""
+    for doc in db[TERM_COLLECTION].find({"term": term}, {"_id": 0, "term": 0}).sort("part", 1):
+        yield _matching_ids(doc, fields, min_votes)
+
+
+def search_terms(db, terms, fields=TEXT_FIELDS, min_votes=None, limit=None):
+    """
+    tmdbIds of the movies that contain every term in one of the given fields, best
+    ranked first (vote_average, then vote_count). A single term stops reading its
+    posting list as soon as limit movies are found.
+    """
+    terms = _query_terms(terms)
+    if not terms:
+        return []
+
+    found = []
+    others = [_concat(list(iter_postings(db, t, fields, min_votes))) for t in terms[1:]]
+    for tmdb_ids in iter_postings(db, terms[0], fields, min_votes):
+        if _intersect(found, tmdb_ids, others, limit):
+            return found[:limit]
+    return found
+
+
+async def iter_postings_async(db, term, fields=TEXT_FIELDS, min_votes=None):
+    """iter_postings on an AsyncMongoClient database"""
+    async for doc in db[TERM_COLLECTION].find({"term": term}, {"_id": 0, "term": 0}).sort("part", 1):
+        yield _matching_ids(doc, fields, min_votes)
+
+
+async def search_terms_async(db, terms, fields=TEXT_FIELDS, min_votes=None, limit=None):
+    """search_terms on an AsyncMongoClient database"""
+    terms = _query_terms(terms)
+    if not terms:
+        return []
+
+    found = []
+    others = [_concat([ids async for ids in iter_postings_async(db, t, fields, min_votes)]) for t in terms[1:]]
+    # aclosing closes the cursor when the search stops early
+    async with aclosing(iter_postings_async(db, terms[0], fields, min_votes)) as parts:
+        async for tmdb_ids in parts:
+            if _intersect(found, tmdb_ids, others, limit):
+                return found[:limit]
+    return found
+
+
+def _contains(tokens, phrase):
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+def search_phrase(db, phrase, fields=TEXT_FIELDS, min_votes=None, limit=20, batch_size=200):
+    """
+    tmdbIds of the movies that contain the phrase (its terms next to each other) in one
+    of the given fields, best ranked first. Candidates come from the posting lists and
+    only they are checked against the Movie text, in batches, until limit are found.
+    """
+    phrase_terms = tokenize(phrase)
+    candidates = search_terms(db, phrase_terms, fields, min_votes)
+    if len(phrase_terms) < 2:
+        return candidates[:limit]
+
+    found = []
+    for i in range(0, len(candidates), batch_size):
+        batch = candidates[i:i + batch_size]
+        texts = {}
+        for doc in db["Movie"].find({"tmdbId": {"$in": batch}},
+                                    {"_id": 0, "tmdbId": 1, "overview": 1, "tagline": 1, "keywords": 1}):
+            texts.setdefault(doc["tmdbId"], doc)
+        for tmdb_id in batch:
+            doc = texts.get(tmdb_id, {})
+            field_texts = []
+            if fields & OVERVIEW:
+                field_texts.append(doc.get("overview"))
+            if fields & TAGLINE:
+                field_texts.append(doc.get("tagline"))
+            if fields & KEYWORDS:
+                # every keyword on its own, a phrase does not span two keywords
+                keywords = doc.get("keywords")
+                field_texts.extend(keywords if isinstance(keywords, list) else [])
+            if any(_contains(tokenize(text), phrase_terms) for text in field_texts):
+                found.append(tmdb_id)
+                if len(found) >= limit:
+                    return found
+    return found
@@ -0,0 +1,156 @@
+import math
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from ingest_state import batch_applied, bump_version, record_batch
+
+# Users only holds users with at least this many ratings (see MoviePipeline.build_user_stats)
+MIN_RATINGS = 20
+
+
+def merge_state(a, b):
+    """
+    Merge two (count, mean, m2) states (Chan et al. parallel variance).
+    """
+    count = a["count"] + b["count"]
+    if count == 0:
+        return {"count": 0, "mean": 0.0, "m2": 0.0}
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * b["count"] / count,
+        "m2": a["m2"] + b["m2"] + delta * delta * a["count"] * b["count"] / count,
+    }
+
+
+def users_document(state):
+    """The Users fields for one user state, rounded like build_user_stats"""
+    count = state["count"]
+    variance = state["m2"] / (count - 1) if count > 1 else float("nan")
+    return {
+        "userId": state["userId"],
+        "ratingCount": count,
+        "ratingMean": round(state["mean"], 2),
+        "ratingVariance": round(variance, 3),
+        "distinctGenres": len(state["genres"]),
+    }
+
+
+class UserStatsUpdater:
+    """
+    Applies batches of new ratings to UserStats and Users without a full recompute.
+
+    UserStats holds mergeable statistics per user (count, mean, M2 and the set of
+    genre names), loaded by clean.main together with Users. A batch only reads and
+    writes the users and movies that occur in it.
+
+    Example:
+    updater = UserStatsUpdater(db)
+    updater.apply_ratings(df_new_ratings)
+    updater.verify(program.build_user_state(df_movies, df_all_ratings))
+    """
+
+    def __init__(self, db, insert_ratings=True):
+        self.db = db
+        # Also insert the new ratings into the Ratings collection
+        self.insert_ratings = insert_ratings
+
+    def movie_genres(self, movie_ids):
+        cursor = self.db.Movie.find({"movieId": {"$in": movie_ids}}, {"_id": 0, "movieId": 1, "genres.name": 1})
+        return {doc["movieId"]: [g["name"] for g in doc.get("genres", []) if g.get("name") is not None]
+                for doc in cursor}
+
+    def batch_states(self, df_ratings):
+        """Per-user state of the new ratings only"""
+        df_ratings = df_ratings[["userId", "movieId", "rating"]]
+        genres = self.movie_genres([int(m) for m in df_ratings["movieId"].unique()])
+
+        grouped = df_ratings.groupby("userId")
+        stats = grouped["rating"].agg(["count", "mean", "var"])
+        movies = grouped["movieId"].agg(lambda s: set(s.tolist()))
+
+        states = {}
+        for user_id, row in stats.iterrows():
+            count = int(row["count"])
+            states[int(user_id)] = {
+                "count": count,
+                "mean": float(row["mean"]),
+                "m2": float(row["var"]) * (count - 1) if count > 1 else 0.0,
+                "genres": {g for movie_id in movies[user_id] for g in genres.get(movie_id, [])},
+            }
+        return states
+
+    @staticmethod
+    def batch_id(df_ratings):
+        """Content hash of a batch, the same ratings give the same id"""
+        columns = [c for c in ["userId", "movieId", "rating", "timestamp"] if c in df_ratings]
+        hashes = pd.util.hash_pandas_object(df_ratings[columns], index=False)
+        return f"{len(df_ratings)}:{int(hashes.sum()) & 0xFFFFFFFFFFFFFFFF:016x}"
+
+    def apply_ratings(self, df_ratings, batch_id=None):
+        """
+        Merge a batch of new (already cleaned) ratings into UserStats and Users.
+        Merging is not idempotent, so every batch is recorded in the ingest state under
+        batch_id (default: a hash of its ratings) and a batch that was applied before is
+        skipped. Returns the number of users updated.
+        """
+        if df_ratings.empty:
+            return 0
+        batch_id = batch_id or self.batch_id(df_ratings)
+        if batch_applied(self.db, "UserStats", batch_id):
+            print(f"Batch {batch_id} was already applied, skipping it")
+            return 0
+        batch = self.batch_states(df_ratings)
+
+        existing = {doc["userId"]: doc for doc in self.db.UserStats.find({"userId": {"$in": list(batch)}})}
+
+        state_ops, user_ops = [], []
+        for user_id, new in batch.items():
+            old = existing.get(user_id, {"count": 0, "mean": 0.0, "m2": 0.0, "genres": []})
+            merged = merge_state(old, new)
+            merged["userId"] = user_id
+            merged["genres"] = sorted(set(old["genres"]) | new["genres"])
+
+            state_ops.append(UpdateOne({"userId": user_id}, {"$set": merged}, upsert=True))
+            # Counts only grow, so users below the minimum are not in Users yet
+            if merged["count"] >= MIN_RATINGS:
+                user_ops.append(UpdateOne({"userId": user_id}, {"$set": users_document(merged)}, upsert=True))
+
+        if self.insert_ratings:
+            self.db.Ratings.insert_many(df_ratings.to_dict("records"), ordered=False)
+        self.db.UserStats.bulk_write(state_ops, ordered=False)
+        if user_ops:
+            self.db.Users.bulk_write(user_ops, ordered=False)
+        record_batch(self.db, "UserStats", batch_id)
+
+        # New version stamps, so cached results (T10A/T10B) are recomputed
+        for name in ["UserStats", "Users"] + (["Ratings"] if self.insert_ratings else []):
+            bump_version(self.db, name)
+        print(f"Updated statistics of {len(batch)} users from {len(df_ratings)} ratings")
+        return len(batch)
+
+    def verify(self, df_state_full, rel_tol=1e-9):
+        """
+        Compare UserStats with a full recompute (the output of
+        MoviePipeline.build_user_state over all ratings). Returns the mismatching userIds.
+        """
+        full = {int(row.userId): row for row in df_state_full.itertuples(index=False)}
+        mismatches = []
+        seen = set()
+        for doc in self.db.UserStats.find({}, {"_id": 0}):
+            user_id = doc["userId"]
+            seen.add(user_id)
+            expected = full.get(user_id)
+            if (
+                expected is None
+                or doc["count"] != expected.count
+                or set(doc["genres"]) != set(expected.genres)
+                or not math.isclose(doc["mean"], expected.mean, rel_tol=rel_tol)
+                or not math.isclose(doc["m2"], expected.m2, rel_tol=rel_tol, abs_tol=rel_tol)
+            ):
+                mismatches.append(user_id)
+
+        mismatches.extend(u for u in full if u not in seen)
+        print(f"Verified {len(seen)} users against a full recompute: {len(mismatches)} mismatches")
+        return mismatches